@@ -4,32 +4,45 @@ FastAPI Backend for Anti-Defacement Dashboard with Authentication
 استفاده: uvicorn api:app --reload --host 0.0.0.0 --port 8000
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
 from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import base64
+import csv
+import io
 import json
 import os
 from pathlib import Path
 import asyncio
 import logging
+from anyio import to_thread
+from starlette.concurrency import run_in_threadpool
 
 # Import authentication module
 from auth import (
     User, UserCreate, UserLogin, Token,
-    authenticate_user, create_access_token,
+    authenticate_user_async, create_access_token,
     get_current_active_user, init_auth_database,
     require_admin, require_operator, require_viewer,
-    create_user
+    create_user, set_user_disabled, update_user_role,
+    ROLES, UserRoleUpdate, UserStatusUpdate
 )
 
 # Import database module
 from database import (
-    get_db_manager, get_db,
-    Server, Activity, Backup, Setting
+    get_db_manager, get_db, event_created_at,
+    Server, Activity, ActivityRollup, Backup, Setting
 )
 
+# Rollup-backed activity counts
+from rollups import RESTORED, activity_totals, activity_totals_by_server
+from cache import ALERT_SETTINGS, DASHBOARD_STATS, GENERAL_SETTINGS, SERVERS, get_response_cache
+
 # Import WebSocket manager
 from websocket_manager import get_connection_manager
 
@@ -37,13 +50,10 @@ from websocket_manager import get_connection_manager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import modules from your existing project
-try:
-    from permission_monitoring import PermissionMonitor, SSHConfig as PermSSHConfig, MonitorConfig as PermMonitorConfig
-    from ssh import FileOperationsMonitor, SSHConfig as FileSSHConfig, MonitorConfig as FileMonitorConfig
-    from red import RedisConfig
-except ImportError as e:
-    print(f"Warning: Could not import some modules: {e}")
+# The monitoring modules (paramiko, ssh, permission_monitoring, red) are not
+# imported here: the API never runs monitors. live imports red when
+# REDIS_ENABLED is set, and cache imports the redis client only when
+# API_CACHE_REDIS_URL is set.
 
 app = FastAPI(title="Anti-Defacement API", version="1.0.0")
 
@@ -53,6 +63,9 @@ db_manager = get_db_manager()
 # Initialize authentication database
 init_auth_database()
 
+# Read-through cache for the polled dashboard/settings endpoints
+response_cache = get_response_cache()
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -60,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # ==================== Models ====================
@@ -113,22 +127,90 @@ class ServerModeUpdate(BaseModel):
 # ==================== Helper Functions ====================
 
 def count_activity_records(db, server_id: int = None, time_filter: float = None) -> int:
-    """Count activity records from centralized database"""
+    """Count activity records (served from the rollups, not activity_logs)"""
     try:
-        from sqlalchemy import func
-        query = db.query(func.count(Activity.id))
-        
-        if server_id:
-            query = query.filter(Activity.server_id == server_id)
-        if time_filter:
-            query = query.filter(Activity.timestamp > time_filter)
-        
-        return query.scalar() or 0
+        return sum(activity_totals(db, since=time_filter, server_id=server_id).values())
     except Exception as e:
         logger.error(f"Error counting activity records: {e}")
         return 0
 
+def alert_count(totals: dict) -> int:
+    """Alerts in a ``{series: count}`` rollup total: every change except our own restores"""
+    return sum(count for series, count in totals.items() if series != RESTORED)
+
+MAX_PAGE_SIZE = 500
+
+# Alert severity is derived from the activity type
+SEVERITY_TYPES = {"critical": "permission", "warning": "file"}
+
+
+def encode_cursor(activity) -> str:
+    """Opaque keyset cursor for the row after which the next page starts"""
+    return base64.urlsafe_b64encode(f"{activity.timestamp!r}:{activity.id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, activity_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(timestamp), int(activity_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def filter_activity(query, server_id: int = None, activity_type: str = None, operation: str = None,
+                    path_prefix: str = None, since: float = None, until: float = None):
+    """Apply the activity endpoint filters to an activity_logs query"""
+    if server_id:
+        query = query.filter(Activity.server_id == server_id)
+    if activity_type:
+        query = query.filter(Activity.activity_type == activity_type)
+    if operation:
+        query = query.filter(or_(Activity.operation == operation, Activity.change_type == operation))
+    if path_prefix:
+        query = query.filter(Activity.path.startswith(path_prefix, autoescape=True))
+
+    # created_at is the event time floored to the second for every row (model
+    # default and the activity_logs_created_at trigger); bounding it as well
+    # lets MySQL prune the daily partitions
+    if since is not None:
+        query = query.filter(Activity.timestamp >= since,
+                             Activity.created_at >= event_created_at(since))
+    if until is not None:
+        query = query.filter(Activity.timestamp < until,
+                             Activity.created_at <= event_created_at(until))
+    return query
+
+
+def query_activity(db, limit: int = 50, cursor: Optional[str] = None, **filters):
+    """Keyset-paginated activity_logs query, newest first.
+
+    Pages are ordered on (timestamp, id) and continue strictly after the
+    cursor row, so deep pages cost the same as the first one. Returns
+    ``(rows, next_cursor)``; next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = filter_activity(db.query(Activity), **filters)
+    if cursor:
+        after_ts, after_id = decode_cursor(cursor)
+        query = query.filter(
+            Activity.created_at <= event_created_at(after_ts),
+            or_(Activity.timestamp < after_ts, and_(Activity.timestamp == after_ts, Activity.id < after_id))
+        )
+
+    rows = query.order_by(Activity.timestamp.desc(), Activity.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
 # ==================== API Endpoints ====================
+# Endpoints that touch MySQL or the sqlite user store are plain ``def``:
+# FastAPI runs them in the thread pool, so a slow query never stalls the
+# event loop (and with it every WebSocket). Login stays async and runs
+# bcrypt on auth.py's bounded executor.
 
 @app.get("/")
 async def root():
@@ -144,7 +226,7 @@ async def root():
 @app.post("/api/auth/login", response_model=Token)
 async def login(user_login: UserLogin):
     """Login endpoint - returns JWT token"""
-    user = authenticate_user(user_login.username, user_login.password)
+    user = await authenticate_user_async(user_login.username, user_login.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -170,10 +252,31 @@ async def login(user_login: UserLogin):
     )
 
 @app.post("/api/auth/register", response_model=User, dependencies=[Depends(require_admin)])
-async def register(user_data: UserCreate):
+def register(user_data: UserCreate):
     """Register new user (admin only)"""
     return create_user(user_data)
 
+@app.put("/api/auth/users/{username}/role", dependencies=[Depends(require_admin)])
+def change_user_role(username: str, role_update: UserRoleUpdate):
+    """Change a user's role (admin only)"""
+    if role_update.role not in ROLES:
+        raise HTTPException(status_code=400, detail=f"Role must be one of: {', '.join(ROLES)}")
+    if not update_user_role(username, role_update.role):
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": f"Role of {username} updated to {role_update.role}", "username": username,
+            "role": role_update.role}
+
+@app.put("/api/auth/users/{username}/status")
+def change_user_status(username: str, status_update: UserStatusUpdate,
+                       current_user: User = Depends(require_admin)):
+    """Disable or re-enable a user (admin only)"""
+    if status_update.disabled and username == current_user.username:
+        raise HTTPException(status_code=400, detail="You cannot disable your own account")
+    if not set_user_disabled(username, status_update.disabled):
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": f"User {username} {'disabled' if status_update.disabled else 'enabled'}",
+            "username": username, "disabled": status_update.disabled}
+
 @app.get("/api/auth/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_active_user)):
     """Get current user info"""
@@ -186,69 +289,80 @@ async def logout(current_user: User = Depends(get_current_active_user)):
 
 # ========== Dashboard Endpoints ==========
 
+def load_dashboard_stats(db) -> dict:
+    """Dashboard counters from MySQL"""
+    from sqlalchemy import func
+    
+    # Get total active servers
+    total_servers = db.query(func.count(Server.id)).filter(Server.status == 'active').scalar() or 0
+    
+    # Active monitors = total servers * 3 (perm + file + restore)
+    active_monitors = total_servers * 3 if total_servers > 0 else 0
+    
+    # Alerts and restores since UTC midnight (rollup buckets and sessions are
+    # UTC), from the rollups maintained by the ingester
+    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    totals = activity_totals(db, since=today_start)
+    
+    return {
+        "totalServers": total_servers,
+        "activeMonitors": active_monitors,
+        "alertsToday": alert_count(totals),
+        "restoredFiles": totals.get(RESTORED, 0)
+    }
+
 @app.get("/api/dashboard/stats", dependencies=[Depends(require_viewer)])
-async def get_dashboard_stats(db: Session = Depends(get_db)):
+def get_dashboard_stats(db: Session = Depends(get_db)):
     """Get dashboard statistics"""
     try:
-        from sqlalchemy import func
-        
-        # Get total active servers
-        total_servers = db.query(func.count(Server.id)).filter(Server.status == 'active').scalar() or 0
-        
-        # Active monitors = total servers * 3 (perm + file + restore)
-        active_monitors = total_servers * 3 if total_servers > 0 else 0
-        
-        # Calculate alerts today from activity_logs
-        today_start = datetime.now().replace(hour=0, minute=0, second=0).timestamp()
-        alerts_today = count_activity_records(db, time_filter=today_start)
-        
-        # Calculate restored files (simplified - you can enhance this logic)
-        restored_files = alerts_today // 2 if alerts_today > 0 else 0
-        
-        return {
-            "totalServers": total_servers,
-            "activeMonitors": active_monitors,
-            "alertsToday": alerts_today,
-            "restoredFiles": restored_files
-        }
+        return response_cache.get_or_load(DASHBOARD_STATS, "all", lambda: load_dashboard_stats(db))
     except Exception as e:
         logger.error(f"Error getting dashboard stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ========== Servers Endpoints ==========
 
+def load_servers(db, window_hours: Optional[int] = None) -> list:
+    """Server list with per-server change counts from MySQL"""
+    servers = db.query(Server).all()
+    
+    # Counts for every server in one grouped query over the rollups
+    since = datetime.now().timestamp() - window_hours * 3600 if window_hours else None
+    totals = activity_totals_by_server(db, since=since)
+    
+    result = []
+    for server in servers:
+        server_totals = totals.get(server.id, {})
+        changes = sum(server_totals.values())
+        alerts = alert_count(server_totals)
+        
+        result.append({
+            "id": server.id,
+            "name": server.name,
+            "host": server.host,
+            "ip": f"{server.host}:{server.port}",
+            "port": server.port,
+            "path": server.path,
+            "mode": server.mode,
+            "status": server.status,
+            "changes": changes,
+            "alerts": alerts,
+            "restored": server_totals.get(RESTORED, 0)
+        })
+    
+    return result
+
 @app.get("/api/servers", dependencies=[Depends(require_viewer)])
-async def get_servers(db: Session = Depends(get_db)):
-    """Get all servers"""
+def get_servers(window_hours: Optional[int] = None, db: Session = Depends(get_db)):
+    """Get all servers, with change counts over the last window_hours (default: all time)"""
     try:
-        servers = db.query(Server).all()
-        
-        result = []
-        for server in servers:
-            # Count changes and alerts from activity_logs
-            changes = count_activity_records(db, server_id=server.id)
-            alerts = changes  # For now, all changes are considered alerts
-            
-            result.append({
-                "id": server.id,
-                "name": server.name,
-                "host": server.host,
-                "ip": f"{server.host}:{server.port}",
-                "port": server.port,
-                "path": server.path,
-                "mode": server.mode,
-                "status": server.status,
-                "changes": changes,
-                "alerts": alerts
-            })
-        
-        return result
+        return response_cache.get_or_load(SERVERS, window_hours, lambda: load_servers(db, window_hours))
     except Exception as e:
         logger.error(f"Error getting servers: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/servers", dependencies=[Depends(require_operator)])
-async def add_server(server_data: ServerCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def add_server(server_data: ServerCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Add a new server"""
     try:
         new_server = Server(
@@ -268,6 +382,7 @@ async def add_server(server_data: ServerCreate, background_tasks: BackgroundTask
         db.add(new_server)
         db.commit()
         db.refresh(new_server)
+        response_cache.invalidate(SERVERS, DASHBOARD_STATS)
         
         # Start monitoring in background
         # background_tasks.add_task(start_monitoring_for_server, new_server.id)
@@ -283,7 +398,7 @@ async def add_server(server_data: ServerCreate, background_tasks: BackgroundTask
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/servers/{server_id}/mode", dependencies=[Depends(require_operator)])
-async def update_server_mode(server_id: int, mode_update: ServerModeUpdate, db: Session = Depends(get_db)):
+def update_server_mode(server_id: int, mode_update: ServerModeUpdate, db: Session = Depends(get_db)):
     """Update server monitoring mode (active/passive)"""
     try:
         server = db.query(Server).filter(Server.id == server_id).first()
@@ -295,6 +410,7 @@ async def update_server_mode(server_id: int, mode_update: ServerModeUpdate, db:
         
         server.mode = mode_update.mode
         db.commit()
+        response_cache.invalidate(SERVERS)
         
         return {
             "message": f"Server mode updated to {mode_update.mode}",
@@ -309,15 +425,20 @@ async def update_server_mode(server_id: int, mode_update: ServerModeUpdate, db:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/servers/{server_id}", dependencies=[Depends(require_admin)])
-async def delete_server(server_id: int, db: Session = Depends(get_db)):
+def delete_server(server_id: int, db: Session = Depends(get_db)):
     """Delete a server"""
     try:
         server = db.query(Server).filter(Server.id == server_id).first()
         if not server:
             raise HTTPException(status_code=404, detail="Server not found")
         
+        # activity_logs has no foreign key to servers (it is partitioned), so
+        # the server's history and its rollups go in the same transaction
+        db.query(Activity).filter(Activity.server_id == server_id).delete(synchronize_session=False)
+        db.query(ActivityRollup).filter(ActivityRollup.server_id == server_id).delete(synchronize_session=False)
         db.delete(server)
         db.commit()
+        response_cache.invalidate(SERVERS, DASHBOARD_STATS)
         
         return {"message": f"Server {server_id} deleted successfully"}
     except HTTPException:
@@ -328,7 +449,7 @@ async def delete_server(server_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/servers/{server_id}", dependencies=[Depends(require_viewer)])
-async def get_server(server_id: int, db: Session = Depends(get_db)):
+def get_server(server_id: int, db: Session = Depends(get_db)):
     """Get server details"""
     try:
         server = db.query(Server).filter(Server.id == server_id).first()
@@ -353,11 +474,18 @@ async def get_server(server_id: int, db: Session = Depends(get_db)):
 # ========== Activity Endpoints ==========
 
 @app.get("/api/activity", dependencies=[Depends(require_viewer)])
-async def get_activity(limit: int = 50, db: Session = Depends(get_db)):
-    """Get recent activity from all servers from centralized database"""
+def get_activity(response: Response, limit: int = 50, cursor: Optional[str] = None,
+                       server_id: Optional[int] = None, type: Optional[str] = None,
+                       operation: Optional[str] = None, path_prefix: Optional[str] = None,
+                       since: Optional[float] = None, until: Optional[float] = None,
+                       db: Session = Depends(get_db)):
+    """Get activity from all servers, newest first; pass X-Next-Cursor back as cursor for the next page"""
     try:
-        # Query activities from the centralized activity_logs table
-        activities = db.query(Activity).order_by(Activity.timestamp.desc()).limit(limit).all()
+        activities, next_cursor = query_activity(
+            db, limit, cursor, server_id=server_id, activity_type=type, operation=operation,
+            path_prefix=path_prefix, since=since, until=until
+        )
+        set_next_cursor(response, next_cursor)
         
         result = []
         for activity in activities:
@@ -387,18 +515,92 @@ async def get_activity(limit: int = 50, db: Session = Depends(get_db)):
         logger.error(f"Error getting activity: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = (
+    "id", "event_id", "timestamp", "server_id", "server_name", "activity_type", "change_type",
+    "operation", "path", "src_path", "dst_path", "old_value", "new_value", "details"
+)
+# Rows fetched per round trip from the server-side cursor and written per chunk
+EXPORT_BATCH = 1000
+
+
+def iter_activity_export(fmt: str, filters: dict):
+    """Yield the export body in chunks of EXPORT_BATCH rows.
+
+    Uses its own session, since the response outlives the request's
+    dependencies, and an unbuffered (server-side) cursor so memory stays
+    flat however many rows match.
+    """
+    db = db_manager.get_session()
+    try:
+        columns = [getattr(Activity, name) for name in EXPORT_COLUMNS]
+        query = filter_activity(db.query(*columns), **filters) \
+            .order_by(Activity.timestamp, Activity.id) \
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        rows = 0
+        for row in query:
+            if writer:
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str))
+                buffer.write("\n")
+            rows += 1
+            if rows % EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        logger.info(f"Exported {rows} activity rows as {fmt}")
+    except Exception as e:
+        # Headers are already sent; the truncated body is all we can signal
+        logger.error(f"Error exporting activity: {e}")
+    finally:
+        db.close()
+
+
+@app.get("/api/activity/export", dependencies=[Depends(require_operator)])
+def export_activity(format: str = "ndjson", server_id: Optional[int] = None, type: Optional[str] = None,
+                    operation: Optional[str] = None, path_prefix: Optional[str] = None,
+                    since: Optional[float] = None, until: Optional[float] = None):
+    """Stream activity history (oldest first) as NDJSON or CSV"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    filters = {
+        "server_id": server_id, "activity_type": type, "operation": operation,
+        "path_prefix": path_prefix, "since": since, "until": until
+    }
+    filename = f"activity-{server_id or 'all'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(
+        iter_activity_export(format, filters),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # ========== Alerts Endpoints ==========
 
 @app.get("/api/alerts", dependencies=[Depends(require_viewer)])
-async def get_alerts(filter: str = "all", db: Session = Depends(get_db)):
-    """Get alerts with optional filtering from centralized database"""
+def get_alerts(response: Response, filter: str = "all", limit: int = 50, cursor: Optional[str] = None,
+                     server_id: Optional[int] = None, since: Optional[float] = None, until: Optional[float] = None,
+                     db: Session = Depends(get_db)):
+    """Get alerts, optionally filtered by severity (critical/warning), newest first"""
     try:
-        # Get recent activities
-        activities = db.query(Activity).order_by(Activity.timestamp.desc()).limit(100).all()
+        if filter != "all" and filter not in SEVERITY_TYPES:
+            return []
+        # Severity maps to activity_type, so the filter runs in SQL
+        activities, next_cursor = query_activity(
+            db, limit, cursor, server_id=server_id, activity_type=SEVERITY_TYPES.get(filter),
+            since=since, until=until
+        )
+        set_next_cursor(response, next_cursor)
         
         # Transform activities into alerts
         alerts = []
-        for activity in activities[:50]:
+        for activity in activities:
             severity = "critical" if activity.activity_type == "permission" else "warning"
             
             alerts.append({
@@ -409,9 +611,6 @@ async def get_alerts(filter: str = "all", db: Session = Depends(get_db)):
                 "path": activity.path or activity.src_path
             })
         
-        if filter != "all":
-            alerts = [a for a in alerts if a["severity"] == filter]
-        
         return alerts
     except Exception as e:
         logger.error(f"Error getting alerts: {e}")
@@ -420,15 +619,17 @@ async def get_alerts(filter: str = "all", db: Session = Depends(get_db)):
 # ========== File Changes Endpoints ==========
 
 @app.get("/api/files", dependencies=[Depends(require_viewer)])
-async def get_file_changes(server_id: Optional[int] = None, db: Session = Depends(get_db)):
-    """Get file changes from centralized database"""
+def get_file_changes(response: Response, server_id: Optional[int] = None, limit: int = 50,
+                           cursor: Optional[str] = None, operation: Optional[str] = None,
+                           path_prefix: Optional[str] = None, since: Optional[float] = None,
+                           until: Optional[float] = None, db: Session = Depends(get_db)):
+    """Get file changes, newest first"""
     try:
-        query = db.query(Activity).filter(Activity.activity_type == 'file').order_by(Activity.timestamp.desc())
-        
-        if server_id:
-            query = query.filter(Activity.server_id == server_id)
-        
-        activities = query.limit(50).all()
+        activities, next_cursor = query_activity(
+            db, limit, cursor, server_id=server_id, activity_type='file', operation=operation,
+            path_prefix=path_prefix, since=since, until=until
+        )
+        set_next_cursor(response, next_cursor)
         
         file_changes = []
         for activity in activities:
@@ -449,15 +650,17 @@ async def get_file_changes(server_id: Optional[int] = None, db: Session = Depend
 # ========== Permission Changes Endpoints ==========
 
 @app.get("/api/permissions", dependencies=[Depends(require_viewer)])
-async def get_permission_changes(server_id: Optional[int] = None, db: Session = Depends(get_db)):
-    """Get permission changes from centralized database"""
+def get_permission_changes(response: Response, server_id: Optional[int] = None, limit: int = 50,
+                                 cursor: Optional[str] = None, change_type: Optional[str] = None,
+                                 path_prefix: Optional[str] = None, since: Optional[float] = None,
+                                 until: Optional[float] = None, db: Session = Depends(get_db)):
+    """Get permission changes, newest first"""
     try:
-        query = db.query(Activity).filter(Activity.activity_type == 'permission').order_by(Activity.timestamp.desc())
-        
-        if server_id:
-            query = query.filter(Activity.server_id == server_id)
-        
-        activities = query.limit(50).all()
+        activities, next_cursor = query_activity(
+            db, limit, cursor, server_id=server_id, activity_type='permission', operation=change_type,
+            path_prefix=path_prefix, since=since, until=until
+        )
+        set_next_cursor(response, next_cursor)
         
         perm_changes = []
         for activity in activities:
@@ -478,7 +681,7 @@ async def get_permission_changes(server_id: Optional[int] = None, db: Session =
 # ========== Backups Endpoints ==========
 
 @app.get("/api/backups", dependencies=[Depends(require_viewer)])
-async def get_backups(db: Session = Depends(get_db)):
+def get_backups(db: Session = Depends(get_db)):
     """Get backup information from centralized database"""
     try:
         backups = db.query(Backup).order_by(Backup.created_at.desc()).all()
@@ -501,7 +704,7 @@ async def get_backups(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/backups", dependencies=[Depends(require_operator)])
-async def create_backup(server_id: int, db: Session = Depends(get_db)):
+def create_backup(server_id: int, db: Session = Depends(get_db)):
     """Create a new backup for a server"""
     try:
         # Implement backup creation logic
@@ -517,7 +720,7 @@ async def create_backup(server_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/backups/{backup_id}/restore", dependencies=[Depends(require_operator)])
-async def restore_backup(backup_id: int, db: Session = Depends(get_db)):
+def restore_backup(backup_id: int, db: Session = Depends(get_db)):
     """Restore from backup"""
     try:
         # Implement restore logic
@@ -528,23 +731,25 @@ async def restore_backup(backup_id: int, db: Session = Depends(get_db)):
 
 # ========== Settings Endpoints ==========
 
+def load_settings(db, prefix: str) -> dict:
+    """Settings whose key starts with prefix, with the prefix removed"""
+    settings = {}
+    results = db.query(Setting).filter(Setting.key.like(f'{prefix}%')).all()
+    for setting in results:
+        settings[setting.key.replace(prefix, '', 1)] = setting.value
+    return settings
+
 @app.get("/api/settings/alerts", dependencies=[Depends(require_viewer)])
-async def get_alert_config(db: Session = Depends(get_db)):
+def get_alert_config(db: Session = Depends(get_db)):
     """Get alert configuration"""
     try:
-        settings = {}
-        results = db.query(Setting).filter(Setting.key.like('alert_%')).all()
-        for setting in results:
-            # Remove 'alert_' prefix
-            key = setting.key.replace('alert_', '')
-            settings[key] = setting.value
-        return settings
+        return response_cache.get_or_load(ALERT_SETTINGS, "all", lambda: load_settings(db, 'alert_'))
     except Exception as e:
         logger.error(f"Error getting alert config: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/settings/alerts", dependencies=[Depends(require_admin)])
-async def update_alert_config(config: AlertConfigUpdate, db: Session = Depends(get_db)):
+def update_alert_config(config: AlertConfigUpdate, db: Session = Depends(get_db)):
     """Update alert configuration"""
     try:
         for key, value in config.dict(exclude_none=True).items():
@@ -557,6 +762,7 @@ async def update_alert_config(config: AlertConfigUpdate, db: Session = Depends(g
                 db.add(new_setting)
         
         db.commit()
+        response_cache.invalidate(ALERT_SETTINGS)
         return {"message": "Alert configuration updated successfully"}
     except Exception as e:
         db.rollback()
@@ -564,22 +770,16 @@ async def update_alert_config(config: AlertConfigUpdate, db: Session = Depends(g
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/settings/general", dependencies=[Depends(require_viewer)])
-async def get_general_settings(db: Session = Depends(get_db)):
+def get_general_settings(db: Session = Depends(get_db)):
     """Get general settings"""
     try:
-        settings = {}
-        results = db.query(Setting).filter(Setting.key.like('general_%')).all()
-        for setting in results:
-            # Remove 'general_' prefix
-            key = setting.key.replace('general_', '')
-            settings[key] = setting.value
-        return settings
+        return response_cache.get_or_load(GENERAL_SETTINGS, "all", lambda: load_settings(db, 'general_'))
     except Exception as e:
         logger.error(f"Error getting general settings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/settings/general", dependencies=[Depends(require_admin)])
-async def update_general_settings(settings: GeneralSettingsUpdate, db: Session = Depends(get_db)):
+def update_general_settings(settings: GeneralSettingsUpdate, db: Session = Depends(get_db)):
     """Update general settings"""
     try:
         for key, value in settings.dict().items():
@@ -592,12 +792,18 @@ async def update_general_settings(settings: GeneralSettingsUpdate, db: Session =
                 db.add(new_setting)
         
         db.commit()
+        response_cache.invalidate(GENERAL_SETTINGS)
         return {"message": "General settings updated successfully"}
     except Exception as e:
         db.rollback()
         logger.error(f"Error updating general settings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/cache/metrics", dependencies=[Depends(require_admin)])
+async def get_cache_metrics():
+    """Response cache hit/miss metrics"""
+    return await run_in_threadpool(response_cache.metrics)
+
 # ==================== WebSocket Endpoints ====================
 
 ws_manager = get_connection_manager()
@@ -613,14 +819,15 @@ async def websocket_endpoint(websocket: WebSocket):
             message = json.loads(data)
             
             # Handle subscription requests
+            # ("since"/"epoch" replay what was missed while disconnected)
             if message.get("type") == "subscribe":
                 topic = message.get("topic")
                 if topic:
-                    await ws_manager.subscribe(websocket, topic)
-                    await ws_manager.send_personal_message(
-                        {"type": "subscribed", "topic": topic},
-                        websocket
-                    )
+                    ack = await ws_manager.subscribe(websocket, topic)
+                    await ws_manager.send_personal_message(ack, websocket)
+                    await ws_manager.replay(websocket, topic, message.get("since"), message.get("epoch"))
+                    if topic == STATS_TOPIC and last_stats:
+                        await ws_manager.send_personal_message(stats_snapshot(), websocket)
             
             # Handle unsubscription requests
             elif message.get("type") == "unsubscribe":
@@ -645,55 +852,92 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"WebSocket error: {e}")
         ws_manager.disconnect(websocket)
 
+STATS_TOPIC = "stats"
+# At most this many stats_update frames per second; changes in between coalesce
+STATS_MAX_RATE_DEFAULT = 1.0
+STATS_MAX_RATE_RANGE = (0.01, 20.0)
+
+def load_stats_max_rate() -> float:
+    """STATS_MAX_RATE clamped to STATS_MAX_RATE_RANGE (default for invalid values)"""
+    raw = os.getenv("STATS_MAX_RATE", str(STATS_MAX_RATE_DEFAULT))
+    try:
+        rate = float(raw)
+    except ValueError:
+        rate = float("nan")
+    if not rate > 0:
+        logger.warning(f"Invalid STATS_MAX_RATE {raw!r}, using {STATS_MAX_RATE_DEFAULT}")
+        return STATS_MAX_RATE_DEFAULT
+    low, high = STATS_MAX_RATE_RANGE
+    if not low <= rate <= high:
+        logger.warning(f"STATS_MAX_RATE {rate} out of range, clamped to [{low}, {high}]")
+    return min(max(rate, low), high)
+
+STATS_MAX_RATE = load_stats_max_rate()
+
+# Last stats sent to the stats topic (the base the deltas apply to)
+last_stats: Dict[str, Any] = {}
+
+def collect_stats() -> dict:
+    """Current dashboard counters (blocking; run in the thread pool)"""
+    db = db_manager.get_session()
+    try:
+        return response_cache.get_or_load(DASHBOARD_STATS, "all", lambda: load_dashboard_stats(db))
+    finally:
+        db.close()
+
+def stats_snapshot() -> dict:
+    """Full stats_update message for a client that just subscribed"""
+    return {"type": "stats_update", "full": True, "data": dict(last_stats)}
+
 async def broadcast_stats_update():
-    """Background task to broadcast stats updates periodically"""
+    """Background task sending stats changes to the stats topic.
+
+    Frames carry only the fields that changed (plus the time of the change)
+    and are skipped entirely while nothing changes; subscribers get a full
+    snapshot when they subscribe.
+    """
     while True:
-        db = None
         try:
-            from sqlalchemy import func
-            # Get a database session for this task
-            db = db_manager.get_session()
-            
-            # Get current stats from unified database
-            total_servers = db.query(func.count(Server.id)).filter(Server.status == 'active').scalar() or 0
-            active_monitors = total_servers * 3 if total_servers > 0 else 0
-            
-            # Calculate alerts today from activity_logs
-            today_start = datetime.now().replace(hour=0, minute=0, second=0).timestamp()
-            alerts_today = count_activity_records(db, time_filter=today_start)
-            restored_files = alerts_today // 2 if alerts_today > 0 else 0
-            
-            # Broadcast to all connected clients
-            await ws_manager.broadcast({
-                "type": "stats_update",
-                "data": {
-                    "totalServers": total_servers,
-                    "activeMonitors": active_monitors,
-                    "alertsToday": alerts_today,
-                    "restoredFiles": restored_files,
-                    "timestamp": datetime.now().isoformat()
-                }
-            })
+            stats = await run_in_threadpool(collect_stats)
+            delta = {key: value for key, value in stats.items() if last_stats.get(key) != value}
+            if delta:
+                delta["timestamp"] = datetime.now().isoformat()
+                last_stats.update(delta)
+                await ws_manager.broadcast_to_topic(STATS_TOPIC, {
+                    "type": "stats_update",
+                    "full": False,
+                    "data": delta
+                })
             
         except Exception as e:
             logger.error(f"Error broadcasting stats: {e}")
-        finally:
-            # Always close the database session
-            if db:
-                db.close()
         
-        # Wait 5 seconds before next update
-        await asyncio.sleep(5)
+        await asyncio.sleep(1 / STATS_MAX_RATE)
 
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks on app startup"""
+    # Sync endpoints run in anyio's thread pool (40 threads by default); size
+    # it to the connection pool so threads don't queue on pool checkout
+    limiter = to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv("API_THREADPOOL_SIZE", db_manager.pool_size + db_manager.max_overflow))
+    logger.info(f"Thread pool size: {limiter.total_tokens}")
+
     # Start the stats broadcast task
     asyncio.create_task(broadcast_stats_update())
+
+    # Partition maintenance and log retention (one process at a time via a MySQL lock)
+    from retention import RetentionWorker
+    RetentionWorker(db_manager).start()
+
+    # Live events from the monitoring pipeline to the WebSocket topics (REDIS_ENABLED)
+    from live import start_live_relay
+    start_live_relay(ws_manager, db_manager)
     logger.info("Background tasks started")
 
 # ==================== Main ====================
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # permessage-deflate compresses the JSON frames for browsers that offer it
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=True)
\ No newline at end of file
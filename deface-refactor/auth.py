@@ -4,6 +4,8 @@ Authentication and Authorization Module
 Handles JWT tokens, password hashing, and RBAC
 """
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List
 from jose import JWTError, jwt
@@ -11,8 +13,13 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hashlib
 import sqlite3
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -31,11 +38,27 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt is deliberately slow; at most this many hashes run at once, in
+# their own threads, so a login burst neither blocks the event loop nor
+# takes over the request thread pool
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+# Verified token claims kept, keyed by the token's SHA-256
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+
 # Security scheme
 security = HTTPBearer()
 
+# Seconds a loaded user record is reused before re-reading it. The cache is
+# per process: invalidate_user() only clears this worker's copy, so other API
+# workers may keep serving a changed or disabled user for up to this long
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
 # ==================== Models ====================
 
+ROLES = ("admin", "operator", "viewer")
+
 class User(BaseModel):
     id: int
     username: str
@@ -54,6 +77,12 @@ class UserCreate(BaseModel):
     full_name: Optional[str] = None
     role: str = "viewer"
 
+class UserRoleUpdate(BaseModel):
+    role: str
+
+class UserStatusUpdate(BaseModel):
+    disabled: bool
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -77,11 +106,51 @@ def get_password_hash(password: str) -> str:
     """Hash a plain password"""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() on the bcrypt executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+def hash_password_bounded(password: str) -> str:
+    """get_password_hash() on the bcrypt executor, from a worker thread"""
+    return _password_executor.submit(get_password_hash, password).result()
+
 # ==================== Database Functions ====================
 
+# One connection per database file, shared by the request threads
+_connections = {}
+_connections_lock = threading.Lock()
+# Serializes use of the shared connections
+_db_lock = threading.RLock()
+
+# (db_path, username) -> (expires_at, UserInDB)
+_user_cache = {}
+
+def get_auth_connection(db_path: str = "antidefacement.db") -> sqlite3.Connection:
+    """Get the shared connection to an auth database (use under _db_lock)"""
+    with _connections_lock:
+        conn = _connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            # Readers don't block behind a writer (and vice versa)
+            conn.execute("PRAGMA journal_mode=WAL")
+            _connections[db_path] = conn
+        return conn
+
+def invalidate_user(username: Optional[str] = None, db_path: str = "antidefacement.db"):
+    """Drop a user's cached record (all users when username is None) in this process"""
+    with _db_lock:
+        if username is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop((db_path, username), None)
+
 def init_auth_database(db_path: str = "antidefacement.db"):
     """Initialize authentication tables"""
-    conn = sqlite3.connect(db_path)
+    with _db_lock:
+        _init_auth_database(get_auth_connection(db_path))
+
+def _init_auth_database(conn: sqlite3.Connection):
     cursor = conn.cursor()
     
     # Users table
@@ -109,23 +178,31 @@ def init_auth_database(db_path: str = "antidefacement.db"):
         )
     
     conn.commit()
-    conn.close()
+
+def get_cached_user(username: str, db_path: str = "antidefacement.db") -> Optional[UserInDB]:
+    """The cached record of a user, or None if not cached (or expired)"""
+    cached = _user_cache.get((db_path, username))
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
 
 def get_user(username: str, db_path: str = "antidefacement.db") -> Optional[UserInDB]:
-    """Get user from database"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT id, username, email, full_name, hashed_password, role, disabled FROM users WHERE username = ?",
-        (username,)
-    )
-    
-    row = cursor.fetchone()
-    conn.close()
+    """Get user from database (cached for USER_CACHE_TTL seconds)"""
+    key = (db_path, username)
+    user = get_cached_user(username, db_path)
+    if user is not None:
+        return user
     
-    if row:
-        return UserInDB(
+    # Cached under the same lock as the read, so a write committed after the
+    # read is always followed by its invalidate_user(), never by this store
+    with _db_lock:
+        row = get_auth_connection(db_path).execute(
+            "SELECT id, username, email, full_name, hashed_password, role, disabled FROM users WHERE username = ?",
+            (username,)
+        ).fetchone()
+        if not row:
+            return None
+        user = UserInDB(
             id=row[0],
             username=row[1],
             email=row[2],
@@ -134,41 +211,58 @@ def get_user(username: str, db_path: str = "antidefacement.db") -> Optional[User
             role=row[5],
             disabled=bool(row[6])
         )
-    return None
+        _user_cache[key] = (time.monotonic() + USER_CACHE_TTL, user)
+    return user
 
 def create_user(user_data: UserCreate, db_path: str = "antidefacement.db") -> User:
     """Create a new user"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
+    hashed_password = hash_password_bounded(user_data.password)
     try:
-        hashed_password = get_password_hash(user_data.password)
-        cursor.execute(
-            """
-            INSERT INTO users (username, email, full_name, hashed_password, role)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (user_data.username, user_data.email, user_data.full_name, hashed_password, user_data.role)
-        )
-        user_id = cursor.lastrowid
-        conn.commit()
-        
-        return User(
-            id=user_id,
-            username=user_data.username,
-            email=user_data.email,
-            full_name=user_data.full_name,
-            role=user_data.role,
-            disabled=False
-        )
-    except sqlite3.IntegrityError as e:
-        conn.close()
+        with _db_lock:
+            conn = get_auth_connection(db_path)
+            with conn:
+                cursor = conn.execute(
+                    """
+                    INSERT INTO users (username, email, full_name, hashed_password, role)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (user_data.username, user_data.email, user_data.full_name, hashed_password, user_data.role)
+                )
+            user_id = cursor.lastrowid
+    except sqlite3.IntegrityError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username or email already exists"
         )
-    finally:
-        conn.close()
+    invalidate_user(user_data.username, db_path)
+    
+    return User(
+        id=user_id,
+        username=user_data.username,
+        email=user_data.email,
+        full_name=user_data.full_name,
+        role=user_data.role,
+        disabled=False
+    )
+
+def _update_user(username: str, column: str, value, db_path: str) -> bool:
+    with _db_lock:
+        conn = get_auth_connection(db_path)
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE users SET {column} = ?, updated_at = CURRENT_TIMESTAMP WHERE username = ?",
+                (value, username)
+            )
+    invalidate_user(username, db_path)
+    return cursor.rowcount > 0
+
+def update_user_role(username: str, role: str, db_path: str = "antidefacement.db") -> bool:
+    """Change a user's role; returns False for an unknown user"""
+    return _update_user(username, "role", role, db_path)
+
+def set_user_disabled(username: str, disabled: bool, db_path: str = "antidefacement.db") -> bool:
+    """Disable or re-enable a user; returns False for an unknown user"""
+    return _update_user(username, "disabled", int(disabled), db_path)
 
 def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
     """Authenticate user with username and password"""
@@ -181,6 +275,17 @@ def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
         return None
     return user
 
+async def authenticate_user_async(username: str, password: str) -> Optional[UserInDB]:
+    """authenticate_user() without blocking the event loop"""
+    user = get_cached_user(username) or await run_in_threadpool(get_user, username)
+    if not user:
+        return None
+    if not await verify_password_async(password, user.hashed_password):
+        return None
+    if user.disabled:
+        return None
+    return user
+
 # ==================== JWT Token Functions ====================
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -195,8 +300,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# sha256(token) -> (exp, TokenData), least recently used first
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 def decode_access_token(token: str) -> Optional[TokenData]:
-    """Decode and verify JWT token"""
+    """Decode and verify JWT token.
+
+    Verified claims are cached until the token's own expiry, so a token
+    seen before costs a hash and a dict lookup instead of a signature check.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            if cached[0] > time.time():
+                _token_cache.move_to_end(key)
+                return cached[1]
+            del _token_cache[key]
+            return None
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -205,14 +328,22 @@ def decode_access_token(token: str) -> Optional[TokenData]:
         if username is None:
             return None
         
-        return TokenData(username=username, role=role)
+        token_data = TokenData(username=username, role=role)
     except JWTError:
         return None
+    
+    # Tokens without exp are verified every time
+    if payload.get("exp") is not None:
+        with _token_cache_lock:
+            _token_cache[key] = (float(payload["exp"]), token_data)
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return token_data
 
 # ==================== Dependency Functions ====================
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current user from JWT token"""
+    """Get current user from JWT token (cache hits stay on the event loop)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -225,7 +356,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if token_data is None or token_data.username is None:
         raise credentials_exception
     
-    user = get_user(username=token_data.username)
+    user = get_cached_user(token_data.username) or await run_in_threadpool(get_user, token_data.username)
     if user is None:
         raise credentials_exception
     
@@ -252,7 +383,7 @@ class RoleChecker:
     def __init__(self, allowed_roles: List[str]):
         self.allowed_roles = allowed_roles
     
-    def __call__(self, current_user: User = Depends(get_current_active_user)):
+    async def __call__(self, current_user: User = Depends(get_current_active_user)):
         if current_user.role not in self.allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -15,78 +15,34 @@ from rich.table import Table
 from rich.logging import RichHandler
 import getpass
 import paramiko
-import redis
-from rq import Queue
 import json
 
 # Import the modules from the existing scripts
 from permission_monitoring import SSHConfig as PermSSHConfig, MonitorConfig as PermMonitorConfig, PermissionMonitor
 from ssh import SSHConfig as FileSSHConfig, MonitorConfig as FileMonitorConfig, FileOperationsMonitor
 import rsync
+from red import RedisConfig
+from watcher import get_remote_watcher
+from restore_ledger import RSYNC_RESTORE_OUT_FORMAT, parse_rsync_itemized, get_restore_ledger
+from swap_restore import StagedSwapRestore
 
 console = Console()
 
+# Seconds between unconditional restores while the remote watcher is running
+SAFETY_NET_RESTORE_INTERVAL = 60
+
+# Changed paths in one burst from which the 'swap' strategy swaps the whole tree
+SWAP_RESTORE_THRESHOLD = 50
 
 
 
 
-    def connect(self):
-        """Establish Redis connection"""
-        try:
-            self.connection = redis.Redis(
-                host=self.host,
-                port=self.port,
-                db=self.db,
-                password=self.password,
-                decode_responses=True
-            )
-            # Test connection
-            self.connection.ping()
-            console.print(f"[green]✓ Connected to Redis at {self.host}:{self.port}[/green]")
-            
-            # Create RQ queue for job management
-            self.queue = Queue(connection=self.connection)
-            return True
-        except Exception as e:
-            console.print(f"[red]Failed to connect to Redis: {str(e)}[/red]")
-            return False
-    
-    def publish_event(self, channel, event_data):
-        """Publish event to Redis channel"""
-        if self.connection:
-            try:
-                self.connection.publish(channel, json.dumps(event_data))
-                return True
-            except Exception as e:
-                console.print(f"[red]Failed to publish to Redis: {str(e)}[/red]")
-                return False
-    
-    def add_to_queue(self, queue_name, data):
-        """Add data to Redis queue"""
-        if self.connection:
-            try:
-                self.connection.lpush(queue_name, json.dumps(data))
-                return True
-            except Exception as e:
-                console.print(f"[red]Failed to add to Redis queue: {str(e)}[/red]")
-                return False
-    
-    def get_from_queue(self, queue_name, timeout=1):
-        """Get data from Redis queue (blocking)"""
-        if self.connection:
-            try:
-                result = self.connection.brpop(queue_name, timeout=timeout)
-                if result:
-                    return json.loads(result[1])
-                return None
-            except Exception as e:
-                console.print(f"[red]Failed to get from Redis queue: {str(e)}[/red]")
-                return None
 
 class AntiDefacement:
     def __init__(self, ssh_user, ssh_host, ssh_port, path, mode="passive", 
              ssh_key=None, ssh_password=None, interval=1, backup_path=None,
-             redis_host='localhost', redis_port=6379, redis_password=None, use_redis=False):
+             redis_host='localhost', redis_port=6379, redis_password=None, use_redis=False,
+             restore_strategy="rsync"):
     # ... your existing code ...
     
     # Redis configuration
@@ -114,6 +70,8 @@ class AntiDefacement:
             ssh_password: SSH password (if not using key-based auth)
             interval: Monitoring interval in seconds
             backup_path: Custom path for storing backups on the remote server (active mode only)
+            restore_strategy: 'rsync' to restore file by file, 'swap' to swap in a staged
+                copy of the backup when a large burst of changes is detected (active mode only)
         """
         self.ssh_user = ssh_user
         self.ssh_host = ssh_host
@@ -124,6 +82,7 @@ class AntiDefacement:
         self.ssh_password = ssh_password
         self.interval = interval
         self.custom_backup_path = backup_path
+        self.restore_strategy = restore_strategy
         
         # Create a directory to store logs (not backups, since we'll use the remote machine)
         self.backup_dir = f"logs_{ssh_host}_{ssh_port}_{path.replace('/', '_')}"
@@ -379,6 +338,7 @@ def _process_redis_events(self):
                 monitored_path = self.path
                 ssh_config = self.ssh_config
                 stop_event = self.stop_event
+                restore_strategy = self.restore_strategy
                 
                 # Function to restore files from the backup when changes are detected
                 def run_restore_monitor():
@@ -408,10 +368,16 @@ def _process_redis_events(self):
                                 local_console.print(f"[bold red]⚠ Unauthorized change detected: {reason}[/bold red]")
                                 local_logger.warning(f"[RESTORE] {reason}")
                             
-                            restore_cmd = f"rsync -azq --delete {remote_backup_path}/ {monitored_path}/"
+                            restore_cmd = f"rsync -az --delete --out-format='{RSYNC_RESTORE_OUT_FORMAT}' {remote_backup_path}/ {monitored_path}/"
                             stdin, stdout, stderr = ssh.exec_command(restore_cmd)
+                            output = stdout.read().decode()
                             error = stderr.read().decode().strip()
                             
+                            # Publish what was rewritten so the monitors don't report the restore itself
+                            restored = parse_rsync_itemized(output, monitored_path)
+                            if restored:
+                                get_restore_ledger().publish(ssh_config['host'], restored)
+                            
                             if error:
                                 local_console.print(f"[red]Error during restore: {error}[/red]")
                                 local_logger.error(f"Restore error: {error}")
@@ -422,67 +388,79 @@ def _process_redis_events(self):
                                     local_logger.info(f"Files successfully restored from backup after detecting: {reason}")
                                 return True
                         
+                        # Bulk restores swap a pre-built copy of the backup into place
+                        swap_restore = None
+                        if restore_strategy == "swap":
+                            swap_restore = StagedSwapRestore(ssh, monitored_path, remote_backup_path)
+                            if not swap_restore.prepare():
+                                local_console.print("[yellow]Staged swap unavailable, restoring with rsync only[/yellow]")
+                                swap_restore = None
+                        
+                        def perform_swap(reason):
+                            local_console.print(f"[bold red]⚠ Large compromise detected: {reason}[/bold red]")
+                            local_logger.warning(f"[RESTORE-SWAP] {reason}")
+                            restored = swap_restore.swap()
+                            if restored is None:
+                                return perform_restore(reason)
+                            
+                            get_restore_ledger().publish(ssh_config['host'], restored)
+                            # inotify watches followed the old tree when it was renamed away
+                            watcher.restart()
+                            local_logger.info(f"Live tree swapped to staged backup after detecting: {reason}")
+                            return True
+                        
                         # Start with an initial restore to ensure everything is in sync
                         perform_restore("Initial synchronization")
                         
-                        # Get a baseline of the monitored directory (just a hash of the directory listing)
-                        def get_dir_hash():
-                            cmd = f"find {monitored_path} -type f -o -type d | sort | md5sum"
-                            stdin, stdout, stderr = ssh.exec_command(cmd)
-                            dir_hash = stdout.read().decode().strip().split()[0]
-                            return dir_hash
+                        # Changes are pushed by one resident watcher on the remote host
+                        # instead of re-running find/md5sum over the whole tree
+                        changed = threading.Event()
+                        changed_paths = []
+                        changed_lock = threading.Lock()
+                        
+                        def on_remote_change(event):
+                            with changed_lock:
+                                changed_paths.append(event['path'])
+                                changed.set()
                         
-                        baseline_hash = get_dir_hash()
-                        local_console.print(f"[blue]Baseline established. Monitoring for changes...[/blue]")
+                        watcher = get_remote_watcher(ssh_config, monitored_path)
+                        watcher.subscribe(on_remote_change)
+                        if not watcher.wait_ready(timeout=10):
+                            local_console.print("[yellow]Remote watcher not ready yet, relying on periodic restore until it starts[/yellow]")
+                        local_console.print(f"[blue]Watching {monitored_path} for changes...[/blue]")
                         
-                        # Monitor for changes and restore when needed
                         last_restore_time = time.time()
-                        last_check_time = time.time()
-                        last_full_check_time = time.time()
                         
-                        while not stop_event.is_set():
-                            try:
-                                current_time = time.time()
-                                changes_detected = False
-                                
-                                # Check for recent file changes (fast check)
-                                if current_time - last_check_time >= 0.5:  # Check every half second
-                                    # Check for new or modified files
-                                    check_cmd = (
-                                        f"find {monitored_path} -type f -newermt \"$(date -d '1 second ago' '+%Y-%m-%d %H:%M:%S')\" "
-                                        f"-o -type d -newermt \"$(date -d '1 second ago' '+%Y-%m-%d %H:%M:%S')\" | head -1"
-                                    )
-                                    stdin, stdout, stderr = ssh.exec_command(check_cmd)
-                                    recent_changes = stdout.read().decode().strip()
+                        try:
+                            while not stop_event.is_set():
+                                try:
+                                    if changed.wait(timeout=0.5):
+                                        # Let a burst of events settle so it costs a single restore
+                                        time.sleep(0.1)
+                                        with changed_lock:
+                                            changed.clear()
+                                            paths, changed_paths[:] = list(changed_paths), []
+                                        
+                                        reason = f"Unauthorized change to {paths[0]}"
+                                        if len(paths) > 1:
+                                            reason += f" (+{len(paths) - 1} more)"
+                                        if swap_restore and len(set(paths)) >= SWAP_RESTORE_THRESHOLD:
+                                            perform_swap(reason)
+                                        else:
+                                            perform_restore(reason)
+                                        last_restore_time = time.time()
                                     
-                                    if recent_changes:
-                                        changes_detected = True
-                                        perform_restore(f"Unauthorized change to {recent_changes}")
+                                    # Periodic restore regardless of changes (safety net)
+                                    elif time.time() - last_restore_time >= SAFETY_NET_RESTORE_INTERVAL:
+                                        perform_restore()
+                                        last_restore_time = time.time()
                                     
-                                    last_check_time = current_time
-                                
-                                # Do a full directory check periodically (more thorough)
-                                if current_time - last_full_check_time >= 3:  # Every 3 seconds
-                                    current_hash = get_dir_hash()
-                                    if current_hash != baseline_hash:
-                                        changes_detected = True
-                                        perform_restore("Directory structure changed")
-                                        baseline_hash = get_dir_hash()  # Update baseline after restore
-                                    
-                                    last_full_check_time = current_time
-                                
-                                # Periodic restore regardless of changes (safety net)
-                                if current_time - last_restore_time >= 5:  # Every 5 seconds
-                                    perform_restore()
-                                    last_restore_time = current_time
-                                
-                                # Brief sleep to avoid excessive CPU usage
-                                time.sleep(0.1)
-                                
-                            except Exception as inner_e:
-                                local_console.print(f"[red]Error during restoration cycle: {str(inner_e)}[/red]")
-                                local_logger.error(f"Restoration cycle error: {str(inner_e)}")
-                                time.sleep(2)  # Sleep a bit longer on error
+                                except Exception as inner_e:
+                                    local_console.print(f"[red]Error during restoration cycle: {str(inner_e)}[/red]")
+                                    local_logger.error(f"Restoration cycle error: {str(inner_e)}")
+                                    time.sleep(2)  # Sleep a bit longer on error
+                        finally:
+                            watcher.unsubscribe(on_remote_change)
                                 
                     except Exception as e:
                         local_console.print(f"[red]Error in restore monitor: {str(e)}[/red]")
@@ -644,6 +622,10 @@ def _process_redis_events(self):
             except Exception as e:
                 console.print(f"[yellow]Warning when closing SSH connection: {str(e)}[/yellow]")
         
+        # Flush events still buffered for Redis
+        if self.redis_config:
+            self.redis_config.close()
+        
         console.print("[green]All monitoring stopped.[/green]")
         
         # Give the threads a moment to clean up
@@ -734,6 +716,7 @@ def get_user_inputs(args):
         "mode": mode,
         "interval": interval,
         "backup_path": backup_path,
+        "restore_strategy": args.restore_strategy,
         "use_redis": use_redis,
         "redis_host": redis_host,
         "redis_port": redis_port,
@@ -751,6 +734,8 @@ def main():
     parser.add_argument("--mode", choices=["passive", "active"], help="Monitoring mode: passive (log only) or active (automatically restore)")
     parser.add_argument("--interval", type=int, help="Monitoring interval in seconds")
     parser.add_argument("--backup-path", help="Custom path for storing backups on the remote server (active mode only)")
+    parser.add_argument("--restore-strategy", choices=["rsync", "swap"], default="rsync",
+                        help="Active mode restore: rsync file by file, or swap in a staged backup copy on large compromises")
     parser.add_argument("--redis-host", default="localhost", help="Redis host")
     parser.add_argument("--redis-port", type=int, default=6379, help="Redis port")
     parser.add_argument("--redis-password", help="Redis password")
@@ -0,0 +1,205 @@
+# cache.py
+"""
+Read-through TTL cache for API responses that every open dashboard polls.
+
+Entries are grouped by namespace (one per endpoint family); a write
+invalidates its namespace so the next read reloads from MySQL, and the TTL
+bounds staleness for changes made outside the API (e.g. new activity).
+
+By default entries live in process memory. With ``API_CACHE_REDIS_URL`` set
+they are kept in Redis instead, one hash per namespace, so every API worker
+shares them and an invalidation in one worker is seen by all.
+
+Each namespace has a generation, bumped on invalidation and kept next to
+the entries (in Redis when that is the backend). Entries are stored with
+the generation read before their load, so a load that raced a write in
+any worker is never served.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+DEFAULT_TTL = 5.0
+REDIS_PREFIX = "antidefacement:cache:"
+REDIS_GENERATION_PREFIX = "antidefacement:cache-generation:"
+
+# Namespaces
+DASHBOARD_STATS = "dashboard_stats"
+SERVERS = "servers"
+ALERT_SETTINGS = "settings:alerts"
+GENERAL_SETTINGS = "settings:general"
+
+
+class MemoryBackend:
+    """Per-process ``{namespace: {key: (expires_at, value)}}``"""
+
+    def __init__(self):
+        self.entries = {}
+        self.generations = Counter()
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key):
+        """``(value or None, current generation)``"""
+        with self.lock:
+            entry = self.entries.get(namespace, {}).get(key)
+            generation = self.generations[namespace]
+        if entry is None or entry[0] < time.monotonic():
+            return None, generation
+        return entry[1], generation
+
+    def set(self, namespace, key, value, ttl, generation):
+        with self.lock:
+            if self.generations[namespace] != generation:
+                return
+            self.entries.setdefault(namespace, {})[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, namespace):
+        with self.lock:
+            self.generations[namespace] += 1
+            self.entries.pop(namespace, None)
+
+    def size(self) -> int:
+        with self.lock:
+            return sum(len(entries) for entries in self.entries.values())
+
+
+class RedisBackend:
+    """Shared entries: one Redis hash per namespace, values as JSON.
+
+    Hash fields cannot expire on their own, so each value is stored with its
+    expiry time and generation, and the hash itself expires ``ttl`` after its
+    last write. The generation is a counter key per namespace: invalidating
+    INCRs it and DELs the hash, and a read only accepts a value stored under
+    the current generation.
+    """
+
+    def __init__(self, client, prefix=REDIS_PREFIX, generation_prefix=REDIS_GENERATION_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.generation_prefix = generation_prefix
+
+    def get(self, namespace, key):
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(self.generation_prefix + namespace)
+            pipe.hget(self.prefix + namespace, key)
+            generation, raw = pipe.execute()
+        generation = int(generation or 0)
+        if raw is None:
+            return None, generation
+        expires_at, stored_generation, value = json.loads(raw)
+        if stored_generation != generation or expires_at < time.time():
+            return None, generation
+        return value, generation
+
+    def set(self, namespace, key, value, ttl, generation):
+        name = self.prefix + namespace
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(name, key, json.dumps([time.time() + ttl, generation, value], default=str))
+            pipe.expire(name, max(1, int(ttl + 0.5)))
+            pipe.execute()
+
+    def invalidate(self, namespace):
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(self.generation_prefix + namespace)
+            pipe.delete(self.prefix + namespace)
+            pipe.execute()
+
+    def size(self) -> int:
+        return sum(self.client.hlen(name) for name in self.client.scan_iter(match=self.prefix + "*"))
+
+
+class ResponseCache:
+    """TTL cache with namespace invalidation and hit/miss metrics"""
+
+    def __init__(self, backend=None, ttl=DEFAULT_TTL):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.stats = {
+            'hits': Counter(),
+            'misses': Counter(),
+            'invalidations': Counter(),
+            'errors': 0
+        }
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        """Return the cached value for ``key`` or store ``loader()``'s result"""
+        key = str(key)
+        try:
+            value, generation = self.backend.get(namespace, key)
+        except Exception:
+            value, generation = None, None
+            self.stats['errors'] += 1
+        if value is not None:
+            self.stats['hits'][namespace] += 1
+            return value
+
+        self.stats['misses'][namespace] += 1
+        value = loader()
+        if generation is None:
+            return value
+        try:
+            # Dropped or never read if the namespace was invalidated meanwhile
+            self.backend.set(namespace, key, value, self.ttl if ttl is None else ttl, generation)
+        except Exception:
+            self.stats['errors'] += 1
+        return value
+
+    def invalidate(self, *namespaces):
+        """Drop every entry of the given namespaces (call after the write commits)"""
+        for namespace in namespaces:
+            try:
+                self.backend.invalidate(namespace)
+            except Exception:
+                self.stats['errors'] += 1
+            self.stats['invalidations'][namespace] += 1
+
+    def metrics(self) -> dict:
+        hits = sum(self.stats['hits'].values())
+        misses = sum(self.stats['misses'].values())
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = None
+        return {
+            'backend': 'redis' if isinstance(self.backend, RedisBackend) else 'memory',
+            'ttl': self.ttl,
+            'entries': size,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+            'errors': self.stats['errors'],
+            'namespaces': {
+                namespace: {
+                    'hits': self.stats['hits'][namespace],
+                    'misses': self.stats['misses'][namespace],
+                    'invalidations': self.stats['invalidations'][namespace]
+                }
+                for namespace in sorted(set(self.stats['hits']) | set(self.stats['misses'])
+                                        | set(self.stats['invalidations']))
+            }
+        }
+
+
+# Singleton instance
+_response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the response cache singleton (API_CACHE_TTL, API_CACHE_REDIS_URL)"""
+    global _response_cache
+    if _response_cache is None:
+        backend = None
+        redis_url = os.getenv("API_CACHE_REDIS_URL")
+        if redis_url:
+            # Imported only when configured, so API workers without it boot without redis
+            try:
+                import redis
+            except ImportError:
+                redis = None
+            if redis is not None:
+                backend = RedisBackend(redis.Redis.from_url(redis_url, decode_responses=True))
+        _response_cache = ResponseCache(backend, ttl=float(os.getenv("API_CACHE_TTL", DEFAULT_TTL)))
+    return _response_cache
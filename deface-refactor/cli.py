@@ -14,6 +14,13 @@ def parse_args():
     parser.add_argument("--redis-host", default="localhost")
     parser.add_argument("--redis-port", type=int, default=6379)
     parser.add_argument("--redis-password")
+    parser.add_argument("--redis-streams", action="store_true", help="Publish events to a Redis stream with consumer groups (needed by the ingester and live WebSocket events)")
+    parser.add_argument("--redis-codec", choices=["json", "binary"], default="json", help="Event encoding on the Redis stream")
     parser.add_argument("--backup-path")
+    parser.add_argument("--restore-workers", type=int, default=8, help="Concurrent restores across all servers")
+    parser.add_argument("--restore-per-host", type=int, default=2, help="Concurrent restores per host")
+    parser.add_argument("--restore-bwlimit", type=int, help="Total restore bandwidth in KiB/s")
+    parser.add_argument("--restore-strategy", choices=["rsync", "swap"], default="rsync",
+                        help="Active mode restore: rsync file by file, or swap in a staged backup copy on large compromises")
 
     return parser.parse_args()
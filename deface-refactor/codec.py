@@ -0,0 +1,227 @@
+# codec.py
+"""
+Versioned monitoring event schema and its compact binary batch codec.
+
+An event (schema v1) is a flat dict::
+
+    {'v': 1, 'kind': 'permission' | 'file', 'host': str, 'timestamp': float,
+     'action': change_type or operation, 'path': str, 'dst_path': str | None,
+     'old_value': str | None, 'new_value': str | None, 'extra': dict | None}
+
+``extra`` carries the monitor's metadata/details as a dict, so an event is
+serialized once instead of nesting JSON strings inside a JSON payload.
+
+A batch is encoded as a header, a string table and fixed-size
+struct-packed records. Every string of the batch (hosts, actions, values)
+is stored once in the table and records refer to it by index; paths are
+split into directory and file name so a batch of changes under the same
+directories stores each directory once.
+"""
+
+import json
+import struct
+import time
+
+SCHEMA_VERSION = 1
+
+MAGIC = b'AE'
+KINDS = ('permission', 'file')
+
+# magic, version, flags, record count, string count
+HEADER = struct.Struct('<2sBBII')
+FLAG_WIDE = 0x01  # string indices are u32 instead of u16
+
+# kind, timestamp, then string refs: host, action, path dir, path name,
+# dst dir, dst name, old value, new value, extra
+RECORD_FIELDS = 'Bd9'
+NARROW_RECORD = struct.Struct('<' + RECORD_FIELDS + 'H')
+WIDE_RECORD = struct.Struct('<' + RECORD_FIELDS + 'I')
+
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+# Reused encoder: json.dumps() with custom separators builds a new one per call
+_encode_extra = json.JSONEncoder(separators=(',', ':')).encode
+
+
+class CodecError(ValueError):
+    """Raised for data that is not a supported event batch"""
+
+
+def permission_event(change: dict, host: str) -> dict:
+    """Build a v1 event from a PermissionMonitor change"""
+    return {
+        'v': SCHEMA_VERSION,
+        'kind': 'permission',
+        'host': host,
+        'timestamp': change['timestamp'],
+        'action': change['change_type'],
+        'path': change['path'],
+        'dst_path': None,
+        'old_value': change.get('old_value'),
+        'new_value': change.get('new_value'),
+        'extra': change.get('metadata')
+    }
+
+
+def file_event(record: dict, details: dict, host: str) -> dict:
+    """Build a v1 event from a FileOperationsMonitor record"""
+    return {
+        'v': SCHEMA_VERSION,
+        'kind': 'file',
+        'host': host,
+        'timestamp': record['timestamp'],
+        'action': record['operation'],
+        'path': record['src_path'],
+        'dst_path': record.get('dst_path'),
+        'old_value': None,
+        'new_value': None,
+        'extra': details
+    }
+
+
+def encode_batch(events) -> bytes:
+    """Encode a list of v1 events"""
+    strings = [None]
+    index = {None: 0}
+
+    def ref(value):
+        i = index.get(value)
+        if i is None:
+            i = index[value] = len(strings)
+            strings.append(value)
+        return i
+
+    values = []
+    append = values.append
+    for event in events:
+        get = event.get
+        extra = get('extra')
+        append(KIND_CODES[event['kind']])
+        append(event['timestamp'])
+        append(ref(get('host')))
+        append(ref(get('action')))
+        for path in (get('path'), get('dst_path')):
+            if path is None:
+                append(0)
+                append(0)
+                continue
+            directory, sep, name = path.rpartition('/')
+            append(ref(directory) if sep else 0)
+            append(ref(name))
+        append(ref(get('old_value')))
+        append(ref(get('new_value')))
+        append(ref(_encode_extra(extra)) if extra is not None else 0)
+
+    wide = len(strings) > 0xFFFF
+    record = WIDE_RECORD if wide else NARROW_RECORD
+    count = len(events)
+
+    encoded = [s.encode('utf-8', 'surrogatepass') for s in strings[1:]]
+    parts = [
+        HEADER.pack(MAGIC, SCHEMA_VERSION, FLAG_WIDE if wide else 0, count, len(encoded)),
+        struct.pack(f'<{len(encoded)}I', *map(len, encoded)),
+        b''.join(encoded),
+        struct.pack('<' + record.format[1:] * count, *values) if count else b''
+    ]
+    return b''.join(parts)
+
+
+def decode_batch(data: bytes) -> list:
+    """Decode bytes produced by encode_batch() into v1 events"""
+    if len(data) < HEADER.size:
+        raise CodecError("truncated event batch")
+    magic, version, flags, count, nstrings = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise CodecError("not an event batch")
+    if version != SCHEMA_VERSION:
+        raise CodecError(f"unsupported event schema version {version}")
+
+    pos = HEADER.size
+    lengths = struct.unpack_from(f'<{nstrings}I', data, pos)
+    pos += 4 * nstrings
+    strings = [None]
+    for length in lengths:
+        strings.append(data[pos:pos + length].decode('utf-8', 'surrogatepass'))
+        pos += length
+
+    record = WIDE_RECORD if flags & FLAG_WIDE else NARROW_RECORD
+    if len(data) - pos != record.size * count:
+        raise CodecError("corrupt event batch")
+
+    def path(d, n):
+        if not n:
+            return None
+        return f"{strings[d]}/{strings[n]}" if d else strings[n]
+
+    extras = {}
+    events = []
+    for kind, ts, host, action, pd, pn, dd, dn, old, new, extra in record.iter_unpack(data[pos:]):
+        if extra and extra not in extras:
+            extras[extra] = json.loads(strings[extra])
+        events.append({
+            'v': version,
+            'kind': KINDS[kind],
+            'host': strings[host],
+            'timestamp': ts,
+            'action': strings[action],
+            'path': path(pd, pn),
+            'dst_path': path(dd, dn),
+            'old_value': strings[old],
+            'new_value': strings[new],
+            'extra': extras[extra] if extra else None
+        })
+    return events
+
+
+def benchmark(count=10000, rounds=5):
+    """Compare the legacy nested-JSON payloads with the binary batch codec"""
+    events = []
+    for i in range(count):
+        site = f"/var/www/site{i % 4}/wp-content/uploads/2026/{i % 12:02d}"
+        if i % 2:
+            events.append(permission_event({
+                'timestamp': 1760000000.0 + i,
+                'change_type': 'chmod',
+                'path': f"{site}/image-{i}.jpg",
+                'old_value': '644',
+                'new_value': '777',
+                'metadata': {'detected_at': '2026-10-19T12:00:00'}
+            }, 'web01.example.com'))
+        else:
+            events.append(file_event({
+                'timestamp': 1760000000.0 + i,
+                'operation': 'MODIFY',
+                'src_path': f"{site}/index-{i}.php",
+                'dst_path': None
+            }, {'old_size': 1024, 'new_size': 2048 + i, 'old_mtime': 1759999000, 'new_mtime': 1760000000 + i},
+                'web01.example.com'))
+
+    def timed(fn):
+        best = float('inf')
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - started)
+        return best, result
+
+    # What the monitors published before: metadata/details as JSON strings inside JSON
+    json_encode, json_payloads = timed(lambda: [json.dumps(dict(e, extra=json.dumps(e['extra']))) for e in events])
+    json_decode, _ = timed(lambda: [dict(e, extra=json.loads(e['extra'])) for e in map(json.loads, json_payloads)])
+    bin_encode, blob = timed(lambda: encode_batch(events))
+    bin_decode, decoded = timed(lambda: decode_batch(blob))
+    assert decoded == events
+
+    json_bytes = sum(len(p) for p in json_payloads)
+    return {
+        'events': count,
+        'json_bytes_per_event': json_bytes / count,
+        'binary_bytes_per_event': len(blob) / count,
+        'json_encode_us_per_event': json_encode / count * 1e6,
+        'binary_encode_us_per_event': bin_encode / count * 1e6,
+        'json_decode_us_per_event': json_decode / count * 1e6,
+        'binary_decode_us_per_event': bin_decode / count * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    for key, value in benchmark().items():
+        print(f"{key:28} {value:,.2f}" if isinstance(value, float) else f"{key:28} {value}")
@@ -1,4 +1,5 @@
 # core/manager.py
+import json
 import os
 import threading
 from datetime import datetime
@@ -25,6 +26,12 @@ except ImportError:
     print("Warning: rsync module not found")
     RsyncBackup = None
 
+try:
+    from scheduler import get_restore_scheduler
+except ImportError:
+    print("Warning: scheduler module not found")
+    get_restore_scheduler = None
+
 try:
     from red import RedisConfig
 except ImportError:
@@ -33,6 +40,9 @@ except ImportError:
 
 console = Console()
 
+# Seconds between restore scheduler metrics lines in active mode
+METRICS_LOG_INTERVAL = 60
+
 class AntiDefacementManager:
     def __init__(self, config):
         self.config = config
@@ -40,20 +50,32 @@ class AntiDefacementManager:
         self.stop_event = threading.Event()
         self.monitors = []
         self.redis = None
+        self.scheduler = None
 
         # مسیر لاگ و بکاپ
         self.backup_dir = f"logs_{self.config['host']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         os.makedirs(self.backup_dir, exist_ok=True)
+        # Names the host for the ingester's SQLite tailer (ingest.py)
+        with open(os.path.join(self.backup_dir, "monitor_info.json"), "w") as f:
+            json.dump({"host": self.config['host'], "path": self.config['path'], "mode": self.config['mode']}, f)
 
     def setup_redis(self):
         if self.config.get("use_redis") and RedisConfig:
             self.redis = RedisConfig(
                 host=self.config['redis_host'],
                 port=self.config['redis_port'],
-                password=self.config['redis_password']
+                password=self.config['redis_password'],
+                use_streams=self.config.get('redis_streams', False),
+                spool_dir=os.path.join(self.backup_dir, "redis_spool"),
+                codec=self.config.get('redis_codec', 'json')
             )
             if self.redis.connect():
                 console.print("[green]✓ Redis connected[/green]")
+                if not self.redis.use_streams:
+                    console.print("[yellow]Publishing to Redis lists: the ingester and live events "
+                                  "only read the stream (--redis-streams)[/yellow]")
+            elif self.redis.is_spooling():
+                console.print("[yellow]Redis unavailable, spooling events to disk until it returns[/yellow]")
             else:
                 console.print("[yellow]Redis connection failed, fallback to local mode[/yellow]")
                 self.redis = None
@@ -92,6 +114,8 @@ class AntiDefacementManager:
                 monitor_config=file_config,
                 db_path=os.path.join(self.backup_dir, "files.db")
             )
+            if self.redis:
+                file_monitor.redis = self.redis
             self.monitors.append(file_monitor)
             threading.Thread(target=file_monitor.start, daemon=True).start()
 
@@ -104,7 +128,19 @@ class AntiDefacementManager:
                 source=self.config['path'],
                 backup_path=self.config['backup_path']
             )
-            threading.Thread(target=rsync.run_restore_loop, args=(self.stop_event,), daemon=True).start()
+            # Every restore loop in the process shares one fleet-wide scheduler
+            if get_restore_scheduler:
+                self.scheduler = get_restore_scheduler(
+                    max_workers=self.config.get('restore_workers', 8),
+                    per_host_limit=self.config.get('restore_per_host', 2),
+                    bandwidth_kbps=self.config.get('restore_bwlimit')
+                )
+            threading.Thread(
+                target=rsync.run_restore_loop,
+                args=(self.stop_event,),
+                kwargs={'scheduler': self.scheduler, 'strategy': self.config.get('restore_strategy', 'rsync')},
+                daemon=True
+            ).start()
             console.print("[green]✓ Active restore loop started[/green]")
         else:
             console.print("[yellow]Active mode not available or RsyncBackup not found[/yellow]")
@@ -116,15 +152,29 @@ class AntiDefacementManager:
         if self.config['mode'] == "active":
             self.start_restore()
         try:
-            while not self.stop_event.is_set():
-                pass
+            while not self.stop_event.wait(METRICS_LOG_INTERVAL):
+                self.log_metrics()
         except KeyboardInterrupt:
             self.stop()
 
+    def log_metrics(self):
+        if not self.scheduler:
+            return
+        m = self.scheduler.metrics()
+        console.print(f"[blue]Restores: {m['completed']} ok, {m['failed']} failed, "
+                      f"{m['coalesced']} coalesced, queue {m['queue_depth']}, running {m['running']}, "
+                      f"avg wait {m['avg_wait_seconds']:.2f}s, avg runtime {m['avg_runtime_seconds']:.2f}s[/blue]")
+
     def stop(self):
         console.print("[yellow]Stopping Anti-Defacement...[/yellow]")
         self.stop_event.set()
+        if self.scheduler:
+            self.log_metrics()
+            self.scheduler.stop()
         for monitor in self.monitors:
             if hasattr(monitor, "stop"):
                 monitor.stop()
+        if self.redis:
+            # Don't lose events still buffered in the batching publisher
+            self.redis.close()
         console.print("[green]✓ All stopped[/green]")
@@ -5,14 +5,42 @@ Database module - MySQL only for production use
 
 import os
 from typing import Optional
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, BigInteger
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, Float, BigInteger, UniqueConstraint, Index, text
+from sqlalchemy.exc import ProgrammingError, SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 
 Base = declarative_base()
 
+# Bump when the models or init_database.sql change; stored in settings
+SCHEMA_VERSION = 2
+SCHEMA_VERSION_KEY = "schema_version"
+# Named lock serializing schema creation between workers starting together
+SCHEMA_LOCK = "antidefacement_schema"
+SCHEMA_LOCK_TIMEOUT = 60
+# MySQL "Table doesn't exist"
+ER_NO_SUCH_TABLE = 1146
+
+# Sets activity_logs.created_at from the event timestamp for every writer, so
+# created_at (the partitioning column) is always within 1 s below timestamp
+# and can bound timestamp queries for partition pruning
+CREATED_AT_TRIGGER = "activity_logs_created_at"
+CREATED_AT_TRIGGER_SQL = (
+    f"CREATE TRIGGER {CREATED_AT_TRIGGER} BEFORE INSERT ON activity_logs FOR EACH ROW "
+    "SET NEW.created_at = FROM_UNIXTIME(FLOOR(NEW.timestamp))"
+)
+
+
+def event_created_at(timestamp: float) -> datetime:
+    """created_at of an activity row: its event time in UTC, whole seconds"""
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc).replace(tzinfo=None)
+
+
+def _default_created_at(context):
+    return event_created_at(context.get_current_parameters()['timestamp'])
+
 # Database Models
 
 class Server(Base):
@@ -45,8 +73,18 @@ class Setting(Base):
 
 class Activity(Base):
     __tablename__ = "activity_logs"
+    # Partitioned by day on created_at (retention.py); MySQL requires the
+    # partitioning column in every unique key
+    __table_args__ = (
+        UniqueConstraint('event_id', 'created_at', name='uq_event_id'),
+        # Keyset pagination of the activity endpoints (api.query_activity)
+        Index('idx_type_timestamp', 'activity_type', 'timestamp'),
+        Index('idx_server_type_timestamp', 'server_id', 'activity_type', 'timestamp'),
+        Index('idx_path', 'path', mysql_length=191),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(String(40), nullable=True)  # content hash set by ingest.py
     timestamp = Column(Float, nullable=False)
     server_id = Column(Integer, nullable=False)
     server_name = Column(String(255), nullable=False)
@@ -59,7 +97,18 @@ class Activity(Base):
     old_value = Column(Text, nullable=True)
     new_value = Column(Text, nullable=True)
     details = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=_default_created_at)
+
+
+class ActivityRollup(Base):
+    """Event counts per server and type, maintained by the ingester (rollups.py)"""
+    __tablename__ = "activity_rollups"
+    
+    granularity = Column(String(10), primary_key=True)  # 'minute', 'hour' or 'day'
+    bucket_start = Column(BigInteger, primary_key=True)  # epoch seconds, UTC-aligned
+    server_id = Column(Integer, primary_key=True)
+    activity_type = Column(String(50), primary_key=True)  # 'permission', 'file' or 'restored'
+    count = Column(BigInteger, nullable=False, default=0)
 
 
 class Backup(Base):
@@ -102,18 +151,24 @@ class DatabaseManager:
             )
         
         self.db_url = db_url
+        self.pool_size = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "20"))
         self.engine = create_engine(
             db_url,
             pool_pre_ping=True,
             pool_recycle=3600,
-            pool_size=10,
-            max_overflow=20,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            # created_at is written as naive UTC and activity_logs is partitioned
+            # by UTC day, so every session has to run in UTC
+            connect_args={'init_command': "SET time_zone = '+00:00'"},
             echo=False
         )
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
         
-        # Create all tables
-        self._create_tables()
+        # One query on a current schema; tables are only created when it is
+        # missing or older (or always with DB_AUTO_CREATE_SCHEMA=true)
+        self.ensure_schema()
         
         logging.info("Database initialized: MySQL")
     
@@ -124,6 +179,76 @@ class DatabaseManager:
     def _create_tables(self):
         """Create all database tables"""
         Base.metadata.create_all(bind=self.engine)
+        self._create_triggers()
+
+    def _create_triggers(self):
+        with self.engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT COUNT(*) FROM information_schema.TRIGGERS "
+                "WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = :name"
+            ), {'name': CREATED_AT_TRIGGER}).scalar()
+            if exists:
+                return
+            try:
+                conn.execute(text(CREATED_AT_TRIGGER_SQL))
+            except SQLAlchemyError as e:
+                # e.g. missing TRIGGER privilege; writers then have to set created_at themselves
+                logging.warning(f"Could not create trigger {CREATED_AT_TRIGGER}: {e}")
+
+    def schema_version(self) -> Optional[int]:
+        """The schema version recorded in settings, or None if there is none"""
+        try:
+            with self.engine.connect() as conn:
+                value = conn.execute(
+                    text("SELECT value FROM settings WHERE `key` = :key"),
+                    {'key': SCHEMA_VERSION_KEY}
+                ).scalar()
+        except ProgrammingError as e:
+            if getattr(e.orig, 'args', (None,))[0] != ER_NO_SUCH_TABLE:
+                raise
+            # No settings table yet
+            return None
+        try:
+            return int(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def ensure_schema(self) -> bool:
+        """Create the tables unless the recorded schema version is current.
+
+        Runs under a MySQL named lock, so workers starting together on a
+        fresh database create it once. Returns True if create_all ran.
+        """
+        force = os.getenv("DB_AUTO_CREATE_SCHEMA", "false").lower() in ("1", "true", "yes")
+        version = self.schema_version()
+        if version is not None and version >= SCHEMA_VERSION and not force:
+            if version > SCHEMA_VERSION:
+                logging.warning(f"Database schema version {version} is newer than this code ({SCHEMA_VERSION})")
+            return False
+
+        with self.engine.connect() as lock_conn:
+            acquired = lock_conn.execute(
+                text("SELECT GET_LOCK(:name, :timeout)"),
+                {'name': SCHEMA_LOCK, 'timeout': SCHEMA_LOCK_TIMEOUT}
+            ).scalar()
+            if acquired != 1:
+                raise RuntimeError(f"Timed out waiting for the {SCHEMA_LOCK} lock")
+            try:
+                # Another worker may have finished while we waited
+                version = self.schema_version()
+                if version is not None and version >= SCHEMA_VERSION and not force:
+                    return False
+                self._create_tables()
+                with self.engine.begin() as conn:
+                    conn.execute(
+                        text("INSERT INTO settings (`key`, value) VALUES (:key, :value) "
+                             "ON DUPLICATE KEY UPDATE value = VALUES(value)"),
+                        {'key': SCHEMA_VERSION_KEY, 'value': str(SCHEMA_VERSION)}
+                    )
+            finally:
+                lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': SCHEMA_LOCK})
+        logging.info(f"Database schema created/updated to version {SCHEMA_VERSION}")
+        return True
     
     def get_session(self) -> Session:
         """Get database session"""
@@ -0,0 +1,485 @@
+# ingest.py
+"""
+Central ingestion service: loads monitor events into the activity_logs table.
+
+Events come either from the Redis event stream (consumer group 'ingester')
+or by tailing the per-monitor SQLite databases under ``logs_*``. Rows are
+written with multi-row INSERTs; every row carries a content-derived
+``event_id`` so the same event ingested twice (replay, reclaim, both
+sources enabled) is stored once.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from rich.console import Console
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from database import Activity, Server, event_created_at, get_db_manager
+from rollups import apply_rollups
+
+console = Console()
+
+# Queue names the monitors publish to (see add_to_queue callers)
+PERMISSION_QUEUE = "perm_changes"
+FILE_QUEUE = "file_ops"
+
+# SQLite tables written by PermissionMonitor and FileOperationsMonitor
+SQLITE_TABLES = {
+    'permission_changes': 'permission',
+    'file_operations': 'file'
+}
+
+WATERMARK_FILE = "ingest_watermarks.json"
+
+# Files in a logs_* directory naming the monitored host (core/manager.py, bk.py)
+HOST_INFO_FILES = ("monitor_info.json", "backup_info.json")
+# Fallback when there is none; hostnames may contain '_', so parse from the right:
+# logs_<host>_<YYYYmmdd>_<HHMMSS> (core/manager.py), logs_<host>_<port>_<path> (bk.py)
+LOGS_DIR_PATTERNS = (
+    re.compile(r'^logs_(?P<host>.+)_\d{8}_\d{6}$'),
+    re.compile(r'^logs_(?P<host>.+?)_\d{1,5}_'),
+)
+
+
+def make_event_id(host: str, row: dict) -> str:
+    """Deterministic id of an event: same host and content give the same id"""
+    key = '|'.join(str(row.get(field)) for field in (
+        'activity_type', 'timestamp', 'change_type', 'operation',
+        'path', 'src_path', 'dst_path', 'old_value', 'new_value'
+    ))
+    return hashlib.sha1(f"{host}|{key}".encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _as_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _as_timestamp(value):
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+    return float(value) if value is not None else time.time()
+
+
+def normalize_event(event: dict, activity_type: Optional[str] = None) -> Optional[dict]:
+    """Turn a monitor event into an activity row (without server columns).
+
+    Accepts codec.py v1 events, the PermissionMonitor change dict, the
+    FileOperationsMonitor record, and bk.py's ``{'type', 'host', 'data'}``
+    envelope.
+    """
+    if 'kind' in event and 'v' in event:
+        permission = event['kind'] == 'permission'
+        return {
+            'activity_type': event['kind'],
+            'timestamp': _as_timestamp(event['timestamp']),
+            'change_type': event['action'] if permission else None,
+            'operation': None if permission else event['action'],
+            'path': event['path'],
+            'src_path': None if permission else event['path'],
+            'dst_path': event['dst_path'],
+            'old_value': event['old_value'],
+            'new_value': event['new_value'],
+            'details': _as_text(event['extra']),
+            'host': event['host']
+        }
+
+    host = event.get('host')
+    if isinstance(event.get('data'), dict):
+        # bk.py envelope: the change itself is under 'data'
+        data = dict(event['data'])
+        data.setdefault('timestamp', event.get('timestamp'))
+        data.setdefault('host', host)
+        event, host = data, data.get('host')
+
+    if activity_type is None:
+        if 'change_type' in event:
+            activity_type = 'permission'
+        elif 'operation' in event:
+            activity_type = 'file'
+        else:
+            return None
+
+    if activity_type == 'permission':
+        row = {
+            'activity_type': 'permission',
+            'timestamp': _as_timestamp(event.get('timestamp')),
+            'change_type': event.get('change_type'),
+            'operation': None,
+            'path': event.get('path'),
+            'src_path': None,
+            'dst_path': None,
+            'old_value': _as_text(event.get('old_value')),
+            'new_value': _as_text(event.get('new_value')),
+            'details': _as_text(event.get('metadata'))
+        }
+    else:
+        row = {
+            'activity_type': 'file',
+            'timestamp': _as_timestamp(event.get('timestamp')),
+            'change_type': None,
+            'operation': event.get('operation'),
+            'path': event.get('src_path'),
+            'src_path': event.get('src_path'),
+            'dst_path': event.get('dst_path'),
+            'old_value': None,
+            'new_value': None,
+            'details': _as_text(event.get('details'))
+        }
+    row['host'] = host
+    return row
+
+
+def normalize_entry(queue_name: Optional[str], event: dict) -> Optional[dict]:
+    """normalize_event() for a stream entry, typed by the queue it was published to"""
+    if 'kind' in event:
+        return normalize_event(event)
+    if queue_name == PERMISSION_QUEUE:
+        return normalize_event(event, 'permission')
+    if queue_name == FILE_QUEUE:
+        return normalize_event(event, 'file')
+    return normalize_event(event)
+
+
+class ServerDirectory:
+    """Maps (host, path) of an event to the registered server"""
+
+    def __init__(self, db_manager, refresh_interval=60):
+        self.db_manager = db_manager
+        self.refresh_interval = refresh_interval
+        self.by_host = {}
+        self.loaded_at = 0
+
+    def _load(self):
+        session = self.db_manager.get_session()
+        try:
+            by_host = {}
+            for server in session.query(Server.id, Server.name, Server.host, Server.path).all():
+                by_host.setdefault(server.host, []).append(
+                    (server.path.rstrip('/'), server.id, server.name)
+                )
+            # Longest monitored path first so nested sites win
+            for servers in by_host.values():
+                servers.sort(key=lambda s: len(s[0]), reverse=True)
+            self.by_host = by_host
+            self.loaded_at = time.time()
+        finally:
+            session.close()
+
+    def lookup(self, host: str, path: Optional[str]):
+        """Return (server_id, server_name) or None for an unknown host"""
+        now = time.time()
+        # Unknown hosts trigger an early reload, at most every few seconds
+        if now - self.loaded_at > self.refresh_interval or (host not in self.by_host and now - self.loaded_at > 5):
+            self._load()
+        servers = self.by_host.get(host)
+        if not servers:
+            return None
+        if path:
+            for server_path, server_id, name in servers:
+                if path == server_path or path.startswith(server_path + '/'):
+                    return server_id, name
+        # Path outside every registered root: attribute to the host's broadest entry
+        _, server_id, name = servers[-1]
+        return server_id, name
+
+
+class ActivityIngester:
+    """Bulk-loads normalized events into activity_logs"""
+
+    def __init__(self, db_manager=None, batch_size=1000):
+        self.db_manager = db_manager or get_db_manager()
+        self.batch_size = batch_size
+        self.servers = ServerDirectory(self.db_manager)
+        self.console = console
+        self.lock = threading.Lock()
+        self.stats = {
+            'received': 0,
+            'inserted': 0,
+            'duplicates': 0,
+            'unmapped': 0,
+            'batches': 0,
+            'errors': 0
+        }
+        self.started_at = time.time()
+        self.last_unmapped_report = 0
+
+    def unmapped(self, event: dict) -> bool:
+        """True for an event whose host is not (yet) a registered server"""
+        host = event.get('host')
+        return bool(host) and self.servers.lookup(host, event.get('path')) is None
+
+    def _insert(self, session, rows: List[dict]) -> List[dict]:
+        """INSERT IGNORE ``rows``; returns the ones this transaction inserted"""
+        # One multi-row INSERT; affected rows count only the rows inserted
+        savepoint = session.begin_nested()
+        if session.execute(mysql_insert(Activity.__table__).values(rows).prefix_with('IGNORE')).rowcount == len(rows):
+            savepoint.commit()
+            return rows
+        # A concurrent writer stored some of them first: redo row by row to
+        # learn which ones are ours, so the rollups count each event once
+        savepoint.rollback()
+        return [row for row in rows
+                if session.execute(mysql_insert(Activity.__table__).values(row).prefix_with('IGNORE')).rowcount]
+
+    def _to_rows(self, events: List[dict]) -> List[dict]:
+        rows = []
+        unmapped = set()
+        for event in events:
+            host = event.pop('host', None)
+            server = self.servers.lookup(host, event.get('path')) if host else None
+            if server is None:
+                unmapped.add(host)
+                continue
+            event['server_id'], event['server_name'] = server
+            event['event_id'] = make_event_id(host, event)
+            # Event time, not ingest time: created_at picks the daily partition
+            # and is part of the event_id unique key, so it must be stable
+            event['created_at'] = event_created_at(event['timestamp'])
+            rows.append(event)
+
+        if unmapped:
+            with self.lock:
+                self.stats['unmapped'] += len(events) - len(rows)
+            if time.time() - self.last_unmapped_report > 60:
+                self.last_unmapped_report = time.time()
+                self.console.print(f"[yellow]Holding events from unregistered hosts until they are added: "
+                                   f"{', '.join(map(str, unmapped))}[/yellow]")
+        return rows
+
+    def write(self, events: List[dict]) -> int:
+        """Insert normalized events; returns the number of new rows"""
+        rows = self._to_rows(events)
+        inserted = 0
+        if rows:
+            session = self.db_manager.get_session()
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    chunk = rows[start:start + self.batch_size]
+                    # Skip events stored by an earlier run so the rollups count each event once
+                    existing = {event_id for (event_id,) in session.query(Activity.event_id).filter(
+                        Activity.event_id.in_([row['event_id'] for row in chunk]),
+                        # Lets MySQL prune to the partitions the chunk falls in
+                        Activity.created_at.between(min(row['created_at'] for row in chunk),
+                                                    max(row['created_at'] for row in chunk))
+                    )}
+                    fresh = [row for row in chunk if row['event_id'] not in existing]
+                    if not fresh:
+                        continue
+                    added = self._insert(session, fresh)
+                    inserted += len(added)
+                    apply_rollups(session, added)
+                session.commit()
+            except Exception:
+                session.rollback()
+                with self.lock:
+                    self.stats['errors'] += 1
+                raise
+            finally:
+                session.close()
+
+        with self.lock:
+            self.stats['received'] += len(events)
+            self.stats['inserted'] += inserted
+            self.stats['duplicates'] += len(rows) - inserted
+            self.stats['batches'] += 1
+        return inserted
+
+    def run_stream(self, redis_config, stop_event, consumer_name=None):
+        """Drain the Redis event stream as a member of the 'ingester' group"""
+        from red import StreamConsumer
+
+        consumer = StreamConsumer(
+            redis_config, 'ingester',
+            consumer_name or f"{socket.gethostname()}-{os.getpid()}",
+            count=self.batch_size
+        )
+        consumer.ensure_group()
+        self.console.print(f"[green]✓ Ingesting from Redis stream {consumer.stream} as {consumer.consumer}[/green]")
+
+        while not stop_event.is_set():
+            try:
+                entries = consumer.read()
+                if not entries:
+                    continue
+                events = []
+                held = set()
+                for entry_id, queue_name, event in entries:
+                    row = normalize_entry(queue_name, event) if event is not None else None
+                    if row is not None:
+                        events.append(row)
+                        if self.unmapped(row):
+                            held.add(entry_id)
+                self.write(events)
+                # Ack only after the rows are committed; a crash before this
+                # leaves them pending for another ingester to reclaim. Entries
+                # from unregistered hosts stay pending too and are retried by
+                # reclaim until their server is added (rewrites are deduplicated)
+                consumer.ack([entry_id for entry_id, _, _ in entries if entry_id not in held])
+            except Exception as e:
+                self.console.print(f"[red]Stream ingestion error: {str(e)}[/red]")
+                time.sleep(1)
+
+    def run_sqlite(self, stop_event, logs_dir='.', poll_interval=1, watermark_path=None):
+        """Tail the monitors' SQLite databases by rowid watermark"""
+        watermark_path = watermark_path or os.path.join(logs_dir, WATERMARK_FILE)
+        tailer = SQLiteTailer(logs_dir, watermark_path, self.batch_size)
+        self.console.print(f"[green]✓ Ingesting from SQLite logs under {os.path.abspath(logs_dir)}[/green]")
+
+        while not stop_event.is_set():
+            try:
+                drained = False
+                for source, events, last_id in tailer.poll():
+                    held = any(self.unmapped(event) for event in events)
+                    self.write(events)
+                    # Keep the watermark of a source whose host is not registered
+                    # yet, so its rows are ingested once the server is added
+                    if held:
+                        continue
+                    tailer.commit(source, last_id)
+                    drained = drained or len(events) == self.batch_size
+                if not drained:
+                    stop_event.wait(poll_interval)
+            except Exception as e:
+                self.console.print(f"[red]SQLite ingestion error: {str(e)}[/red]")
+                stop_event.wait(poll_interval)
+
+    def metrics(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        stats['events_per_second'] = stats['received'] / max(time.time() - self.started_at, 1e-9)
+        return stats
+
+
+class SQLiteTailer:
+    """Reads new rows from ``logs_<host>_*/*.db`` files past a stored watermark"""
+
+    def __init__(self, logs_dir, watermark_path, batch_size=1000):
+        self.logs_dir = logs_dir
+        self.watermark_path = watermark_path
+        self.batch_size = batch_size
+        self.watermarks = {}
+        if os.path.exists(watermark_path):
+            with open(watermark_path) as f:
+                self.watermarks = json.load(f)
+
+    def sources(self):
+        """Yield (db_path, table, activity_type, host) for every monitor database"""
+        for db_path in sorted(glob.glob(os.path.join(self.logs_dir, 'logs_*', '*.db'))):
+            host = self.host_of(os.path.dirname(db_path))
+            if host is None:
+                continue
+            try:
+                conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+                try:
+                    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                continue
+            for table, activity_type in SQLITE_TABLES.items():
+                if table in tables:
+                    yield db_path, table, activity_type, host
+
+    @staticmethod
+    def host_of(log_dir) -> Optional[str]:
+        """The monitored host of a logs_* directory"""
+        for name in HOST_INFO_FILES:
+            try:
+                with open(os.path.join(log_dir, name)) as f:
+                    host = json.load(f).get('host')
+                if host:
+                    return host
+            except (OSError, ValueError, AttributeError):
+                continue
+        dirname = os.path.basename(os.path.normpath(log_dir))
+        for pattern in LOGS_DIR_PATTERNS:
+            match = pattern.match(dirname)
+            if match:
+                return match.group('host')
+        return None
+
+    def poll(self):
+        """Yield (source_key, normalized_events, last_rowid) batches"""
+        for db_path, table, activity_type, host in self.sources():
+            source = f"{os.path.abspath(db_path)}:{table}"
+            watermark = self.watermarks.get(source, 0)
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = conn.execute(
+                    f"SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                    (watermark, self.batch_size)
+                ).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                continue
+            events = []
+            for row in rows:
+                event = dict(row)
+                event['host'] = host
+                events.append(normalize_event(event, activity_type))
+            yield source, events, rows[-1]['id']
+
+    def commit(self, source, last_id):
+        """Advance a source's watermark once its rows are stored"""
+        self.watermarks[source] = last_id
+        tmp = self.watermark_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.watermarks, f)
+        os.replace(tmp, self.watermark_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Anti-Defacement activity ingester")
+    parser.add_argument("--source", choices=["redis", "sqlite"], default="redis")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-password")
+    parser.add_argument("--consumer", help="Consumer name within the 'ingester' group")
+    parser.add_argument("--logs-dir", default=".", help="Directory holding the logs_* monitor folders")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ingester = ActivityIngester(batch_size=args.batch_size)
+    stop_event = threading.Event()
+    try:
+        if args.source == "redis":
+            from red import RedisConfig
+            redis_config = RedisConfig(
+                host=args.redis_host,
+                port=args.redis_port,
+                password=args.redis_password,
+                batching=False
+            )
+            if not redis_config.connect():
+                return
+            ingester.run_stream(redis_config, stop_event, args.consumer)
+        else:
+            ingester.run_sqlite(stop_event, args.logs_dir)
+    except KeyboardInterrupt:
+        stop_event.set()
+        console.print(f"[yellow]Ingester stopped: {ingester.metrics()}[/yellow]")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@
 USE antidefacement;
 
 -- Drop existing tables if they exist (be careful in production!)
+-- DROP TABLE IF EXISTS activity_rollups;
 -- DROP TABLE IF EXISTS activity_logs;
 -- DROP TABLE IF EXISTS backups;
 -- DROP TABLE IF EXISTS settings;
@@ -47,8 +48,13 @@ CREATE TABLE IF NOT EXISTS settings (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ==================== Activity Logs Table ====================
+-- Partitioned by day on created_at; retention.py adds upcoming daily
+-- partitions and drops the ones older than general_log_retention_days.
+-- Partitioning requires created_at in every unique key and rules out a
+-- foreign key to servers.
 CREATE TABLE IF NOT EXISTS activity_logs (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
+    event_id CHAR(40) NULL COMMENT 'content hash set by the ingester, makes re-ingestion idempotent',
     timestamp DOUBLE NOT NULL,
     server_id INT NOT NULL,
     server_name VARCHAR(255) NOT NULL,
@@ -61,13 +67,43 @@ CREATE TABLE IF NOT EXISTS activity_logs (
     old_value TEXT,
     new_value TEXT,
     details TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at),
     INDEX idx_timestamp (timestamp),
     INDEX idx_server_id (server_id),
     INDEX idx_activity_type (activity_type),
     INDEX idx_server_timestamp (server_id, timestamp),
+    INDEX idx_type_timestamp (activity_type, timestamp),
+    INDEX idx_server_type_timestamp (server_id, activity_type, timestamp),
+    INDEX idx_path (path(191)),
     INDEX idx_created_at (created_at),
-    FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE
+    UNIQUE KEY uq_event_id (event_id, created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Existing installations:
+-- ALTER TABLE activity_logs ADD COLUMN event_id CHAR(40) NULL AFTER id;
+-- python retention.py --migrate
+-- ALTER TABLE activity_logs ADD INDEX idx_type_timestamp (activity_type, timestamp),
+--     ADD INDEX idx_server_type_timestamp (server_id, activity_type, timestamp), ADD INDEX idx_path (path(191));
+
+-- created_at always follows the event timestamp (floored to the second), so the
+-- API can bound created_at for partition pruning (database.CREATED_AT_TRIGGER)
+DROP TRIGGER IF EXISTS activity_logs_created_at;
+CREATE TRIGGER activity_logs_created_at BEFORE INSERT ON activity_logs FOR EACH ROW
+SET NEW.created_at = FROM_UNIXTIME(FLOOR(NEW.timestamp));
+
+-- ==================== Activity Rollups Table ====================
+-- Per-server event counts per minute/hour/day, incremented by the ingester
+CREATE TABLE IF NOT EXISTS activity_rollups (
+    granularity VARCHAR(10) NOT NULL COMMENT 'minute, hour or day',
+    bucket_start BIGINT NOT NULL COMMENT 'bucket start, epoch seconds',
+    server_id INT NOT NULL,
+    activity_type VARCHAR(50) NOT NULL COMMENT 'permission, file or restored',
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket_start, server_id, activity_type)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ==================== Backups Table ====================
@@ -134,11 +170,17 @@ INSERT INTO settings (`key`, value) VALUES
     ('general_log_level', 'INFO')
 ON DUPLICATE KEY UPDATE `key`=`key`;
 
+-- Schema version checked by the API at startup (database.SCHEMA_VERSION);
+-- with it in place workers skip creating tables
+INSERT INTO settings (`key`, value) VALUES ('schema_version', '2')
+ON DUPLICATE KEY UPDATE value=VALUES(value);
+
 -- ==================== Verification Queries ====================
 -- Run these to verify the database is set up correctly:
 -- SHOW TABLES;
 -- DESCRIBE servers;
 -- DESCRIBE activity_logs;
+-- DESCRIBE activity_rollups;
 -- DESCRIBE backups;
 -- DESCRIBE settings;
 -- DESCRIBE users;
@@ -0,0 +1,195 @@
+# live.py
+"""
+Live relay of monitoring events to the API's WebSocket clients.
+
+A background thread tails the Redis event stream, attributes each event to
+its server and queues it for the ``activity``, ``server:{id}`` and
+``alerts`` topics. A task on the event loop flushes the queues every
+``batch_interval`` seconds as one frame per topic, so a burst of changes
+costs a handful of frames instead of one per event per client.
+
+Frames::
+
+    {"type": "activity", "topic": "activity" | "server:{id}", "data": [activity, ...]}
+    {"type": "alerts", "topic": "alerts", "data": [alert, ...]}
+
+with items shaped like the /api/activity and /api/alerts responses.
+
+Only events published to the Redis stream are relayed, i.e. monitors must
+run with ``--redis-streams`` (the ingester needs it too). The default list
+transport cannot be tailed: its entries are popped by whoever reads them.
+
+The bundled dashboard consumes the ``alerts`` topic (recent alerts); the
+``activity`` and ``server:{id}`` topics are for clients that subscribe to
+them, the Activity/Files/Permissions pages do not yet.
+"""
+
+import asyncio
+import os
+import threading
+from datetime import datetime
+
+from rich.console import Console
+
+from ingest import ServerDirectory, make_event_id, normalize_entry
+
+console = Console()
+
+ACTIVITY_TOPIC = "activity"
+ALERTS_TOPIC = "alerts"
+
+# Alert severity is derived from the activity type (as in /api/alerts)
+SEVERITIES = {"permission": "critical", "file": "warning"}
+
+
+def format_activity(row: dict) -> dict:
+    """An activity item as returned by /api/activity"""
+    item = {
+        "event_id": row["event_id"],
+        "server_id": row["server_id"],
+        "timestamp": row["timestamp"],
+        "server": row["server_name"],
+        "type": row["activity_type"],
+    }
+    if row["activity_type"] == "permission":
+        item.update({
+            "change_type": row["change_type"],
+            "path": row["path"],
+            "details": f"{row['old_value']} → {row['new_value']}" if row["old_value"] and row["new_value"] else row["details"]
+        })
+    else:
+        item.update({
+            "operation": row["operation"],
+            "src_path": row["src_path"],
+            "dst_path": row["dst_path"]
+        })
+    return item
+
+
+def format_alert(row: dict) -> dict:
+    """An alert item as returned by /api/alerts"""
+    return {
+        "event_id": row["event_id"],
+        "server_id": row["server_id"],
+        "time": datetime.fromtimestamp(row["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"),
+        "server": row["server_name"],
+        "type": row["change_type"] or row["operation"] or row["activity_type"],
+        "severity": SEVERITIES.get(row["activity_type"], "warning"),
+        "path": row["path"] or row["src_path"]
+    }
+
+
+class LiveRelay:
+    """Relays events from the Redis stream to WebSocket topics in batches"""
+
+    def __init__(self, redis_config, ws_manager, db_manager, batch_interval=0.25, max_batch=200):
+        from red import StreamTail
+
+        self.tail = StreamTail(redis_config)
+        self.ws_manager = ws_manager
+        self.servers = ServerDirectory(db_manager)
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.console = console
+        self.lock = threading.Lock()
+        self.pending = {}  # topic -> (message type, [items])
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.flusher = None
+        self.stats = {'events': 0, 'unmapped': 0, 'frames': 0}
+
+    def _queue(self, topic, message_type, item):
+        self.pending.setdefault(topic, (message_type, []))[1].append(item)
+
+    def relay(self, entries):
+        """Attribute stream entries to servers and queue them per topic"""
+        queued = 0
+        for _, queue_name, event in entries:
+            row = normalize_entry(queue_name, event) if event is not None else None
+            if row is None:
+                continue
+            host = row.pop('host', None)
+            server = self.servers.lookup(host, row.get('path')) if host else None
+            if server is None:
+                self.stats['unmapped'] += 1
+                continue
+            row['server_id'], row['server_name'] = server
+            # Same id the ingester stores, so clients can dedupe against REST pages
+            row['event_id'] = make_event_id(host, row)
+
+            activity = format_activity(row)
+            with self.lock:
+                self._queue(ACTIVITY_TOPIC, "activity", activity)
+                self._queue(f"server:{row['server_id']}", "activity", activity)
+                self._queue(ALERTS_TOPIC, "alerts", format_alert(row))
+            queued += 1
+        self.stats['events'] += queued
+        return queued
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                entries = self.tail.read()
+                if entries:
+                    self.relay(entries)
+            except Exception as e:
+                self.console.print(f"[red]Live relay error: {str(e)}[/red]")
+                self.stop_event.wait(1)
+
+    async def flush(self):
+        """Send everything queued since the last flush, one frame per topic"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for topic, (message_type, items) in pending.items():
+            for start in range(0, len(items), self.max_batch):
+                await self.ws_manager.broadcast_to_topic(topic, {
+                    "type": message_type,
+                    "topic": topic,
+                    "data": items[start:start + self.max_batch]
+                })
+                self.stats['frames'] += 1
+
+    async def _flush_loop(self):
+        while not self.stop_event.is_set():
+            await asyncio.sleep(self.batch_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.console.print(f"[red]Live relay flush error: {str(e)}[/red]")
+
+    def start(self):
+        """Start the stream thread and the flush task (call from the event loop)"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="live-relay", daemon=True)
+        self.thread.start()
+        self.flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        self.console.print(f"[green]✓ Relaying live events from {self.tail.stream} to WebSocket topics[/green]")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.flusher:
+            self.flusher.cancel()
+
+
+def start_live_relay(ws_manager, db_manager):
+    """Start a LiveRelay when REDIS_ENABLED is set; returns it or None"""
+    if os.getenv("REDIS_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    from red import EVENT_STREAM, RedisConfig
+
+    redis_config = RedisConfig(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+        batching=False
+    )
+    if not redis_config.connect():
+        console.print("[yellow]Live events disabled: Redis unavailable[/yellow]")
+        return None
+    if not redis_config.connection.exists(EVENT_STREAM):
+        console.print(f"[yellow]No events in {EVENT_STREAM} yet; live events need monitors "
+                      f"started with --redis-streams[/yellow]")
+    relay = LiveRelay(redis_config, ws_manager, db_manager,
+                      batch_interval=float(os.getenv("LIVE_BATCH_INTERVAL", "0.25")))
+    relay.start()
+    return relay
@@ -20,7 +20,13 @@ def main():
         "redis_host": args.redis_host,
         "redis_port": args.redis_port,
         "redis_password": args.redis_password,
+        "redis_streams": args.redis_streams,
+        "redis_codec": args.redis_codec,
         "backup_path": args.backup_path or f"/tmp/anti_defacement_{args.host}",
+        "restore_workers": args.restore_workers,
+        "restore_per_host": args.restore_per_host,
+        "restore_bwlimit": args.restore_bwlimit,
+        "restore_strategy": args.restore_strategy,
         "perm_config": { "path": args.path, "interval": 1 },
         "file_config": { "path": args.path, "interval": 1 },
     }
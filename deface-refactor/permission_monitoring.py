@@ -17,6 +17,9 @@ from typing import Dict, Optional, List, Tuple
 import stat
 import getpass
 
+from restore_ledger import get_restore_ledger
+from codec import permission_event
+
 @dataclass
 class SSHConfig:
     host: str
@@ -372,7 +375,7 @@ class PermissionMonitor:
                 # Log if it's a directory or file
                 is_dir = new_perms.get('is_dir', False)
                 entity_type = "directory" if is_dir else "file"
-                self._queue_change(path, 'new_' + entity_type, None, json.dumps(new_perms))
+                self._queue_change(path, 'new_' + entity_type, None, json.dumps(new_perms), observed=new_perms)
                 detected_changes = True
                 self.logger.info(f"New {entity_type}: {path}")
                 continue
@@ -387,7 +390,8 @@ class PermissionMonitor:
                     path, 
                     'chmod',
                     old_mode,
-                    new_mode
+                    new_mode,
+                    observed=new_perms
                 )
                 detected_changes = True
                 entity_type = "Directory" if new_perms.get('is_dir', False) else "File"
@@ -420,7 +424,37 @@ class PermissionMonitor:
         if detected_changes:
             self.console.print(f"[bold yellow]Permission changes detected at {datetime.now().strftime('%H:%M:%S')}[/bold yellow]")
 
-    def _queue_change(self, path: str, change_type: str, old_value: str, new_value: str):
+    def _handle_restored(self, path: str, change_type: str, observed: Optional[Dict]) -> bool:
+        """Match a change against the restore ledger.
+
+        Returns True when the change was written by our own restore; the
+        first such change of a path is queued as a single 'restored' change.
+        Ownership is not in the ledger, so chown changes are always recorded.
+        """
+        attrs = None
+        deleted = False
+        if change_type in ('new_file', 'new_directory', 'chmod'):
+            if not observed:
+                return False
+            attrs = {key: observed.get(key) for key in ('mode', 'mtime', 'is_dir')}
+        elif change_type in ('deleted_file', 'deleted_directory'):
+            deleted = True
+        else:
+            return False
+
+        result = get_restore_ledger().claim(self.ssh_config.host, path, attrs, deleted)
+        if result is None:
+            return False
+        if result == 'restored':
+            self._queue_change(path, 'restored', None, None)
+        return True
+
+    def _queue_change(self, path: str, change_type: str, old_value: str, new_value: str,
+                      observed: Optional[Dict] = None):
+        """Queue a change; ``observed`` is the path's current state, used to
+        tell our own restores apart from real changes"""
+        if change_type != 'restored' and self._handle_restored(path, change_type, observed):
+            return
         try:
             # Convert any dictionary values to JSON strings before queueing
             if isinstance(old_value, dict):
@@ -434,9 +468,10 @@ class PermissionMonitor:
                 'change_type': change_type,
                 'old_value': old_value,
                 'new_value': new_value,
-                'metadata': json.dumps({
+                # Kept as a dict until stored, so it is serialized only once
+                'metadata': {
                     'detected_at': datetime.now().isoformat()
-                })
+                }
             }
             self.changes_queue.put(change)
         except Exception as e:
@@ -474,6 +509,8 @@ class PermissionMonitor:
                 table.add_row("Action", f"Created new {entity_type.lower()}")
             elif change['change_type'] == 'deleted_file' or change['change_type'] == 'deleted_directory':
                 table.add_row("Action", f"{entity_type} deleted")
+            elif change['change_type'] == 'restored':
+                table.add_row("Action", "Reverted to backup by active restore")
             
             # Generate a concise message for the logger
             change_msg = f"Permission: {change['change_type']} on {change['path']}"
@@ -499,7 +536,7 @@ class PermissionMonitor:
                     change['change_type'],
                     str(change['old_value']) if change['old_value'] is not None else None,
                     str(change['new_value']) if change['new_value'] is not None else None,
-                    change['metadata']
+                    json.dumps(change['metadata'])
                 ))
                 self.conn.commit()
         except Exception as e:
@@ -545,7 +582,7 @@ class PermissionMonitor:
             
                 # ✅ اضافه کردن ارسال به Redis
                 if hasattr(self, 'redis') and self.redis:
-                    self.redis.add_to_queue("perm_changes", change)
+                    self.redis.add_event("perm_changes", permission_event(change, self.ssh_config.host))
 
             except queue.Empty:
                 continue
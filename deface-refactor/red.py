@@ -2,38 +2,306 @@
 
 import redis
 import json
+import queue
+import threading
+import time
 from rich.console import Console
 
+from codec import decode_batch, encode_batch
+from spool import EventSpool
+
 console = Console()
 
+# Single durable stream carrying every monitoring event
+EVENT_STREAM = "antidefacement:events"
+# Approximate number of entries kept in the stream (XADD MAXLEN ~)
+STREAM_MAXLEN = 100000
+# 'codec' field value of stream entries holding a binary event batch (codec.py)
+BINARY_CODEC = "ae1"
+
+# One connection pool per Redis server, shared by every RedisConfig in the process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(host='localhost', port=6379, db=0, password=None,
+                        decode_responses=True) -> redis.ConnectionPool:
+    """Get the shared connection pool for a Redis server"""
+    key = (host, port, db, password, decode_responses)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = redis.ConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                password=password,
+                decode_responses=decode_responses
+            )
+        return _pools[key]
+
+
+class RedisPublisher:
+    """Buffers Redis writes and flushes them in pipelined batches.
+
+    Callers enqueue instead of making a round trip per event. A background
+    thread flushes a batch through one non-transactional pipeline as soon
+    as ``batch_size`` writes are buffered or ``flush_interval`` seconds have
+    passed. The buffer is bounded: when Redis falls behind, producers block
+    for up to ``block_timeout`` seconds (backpressure) before the write is
+    counted as dropped.
+
+    With a ``spool`` (EventSpool), batches that cannot reach Redis are
+    written to disk instead of dropped. While anything is spooled, new
+    batches go to the spool as well so ordering is kept, and Redis is
+    probed every ``retry_interval`` seconds; once it answers, the spool is
+    replayed oldest-first and direct writes resume when it is empty.
+    """
+
+    def __init__(self, pool, batch_size=500, flush_interval=0.05, max_buffer=10000, block_timeout=1.0,
+                 stream_maxlen=STREAM_MAXLEN, spool=None, retry_interval=2.0, available=True):
+        self.client = redis.Redis(connection_pool=pool)
+        self.stream_maxlen = stream_maxlen
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.available = available
+        self.last_probe = 0
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.buffer = queue.Queue(maxsize=max_buffer)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'batches': 0,
+            'dropped': 0,
+            'errors': 0,
+            'blocked': 0,
+            'spooled': 0,
+            'outages': 0
+        }
+        self.started_at = time.time()
+        self.last_error_report = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, command, key, payload) -> bool:
+        """Buffer one write; command is 'lpush', 'publish', 'xadd' or 'xadd_event'
+
+        For 'xadd' the payload is the dict of stream entry fields; for
+        'xadd_event' it is ``(queue_name, event)`` and the events of a batch
+        are written as one binary-encoded stream entry per queue.
+        """
+        item = (command, key, payload)
+        try:
+            self.buffer.put_nowait(item)
+        except queue.Full:
+            with self.lock:
+                self.stats['blocked'] += 1
+            try:
+                self.buffer.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                with self.lock:
+                    self.stats['dropped'] += 1
+                return False
+        with self.lock:
+            self.stats['enqueued'] += 1
+        return True
+
+    def _collect(self):
+        """Wait for the first write, then gather a batch until size or deadline"""
+        try:
+            batch = [self.buffer.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.buffer.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        pipe = self.client.pipeline(transaction=False)
+        events = {}
+        for command, key, payload in batch:
+            if command == 'publish':
+                pipe.publish(key, payload)
+            elif command == 'xadd':
+                pipe.xadd(key, payload, maxlen=self.stream_maxlen, approximate=True)
+            elif command == 'xadd_event':
+                queue_name, event = payload
+                events.setdefault((key, queue_name), []).append(event)
+            else:
+                pipe.lpush(key, payload)
+        for (stream, queue_name), group in events.items():
+            pipe.xadd(stream, {'queue': queue_name, 'codec': BINARY_CODEC, 'data': encode_batch(group)},
+                      maxlen=self.stream_maxlen, approximate=True)
+        pipe.execute()
+
+    def _report_error(self, message):
+        # One message per 10 s instead of one per event
+        if time.time() - self.last_error_report > 10:
+            self.last_error_report = time.time()
+            console.print(f"[red]{message}[/red]")
+
+    def _mark_unavailable(self, error):
+        if self.available:
+            self.available = False
+            self.last_probe = time.monotonic()
+            with self.lock:
+                self.stats['outages'] += 1
+            console.print(f"[yellow]Redis unavailable ({str(error)}), spooling events to {self.spool.directory}[/yellow]")
+
+    def _spool(self, batch):
+        self.spool.append(batch)
+        with self.lock:
+            self.stats['spooled'] += len(batch)
+
+    def _replay_spool(self):
+        """Probe Redis and drain part of the spool; keeps the flush thread responsive"""
+        if not self.available:
+            if time.monotonic() - self.last_probe < self.retry_interval:
+                return
+            self.last_probe = time.monotonic()
+            try:
+                self.client.ping()
+            except Exception:
+                return
+            self.available = True
+
+        try:
+            sent = self.spool.replay(self._flush, self.batch_size, limit=self.batch_size * 20)
+            with self.lock:
+                self.stats['flushed'] += sent
+                self.stats['batches'] += -(-sent // self.batch_size)
+        except Exception as e:
+            self._mark_unavailable(e)
+            return
+        if not self.spool.pending():
+            console.print("[green]✓ Redis reachable again, spooled events replayed[/green]")
+
+    def _run(self):
+        while not (self.stop_event.is_set() and self.buffer.empty()):
+            batch = self._collect()
+            spooling = self.spool is not None and (not self.available or self.spool.pending())
+            if spooling:
+                if batch:
+                    self._spool(batch)
+                else:
+                    self.spool.sync()
+                self._replay_spool()
+            elif batch:
+                try:
+                    self._flush(batch)
+                    with self.lock:
+                        self.stats['flushed'] += len(batch)
+                        self.stats['batches'] += 1
+                except Exception as e:
+                    with self.lock:
+                        self.stats['errors'] += 1
+                    if self.spool is not None:
+                        self._mark_unavailable(e)
+                        self._spool(batch)
+                    else:
+                        with self.lock:
+                            self.stats['dropped'] += len(batch)
+                        self._report_error(f"Failed to flush {len(batch)} events to Redis: {str(e)}")
+            for _ in batch:
+                self.buffer.task_done()
+
+    def flush(self, timeout=5):
+        """Block until everything buffered so far was written (or timeout)"""
+        deadline = time.monotonic() + timeout
+        while self.buffer.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self.buffer.unfinished_tasks
+
+    def metrics(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        stats['buffered'] = self.buffer.qsize()
+        stats['avg_batch_size'] = stats['flushed'] / stats['batches'] if stats['batches'] else 0.0
+        stats['events_per_second'] = stats['flushed'] / elapsed
+        stats['redis_available'] = self.available
+        if self.spool is not None:
+            stats['spool'] = self.spool.metrics()
+        return stats
+
+    def close(self, timeout=5):
+        """Flush what is buffered and stop the flusher thread"""
+        self.flush(timeout)
+        self.stop_event.set()
+        self.thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close()
+
+
 class RedisConfig:
-    def __init__(self, host='localhost', port=6379, db=0, password=None):
+    def __init__(self, host='localhost', port=6379, db=0, password=None, batching=True, use_streams=False,
+                 spool_dir=None, codec='json'):
         self.host = host
         self.port = port
         self.db = db
         self.password = password
+        self.batching = batching
+        # Route add_to_queue() to EVENT_STREAM instead of a per-name list
+        self.use_streams = use_streams
+        # Buffer events on disk while Redis is unreachable (requires batching)
+        self.spool_dir = spool_dir
+        # 'binary' packs stream events with codec.py (streams + batching only)
+        self.codec = codec
         self.connection = None
+        # Undecoded connection for reading binary stream entries
+        self.raw_connection = None
+        self.publisher = None
         self.queue = None
 
+    def _start_publisher(self, pool, available):
+        if not self.batching or self.publisher is not None:
+            return
+        spool = EventSpool(self.spool_dir) if self.spool_dir else None
+        self.publisher = RedisPublisher(pool, spool=spool, available=available)
+
     def connect(self):
-        """Establish Redis connection"""
+        """Establish Redis connection.
+
+        With a spool_dir, a failed connect still starts the publisher in
+        degraded mode: events are spooled to disk and replayed once Redis
+        comes up, and is_spooling() is True.
+        """
+        pool = get_connection_pool(self.host, self.port, self.db, self.password)
         try:
-            self.connection = redis.Redis(
-                host=self.host,
-                port=self.port,
-                db=self.db,
-                password=self.password,
-                decode_responses=True
-            )
+            self.connection = redis.Redis(connection_pool=pool)
+            self.raw_connection = redis.Redis(connection_pool=get_connection_pool(
+                self.host, self.port, self.db, self.password, decode_responses=False
+            ))
             self.connection.ping()
+            self._start_publisher(pool, available=True)
             console.print(f"[green]✓ Connected to Redis at {self.host}:{self.port}[/green]")
             return True
         except Exception as e:
             console.print(f"[red]Failed to connect to Redis: {str(e)}[/red]")
+            if self.spool_dir:
+                self._start_publisher(pool, available=False)
             return False
 
+    def is_spooling(self) -> bool:
+        """True when events are buffered on disk instead of reaching Redis"""
+        return bool(self.publisher and self.publisher.spool is not None and
+                    (not self.publisher.available or self.publisher.spool.pending()))
+
     def publish_event(self, channel, event_data):
         """Publish event to Redis channel"""
+        if self.publisher:
+            return self.publisher.enqueue('publish', channel, json.dumps(event_data))
         if self.connection:
             try:
                 self.connection.publish(channel, json.dumps(event_data))
@@ -42,8 +310,31 @@ class RedisConfig:
                 console.print(f"[red]Failed to publish to Redis: {str(e)}[/red]")
                 return False
 
+    def add_to_stream(self, queue_name, data, stream=EVENT_STREAM):
+        """Append an event to a Redis stream; queue_name is kept as the entry's 'queue' field"""
+        fields = {'queue': queue_name, 'data': json.dumps(data)}
+        if self.publisher:
+            return self.publisher.enqueue('xadd', stream, fields)
+        if self.connection:
+            try:
+                self.connection.xadd(stream, fields, maxlen=STREAM_MAXLEN, approximate=True)
+                return True
+            except Exception as e:
+                console.print(f"[red]Failed to add to Redis stream: {str(e)}[/red]")
+                return False
+
+    def add_event(self, queue_name, event):
+        """Send a codec.py v1 event; binary-encoded on the stream transport when enabled"""
+        if self.use_streams and self.codec == 'binary' and self.publisher:
+            return self.publisher.enqueue('xadd_event', EVENT_STREAM, (queue_name, event))
+        return self.add_to_queue(queue_name, event)
+
     def add_to_queue(self, queue_name, data):
         """Add data to Redis queue"""
+        if self.use_streams:
+            return self.add_to_stream(queue_name, data)
+        if self.publisher:
+            return self.publisher.enqueue('lpush', queue_name, json.dumps(data))
         if self.connection:
             try:
                 self.connection.lpush(queue_name, json.dumps(data))
@@ -63,3 +354,169 @@ class RedisConfig:
             except Exception as e:
                 console.print(f"[red]Failed to get from Redis queue: {str(e)}[/red]")
                 return None
+
+    def metrics(self) -> dict:
+        """Publisher throughput metrics (empty when batching is off)"""
+        return self.publisher.metrics() if self.publisher else {}
+
+    def close(self):
+        """Flush buffered events and stop the publisher"""
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
+
+
+class StreamConsumer:
+    """Reads EVENT_STREAM as one member of a consumer group.
+
+    Every group sees every event once; within a group each entry goes to a
+    single consumer, so consumers scale horizontally. Entries stay pending
+    until ack(); entries left pending by a consumer that died are reclaimed
+    after ``claim_idle_ms`` by whichever consumer of the group reads next.
+    """
+
+    def __init__(self, redis_config, group, consumer, stream=EVENT_STREAM,
+                 count=500, block_ms=1000, claim_idle_ms=60000, reclaim_interval=30):
+        self.redis_config = redis_config
+        self.group = group
+        self.consumer = consumer
+        self.stream = stream
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.reclaim_interval = reclaim_interval
+        self.last_reclaim = 0
+        self.stats = {'read': 0, 'acked': 0, 'reclaimed': 0}
+
+    @property
+    def connection(self):
+        # Undecoded, so binary event batches survive; fields are decoded in _decode
+        return self.redis_config.raw_connection
+
+    def ensure_group(self):
+        """Create the consumer group (and the stream) if missing"""
+        try:
+            self.connection.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    @staticmethod
+    def _decode(entries):
+        """Expand stream entries into ``(entry_id, queue_name, event)`` tuples.
+
+        A binary entry holds a batch, so several tuples may share one id.
+        An entry that cannot be decoded is logged and returned with event
+        None, like a trimmed one, so the caller acks it with the rest of
+        the batch instead of having it reclaimed and failing forever.
+        """
+        events = []
+        for entry_id, fields in entries:
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            if not fields:
+                # Trimmed away by MAXLEN while still pending
+                events.append((entry_id, None, None))
+                continue
+            queue_name = None
+            try:
+                fields = {k.decode() if isinstance(k, bytes) else k: v for k, v in fields.items()}
+                queue_name = fields.get('queue')
+                queue_name = queue_name.decode() if isinstance(queue_name, bytes) else queue_name
+                codec = fields.get('codec')
+                if codec in (BINARY_CODEC, BINARY_CODEC.encode()):
+                    decoded = [(entry_id, queue_name, event) for event in decode_batch(fields['data'])]
+                else:
+                    decoded = [(entry_id, queue_name, json.loads(fields['data']))]
+            except Exception as e:
+                console.print(f"[red]Skipping undecodable stream entry {entry_id}: {e!r}[/red]")
+                events.append((entry_id, queue_name, None))
+                continue
+            events.extend(decoded)
+        return events
+
+    def reclaim(self):
+        """Take over entries other consumers left pending for too long"""
+        claimed = []
+        start = '0-0'
+        while True:
+            result = self.connection.xautoclaim(
+                self.stream, self.group, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id=start, count=self.count
+            )
+            start, entries = result[0], result[1]
+            start = start.decode() if isinstance(start, bytes) else start
+            claimed.extend(self._decode(entries))
+            if start == '0-0' or not entries:
+                break
+        self.stats['reclaimed'] += len(claimed)
+        return claimed
+
+    def read(self):
+        """Return a list of ``(entry_id, queue_name, event)`` for this consumer.
+
+        Stale pending entries are reclaimed first (at most every
+        ``reclaim_interval`` seconds); then new entries are read, blocking
+        up to ``block_ms``.
+        """
+        events = []
+        if time.time() - self.last_reclaim >= self.reclaim_interval:
+            self.last_reclaim = time.time()
+            events.extend(self.reclaim())
+
+        if not events:
+            result = self.connection.xreadgroup(
+                self.group, self.consumer, {self.stream: '>'},
+                count=self.count, block=self.block_ms
+            )
+            for _, entries in result or []:
+                events.extend(self._decode(entries))
+
+        self.stats['read'] += len(events)
+        return events
+
+    def ack(self, entry_ids):
+        """Acknowledge processed entries so they leave the pending list"""
+        if not entry_ids:
+            return 0
+        acked = self.connection.xack(self.stream, self.group, *dict.fromkeys(entry_ids))
+        self.stats['acked'] += acked
+        return acked
+
+    def pending(self) -> dict:
+        """Pending-entry summary for this group"""
+        summary = self.redis_config.connection.xpending(self.stream, self.group)
+        return {
+            'pending': summary['pending'],
+            'consumers': {c['name']: c['pending'] for c in summary.get('consumers') or []}
+        }
+
+
+class StreamTail:
+    """Follows EVENT_STREAM from its current end, without a consumer group.
+
+    Every process tailing the stream sees every event, which is what live
+    fan-out needs (each API worker relays to its own WebSockets). Nothing
+    is acknowledged; a restarted tail resumes at the end of the stream.
+    """
+
+    def __init__(self, redis_config, stream=EVENT_STREAM, count=500, block_ms=1000, last_id='$'):
+        self.redis_config = redis_config
+        self.stream = stream
+        self.count = count
+        self.block_ms = block_ms
+        self.last_id = last_id
+        self.stats = {'read': 0}
+
+    def read(self):
+        """Return ``(entry_id, queue_name, event)`` tuples added since the last read"""
+        result = self.redis_config.raw_connection.xread(
+            {self.stream: self.last_id}, count=self.count, block=self.block_ms
+        )
+        events = []
+        for _, entries in result or []:
+            if entries:
+                last_id = entries[-1][0]
+                self.last_id = last_id.decode() if isinstance(last_id, bytes) else last_id
+            events.extend(StreamConsumer._decode(entries))
+        self.stats['read'] += len(events)
+        return events
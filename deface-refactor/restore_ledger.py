@@ -0,0 +1,187 @@
+# restore_ledger.py
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+# rsync --out-format that itemizes every path a restore touched, with the
+# attributes it left behind: change flags | name | size | permission bits | mtime
+RSYNC_RESTORE_OUT_FORMAT = "%i|%n|%l|%B|%M"
+# rsync's %M format (local time of the machine running rsync)
+RSYNC_TIME_FORMAT = "%Y/%m/%d-%H:%M:%S"
+
+# Seconds during which a detector treats a matching change as restore-caused
+DEFAULT_SUPPRESSION_WINDOW = 10
+
+# Attributes a detector may report; each one it reports must match exactly
+COMPARED_ATTRS = ('is_dir', 'mode', 'size', 'mtime')
+REQUIRED_ATTRS = ('is_dir', 'mtime')
+
+# ls-style special bits: (position, set with execute, set without execute, bit)
+_SPECIAL_BITS = ((2, 's', 'S', 0o4000), (5, 's', 'S', 0o2000), (8, 't', 'T', 0o1000))
+
+
+def _mode_from_bits(bits: str) -> Optional[int]:
+    """Convert rsync's ``rwsr-xr-x`` permission string to a full mode integer.
+
+    Includes the setuid, setgid and sticky bits, which ls-style strings
+    encode in the execute positions as s/S and t/T.
+    """
+    if len(bits) != 9:
+        return None
+    mode = 0
+    for i, ch in enumerate(bits):
+        if ch not in '-SsTt':
+            mode |= 1 << (8 - i)
+    for i, with_exec, without_exec, bit in _SPECIAL_BITS:
+        if bits[i] in (with_exec, without_exec):
+            mode |= bit
+            if bits[i] == with_exec:
+                mode |= 1 << (8 - i)
+    return mode
+
+
+def _mtime_from_rsync(value: str) -> Optional[int]:
+    try:
+        return int(time.mktime(time.strptime(value, RSYNC_TIME_FORMAT)))
+    except ValueError:
+        return None
+
+
+def parse_rsync_itemized(output: str, root: str) -> Dict[str, Optional[dict]]:
+    """Parse rsync output produced with RSYNC_RESTORE_OUT_FORMAT.
+
+    Returns ``{absolute_path: attrs}`` for every entry the restore wrote;
+    attrs is None for entries the restore deleted. Lines that are not
+    itemized (progress, summaries) are ignored.
+    """
+    entries = {}
+    for line in output.splitlines():
+        parts = line.rstrip('\n').split('|')
+        if len(parts) != 5:
+            continue
+        flags, name, size, bits, mtime = parts
+        if not flags or not name or name in ('./', '.'):
+            continue
+
+        path = os.path.normpath(os.path.join(root, name))
+        if flags.startswith('*deleting'):
+            entries[path] = None
+            continue
+
+        is_dir = name.endswith('/') or (len(flags) > 1 and flags[1] == 'd')
+        attrs = {'is_dir': is_dir}
+        mode = _mode_from_bits(bits)
+        if mode is not None:
+            attrs['mode'] = mode
+        if not is_dir and size.isdigit():
+            attrs['size'] = int(size)
+        mtime = _mtime_from_rsync(mtime)
+        if mtime is not None:
+            attrs['mtime'] = mtime
+        entries[path] = attrs
+    return entries
+
+
+def attrs_match(expected: dict, observed: dict) -> bool:
+    """True if every attribute the detector observed is recorded and equal.
+
+    The observation must at least include is_dir and mtime, and for a file
+    its size or mode as well.
+    """
+    if not observed or any(observed.get(key) is None for key in REQUIRED_ATTRS):
+        return False
+    if not observed['is_dir'] and observed.get('size') is None and observed.get('mode') is None:
+        return False
+    for key, value in observed.items():
+        if key not in COMPARED_ATTRS or key not in expected or value is None:
+            return False
+        if key == 'mtime':
+            value = int(value)
+        if value != expected[key]:
+            return False
+    return True
+
+
+class RestoreLedger:
+    """Paths and post-restore attributes published by the restorers.
+
+    Detectors consult the ledger before recording a change: a change that
+    matches what a restore just wrote is not an attack but the restore
+    itself. The first matching change for a path is reported once as
+    RESTORED and later ones inside the window are dropped.
+    """
+
+    def __init__(self, window=DEFAULT_SUPPRESSION_WINDOW):
+        self.window = window
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.stats = {'published': 0, 'restored': 0, 'suppressed': 0}
+
+    def publish(self, host: str, entries: Dict[str, Optional[dict]]):
+        """Record the paths a restore on ``host`` just wrote or deleted"""
+        now = time.time()
+        expires = now + self.window
+        with self.lock:
+            self._prune(now)
+            for path, attrs in entries.items():
+                self.entries[(host, os.path.normpath(path))] = {
+                    'attrs': attrs,
+                    'expires': expires,
+                    'reported': False
+                }
+            self.stats['published'] += len(entries)
+
+    def expects(self, host: str, path: str) -> bool:
+        """True if a recent restore wrote or deleted ``path`` (does not claim it)"""
+        with self.lock:
+            entry = self.entries.get((host, os.path.normpath(path)))
+            return entry is not None and entry['expires'] >= time.time()
+
+    def claim(self, host: str, path: str, attrs: Optional[dict] = None, deleted: bool = False) -> Optional[str]:
+        """Check a detected change against the ledger.
+
+        Args:
+            host: Host the change was seen on
+            path: Absolute path of the change
+            attrs: Attributes the detector observed (is_dir, mode with the
+                special bits, size, mtime); every one of them must equal what
+                the restore wrote. A change with no attributes never matches.
+            deleted: True when the detector saw the path disappear
+
+        Returns:
+            None if the change was not caused by a restore, 'restored' for
+            the first matching change of a path, 'suppressed' afterwards.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get((host, os.path.normpath(path)))
+            if entry is None or entry['expires'] < now:
+                return None
+
+            expected = entry['attrs']
+            if deleted != (expected is None):
+                return None
+            if not deleted and not attrs_match(expected, attrs):
+                return None
+
+            if entry['reported']:
+                self.stats['suppressed'] += 1
+                return 'suppressed'
+            entry['reported'] = True
+            self.stats['restored'] += 1
+            return 'restored'
+
+    def _prune(self, now):
+        expired = [key for key, entry in self.entries.items() if entry['expires'] < now]
+        for key in expired:
+            del self.entries[key]
+
+
+# Singleton instance
+_ledger = RestoreLedger()
+
+
+def get_restore_ledger() -> RestoreLedger:
+    """Get the process-wide restore ledger"""
+    return _ledger
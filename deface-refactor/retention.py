@@ -0,0 +1,267 @@
+# retention.py
+"""
+Daily range partitioning of activity_logs and log-retention enforcement.
+
+activity_logs is partitioned by RANGE(UNIX_TIMESTAMP(created_at)) into one
+partition per UTC day (``pYYYYMMDD``) plus a catch-all ``pmax``. The
+retention worker keeps partitions created a few days ahead and drops whole
+partitions older than ``general_log_retention_days``; dropping a partition
+is a metadata operation, so it neither scans nor locks the live rows.
+
+On a table that has not been migrated yet, expired rows are deleted in
+small keyed chunks instead of one long DELETE.
+"""
+
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from rich.console import Console
+from sqlalchemy import text
+
+from database import Setting, get_db_manager
+from rollups import prune_rollups, purged_counts, subtract_rollups
+
+console = Console()
+
+TABLE = "activity_logs"
+RETENTION_SETTING = "general_log_retention_days"
+DEFAULT_RETENTION_DAYS = 30
+
+# Partitions kept ready ahead of today
+DAYS_AHEAD = 7
+# Rows per chunked DELETE on unpartitioned tables
+DELETE_CHUNK = 5000
+# MySQL named lock so only one API worker/process runs maintenance at a time
+MAINTENANCE_LOCK = "antidefacement_retention"
+
+
+def partition_name(day) -> str:
+    return f"p{day.strftime('%Y%m%d')}"
+
+
+def _partition_clause(day) -> str:
+    upper = (day + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+    return f"PARTITION {partition_name(day)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper}'))"
+
+
+class PartitionManager:
+    """Creates and drops the daily partitions of activity_logs"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.console = console
+
+    def partitions(self, conn) -> dict:
+        """Return ``{name: upper_bound_epoch or None}`` (None for MAXVALUE)"""
+        rows = conn.execute(text(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION"
+        ), {'table': TABLE}).all()
+        return {
+            name: None if description == 'MAXVALUE' else int(description)
+            for name, description in rows
+        }
+
+    def is_partitioned(self, conn) -> bool:
+        return bool(self.partitions(conn))
+
+    def ensure_partitions(self, conn, days_ahead=DAYS_AHEAD) -> int:
+        """Split pmax so every day up to ``days_ahead`` has its own partition"""
+        existing = self.partitions(conn)
+        if 'pmax' not in existing:
+            return 0
+
+        today = datetime.now(timezone.utc).date()
+        missing = []
+        for offset in range(-1, days_ahead + 1):
+            day = today + timedelta(days=offset)
+            if partition_name(day) not in existing:
+                missing.append(day)
+        # Only days after the last dated partition can be carved out of pmax
+        dated = [name for name in existing if name != 'pmax']
+        if dated:
+            last = datetime.strptime(max(dated)[1:], '%Y%m%d').date()
+            missing = [day for day in missing if day > last]
+        if not missing:
+            return 0
+
+        clauses = [_partition_clause(day) for day in missing]
+        clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        conn.execute(text(f"ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO ({', '.join(clauses)})"))
+        self.console.print(f"[green]✓ Added {len(missing)} daily partitions to {TABLE}[/green]")
+        return len(missing)
+
+    def drop_expired(self, conn, retention_days) -> list:
+        """Drop every daily partition whose rows are all older than the cutoff"""
+        cutoff = time.time() - retention_days * 86400
+        expired = [
+            name for name, upper in self.partitions(conn).items()
+            if upper is not None and upper <= cutoff
+        ]
+        if expired:
+            # Counted first: the rows are gone once the partitions are dropped
+            counts = purged_counts(conn, f"{TABLE} PARTITION ({', '.join(expired)})")
+            conn.execute(text(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(expired)}"))
+            subtract_rollups(conn, counts)
+            self.console.print(f"[green]✓ Dropped expired partitions: {', '.join(expired)}[/green]")
+        return expired
+
+    def migrate(self, conn, days_back=DEFAULT_RETENTION_DAYS):
+        """One-time conversion of an unpartitioned activity_logs.
+
+        MySQL requires the partitioning column in every unique key and does
+        not allow foreign keys on partitioned tables, so the primary key
+        becomes (id, created_at), the event_id key becomes
+        (event_id, created_at) and the servers foreign key is dropped.
+        This rebuilds the table; run it during a maintenance window.
+        """
+        if self.is_partitioned(conn):
+            self.console.print(f"[yellow]{TABLE} is already partitioned[/yellow]")
+            return False
+
+        fks = conn.execute(text(
+            "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+            "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = :table"
+        ), {'table': TABLE}).scalars().all()
+        for fk in fks:
+            conn.execute(text(f"ALTER TABLE {TABLE} DROP FOREIGN KEY {fk}"))
+
+        has_event_key = conn.execute(text(
+            "SELECT COUNT(*) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND INDEX_NAME = 'uq_event_id'"
+        ), {'table': TABLE}).scalar()
+        alter = [
+            "MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP",
+            "DROP PRIMARY KEY",
+            "ADD PRIMARY KEY (id, created_at)"
+        ]
+        if has_event_key:
+            alter.append("DROP INDEX uq_event_id")
+        alter.append("ADD UNIQUE KEY uq_event_id (event_id, created_at)")
+        conn.execute(text(f"ALTER TABLE {TABLE} {', '.join(alter)}"))
+
+        today = datetime.now(timezone.utc).date()
+        clauses = [_partition_clause(today + timedelta(days=offset))
+                   for offset in range(-days_back, DAYS_AHEAD + 1)]
+        # Rows older than the first day fall into the first partition
+        clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ({', '.join(clauses)})"
+        ))
+        self.console.print(f"[green]✓ {TABLE} partitioned by day[/green]")
+        return True
+
+
+def delete_expired_chunked(conn, retention_days, chunk=DELETE_CHUNK, pause=0.05) -> int:
+    """Delete expired rows in short keyed transactions (unpartitioned tables)"""
+    cutoff = time.time() - retention_days * 86400
+    deleted = 0
+    while True:
+        # Walk idx_timestamp; each DELETE only touches the ids just selected
+        ids = conn.execute(text(
+            f"SELECT id FROM {TABLE} WHERE timestamp < :cutoff ORDER BY timestamp LIMIT :chunk"
+        ), {'cutoff': cutoff, 'chunk': chunk}).scalars().all()
+        if not ids:
+            break
+        id_list = ', '.join(str(int(i)) for i in ids)
+        counts = purged_counts(conn, f"{TABLE} WHERE id IN ({id_list})")
+        conn.execute(text(f"DELETE FROM {TABLE} WHERE id IN ({id_list})"))
+        subtract_rollups(conn, counts)
+        conn.commit()
+        deleted += len(ids)
+        if len(ids) < chunk:
+            break
+        time.sleep(pause)
+    return deleted
+
+
+class RetentionWorker:
+    """Periodically maintains partitions and enforces log retention"""
+
+    def __init__(self, db_manager=None, interval=3600):
+        self.db_manager = db_manager or get_db_manager()
+        self.partitions = PartitionManager(self.db_manager.engine)
+        self.interval = interval
+        self.console = console
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_run = None
+
+    def retention_days(self) -> int:
+        session = self.db_manager.get_session()
+        try:
+            setting = session.query(Setting).filter(Setting.key == RETENTION_SETTING).first()
+            return int(setting.value) if setting and setting.value else DEFAULT_RETENTION_DAYS
+        except ValueError:
+            return DEFAULT_RETENTION_DAYS
+        finally:
+            session.close()
+
+    def run_once(self) -> dict:
+        """One maintenance pass; returns what it did"""
+        days = self.retention_days()
+        result = {'retention_days': days, 'partitions_added': 0, 'partitions_dropped': [], 'rows_deleted': 0}
+        with self.db_manager.engine.connect() as conn:
+            if not conn.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': MAINTENANCE_LOCK}).scalar():
+                result['skipped'] = 'maintenance running elsewhere'
+                return result
+            try:
+                if self.partitions.is_partitioned(conn):
+                    result['partitions_added'] = self.partitions.ensure_partitions(conn)
+                    if days > 0:
+                        result['partitions_dropped'] = self.partitions.drop_expired(conn, days)
+                elif days > 0:
+                    result['rows_deleted'] = delete_expired_chunked(conn, days)
+                conn.commit()
+                result['rollups_pruned'] = self._prune_rollups()
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': MAINTENANCE_LOCK})
+        self.last_run = result
+        return result
+
+    def _prune_rollups(self):
+        session = self.db_manager.get_session()
+        try:
+            deleted = prune_rollups(session)
+            session.commit()
+            return deleted
+        finally:
+            session.close()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.console.print(f"[red]Retention worker error: {str(e)}[/red]")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="retention-worker", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="activity_logs partition and retention maintenance")
+    parser.add_argument("--migrate", action="store_true", help="Convert activity_logs to daily partitions")
+    args = parser.parse_args()
+
+    worker = RetentionWorker()
+    if args.migrate:
+        with worker.db_manager.engine.connect() as conn:
+            worker.partitions.migrate(conn, worker.retention_days())
+            conn.commit()
+    console.print(worker.run_once())
+
+
+if __name__ == "__main__":
+    main()
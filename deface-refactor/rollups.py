@@ -0,0 +1,209 @@
+# rollups.py
+"""
+Incrementally maintained event counts for the dashboard.
+
+The ingester adds every newly stored activity row to a minute, an hour and
+a day bucket of activity_rollups, in the same transaction as the insert;
+retention takes purged rows out again (purged_counts/subtract_rollups).
+Counts since a point in time are answered from at most ~60 minute rows,
+~24 hour rows and one row per whole day, per server and type, instead of
+a COUNT(*) over activity_logs.
+"""
+
+import argparse
+import math
+import time
+from collections import Counter
+
+from rich.console import Console
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+from database import Activity, ActivityRollup, get_db_manager
+
+console = Console()
+
+GRANULARITIES = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400
+}
+
+# Rollup series for events written by the active restore
+RESTORED = 'restored'
+
+# How long fine-grained buckets are kept (see prune_rollups)
+MINUTE_RETENTION = 2 * 86400
+HOUR_RETENTION = 90 * 86400
+
+# rollup_type() in SQL
+SERIES_SQL = (
+    "CASE WHEN operation = 'RESTORED' OR change_type = 'restored' "
+    "THEN 'restored' ELSE activity_type END"
+)
+
+
+def rollup_type(row: dict) -> str:
+    """Rollup series of an activity row"""
+    if row.get('operation') == 'RESTORED' or row.get('change_type') == RESTORED:
+        return RESTORED
+    return row['activity_type']
+
+
+def apply_rollups(session, rows) -> int:
+    """Add freshly inserted activity rows to the rollups (caller commits)"""
+    counts = Counter()
+    for row in rows:
+        series = rollup_type(row)
+        ts = int(row['timestamp'])
+        for granularity, size in GRANULARITIES.items():
+            counts[(granularity, ts - ts % size, row['server_id'], series)] += 1
+    if not counts:
+        return 0
+
+    values = [
+        {'granularity': g, 'bucket_start': b, 'server_id': s, 'activity_type': t, 'count': n}
+        for (g, b, s, t), n in counts.items()
+    ]
+    stmt = mysql_insert(ActivityRollup.__table__).values(values)
+    stmt = stmt.on_duplicate_key_update(count=ActivityRollup.__table__.c.count + stmt.inserted['count'])
+    session.execute(stmt)
+    return len(values)
+
+
+def _ceil(ts, size):
+    return int(math.ceil(ts / size) * size)
+
+
+def _window_filter(since):
+    """Bucket ranges covering [since, now) with the coarsest rows possible.
+
+    Buckets are incremented as events arrive, so the current hour and day
+    rows already hold everything up to now; only the head of the window
+    needs finer buckets. Minute and hour rows older than their retention
+    are gone, so a window reaching that far is widened to the hour/day.
+    """
+    if since is None:
+        return ActivityRollup.granularity == 'day'
+
+    age = time.time() - since
+    if age > HOUR_RETENTION:
+        since -= since % GRANULARITIES['day']
+    elif age > MINUTE_RETENTION:
+        since -= since % GRANULARITIES['hour']
+    since = int(since) - int(since) % GRANULARITIES['minute']
+
+    hour_start = _ceil(since, GRANULARITIES['hour'])
+    day_start = _ceil(hour_start, GRANULARITIES['day'])
+    g, b = ActivityRollup.granularity, ActivityRollup.bucket_start
+    return or_(
+        and_(g == 'minute', b >= since, b < hour_start),
+        and_(g == 'hour', b >= hour_start, b < day_start),
+        and_(g == 'day', b >= day_start)
+    )
+
+
+def activity_totals(session, since=None, server_id=None) -> dict:
+    """``{series: count}`` since ``since`` (epoch seconds; None for all time)"""
+    query = session.query(ActivityRollup.activity_type, func.sum(ActivityRollup.count)) \
+        .filter(_window_filter(since))
+    if server_id is not None:
+        query = query.filter(ActivityRollup.server_id == server_id)
+    return {series: int(total) for series, total in query.group_by(ActivityRollup.activity_type)}
+
+
+def activity_totals_by_server(session, since=None) -> dict:
+    """``{server_id: {series: count}}`` since ``since`` in one grouped query"""
+    rows = session.query(ActivityRollup.server_id, ActivityRollup.activity_type, func.sum(ActivityRollup.count)) \
+        .filter(_window_filter(since)) \
+        .group_by(ActivityRollup.server_id, ActivityRollup.activity_type)
+    totals = {}
+    for server_id, series, total in rows:
+        totals.setdefault(server_id, {})[series] = int(total)
+    return totals
+
+
+def purged_counts(conn, source, params=None) -> list:
+    """Per-bucket counts of the activity rows selected by ``source``.
+
+    ``source`` is the FROM clause of rows about to be purged, e.g.
+    ``activity_logs PARTITION (p20240101)``; take the counts before the
+    purge and pass them to subtract_rollups() once it succeeded.
+    """
+    counts = []
+    for granularity, size in GRANULARITIES.items():
+        rows = conn.execute(text(
+            f"SELECT FLOOR(timestamp / {size}) * {size} AS bucket, server_id, {SERIES_SQL} AS series, COUNT(*) "
+            f"FROM {source} GROUP BY bucket, server_id, series"
+        ), params or {})
+        counts.extend(
+            {'granularity': granularity, 'bucket_start': int(bucket), 'server_id': server_id,
+             'activity_type': series, 'n': n}
+            for bucket, server_id, series, n in rows
+        )
+    return counts
+
+
+def subtract_rollups(conn, counts) -> int:
+    """Take purged rows out of the rollups; buckets that reach zero are deleted"""
+    if not counts:
+        return 0
+    conn.execute(text(
+        "UPDATE activity_rollups SET count = GREATEST(count - :n, 0) "
+        "WHERE granularity = :granularity AND bucket_start = :bucket_start "
+        "AND server_id = :server_id AND activity_type = :activity_type"
+    ), counts)
+    conn.execute(text("DELETE FROM activity_rollups WHERE count = 0"))
+    return len(counts)
+
+
+def prune_rollups(session) -> int:
+    """Delete minute and hour buckets past their retention"""
+    now = int(time.time())
+    deleted = session.query(ActivityRollup).filter(or_(
+        and_(ActivityRollup.granularity == 'minute', ActivityRollup.bucket_start < now - MINUTE_RETENTION),
+        and_(ActivityRollup.granularity == 'hour', ActivityRollup.bucket_start < now - HOUR_RETENTION)
+    )).delete(synchronize_session=False)
+    return deleted
+
+
+def rebuild_rollups(session, since=None) -> int:
+    """Recompute rollups from activity_logs (backfill or repair).
+
+    Buckets from ``since`` (aligned down to the day) onwards are replaced;
+    run it while ingestion is paused to avoid racing live increments.
+    """
+    start = 0 if since is None else int(since) - int(since) % GRANULARITIES['day']
+    session.query(ActivityRollup).filter(ActivityRollup.bucket_start >= start) \
+        .delete(synchronize_session=False)
+
+    series = SERIES_SQL
+    rebuilt = 0
+    for granularity, size in GRANULARITIES.items():
+        result = session.execute(text(
+            "INSERT INTO activity_rollups (granularity, bucket_start, server_id, activity_type, count) "
+            f"SELECT :granularity, FLOOR(timestamp / {size}) * {size} AS bucket, server_id, {series} AS series, COUNT(*) "
+            f"FROM {Activity.__tablename__} WHERE timestamp >= :start "
+            "GROUP BY bucket, server_id, series"
+        ), {'granularity': granularity, 'start': start})
+        rebuilt += result.rowcount
+    session.commit()
+    return rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild activity_rollups from activity_logs")
+    parser.add_argument("--since-days", type=int, help="Only rebuild the last N days (default: everything)")
+    args = parser.parse_args()
+
+    since = time.time() - args.since_days * 86400 if args.since_days else None
+    session = get_db_manager().get_session()
+    try:
+        rows = rebuild_rollups(session, since)
+        console.print(f"[green]✓ Rebuilt {rows} rollup rows[/green]")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
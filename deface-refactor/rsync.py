@@ -1,17 +1,199 @@
 # rsync.py
+import hashlib
+import shlex
+import stat
 import subprocess
+import threading
 import time
 import os
 from rich.console import Console
 
+from restore_ledger import RSYNC_RESTORE_OUT_FORMAT, parse_rsync_itemized, get_restore_ledger
+from scheduler import PRIORITY_HIGH, PRIORITY_NORMAL
+from swap_restore import StagedSwapRestore
+from watcher import get_remote_watcher
+
 console = Console()
 
+# How long an idle multiplexed SSH master stays alive after the last restore
+SSH_CONTROL_PERSIST = 600
+
+# Seconds between unconditional restores while the remote watcher is running
+SAFETY_NET_RESTORE_INTERVAL = 60
+# Pause after the first pushed change so a burst of events costs one restore
+CHANGE_SETTLE_DELAY = 0.1
+# Changed paths in one burst from which the 'swap' strategy swaps the whole tree
+SWAP_RESTORE_THRESHOLD = 50
+
+
+def ensure_private_dir(path):
+    """Create ``path`` with mode 0700, refusing one that another user could control"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise RuntimeError(f"SSH control path {path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise RuntimeError(f"SSH control directory {path} is not owned by the current user")
+    if stat.S_IMODE(st.st_mode) != 0o700:
+        raise RuntimeError(f"SSH control directory {path} must have mode 0700, "
+                           f"not {oct(stat.S_IMODE(st.st_mode))}")
+
+
+def master_identity(ssh_config):
+    return (ssh_config['username'], ssh_config['host'], int(ssh_config['port']),
+            os.path.expanduser(ssh_config.get('key_path') or ''))
+
+
+def master_key_digest(ssh_config) -> str:
+    return hashlib.sha1(repr(master_identity(ssh_config)).encode()).hexdigest()[:20]
+
+
+class SSHMaster:
+    """Long-lived multiplexed SSH connection shared by every rsync run to a host.
+
+    The first call to ``ensure()`` starts an OpenSSH ControlMaster in the
+    background; later rsync invocations attach to its control socket, so they
+    skip TCP setup, key exchange and authentication entirely.
+
+    Control sockets live in a private per-user directory (~/.ssh/antidefacement
+    by default) that must be owned by the current user with mode 0700.
+
+    ``BatchMode=yes`` is only passed when ``ssh_config['batch_mode']`` is set,
+    which defaults to on with a key and off without one, so password and
+    keyboard-interactive logins can still prompt on the terminal.
+    """
+
+    def __init__(self, ssh_config, control_dir=None, persist=SSH_CONTROL_PERSIST):
+        self.ssh_config = ssh_config
+        self.persist = persist
+        self.control_dir = control_dir or os.path.join(os.path.expanduser("~"), ".ssh", "antidefacement")
+        ensure_private_dir(self.control_dir)
+        # Hash the identity so the socket path stays under the ~104 byte unix limit
+        self.control_path = os.path.join(self.control_dir, master_key_digest(ssh_config))
+        self.lock = threading.Lock()
+        self.console = console
+
+    def _base_args(self):
+        args = ['-p', str(self.ssh_config['port'])]
+        if self.ssh_config.get('batch_mode', bool(self.ssh_config.get('key_path'))):
+            args += ['-o', 'BatchMode=yes']
+        if self.ssh_config.get('key_path'):
+            args[:0] = ['-i', os.path.expanduser(self.ssh_config['key_path'])]
+        return args
+
+    def _target(self):
+        return f"{self.ssh_config['username']}@{self.ssh_config['host']}"
+
+    def is_alive(self):
+        """Check whether the control master is still accepting sessions"""
+        if not os.path.exists(self.control_path):
+            return False
+        result = subprocess.run(
+            ['ssh', '-S', self.control_path, '-O', 'check', self._target()],
+            capture_output=True, text=True
+        )
+        return result.returncode == 0
+
+    def ensure(self):
+        """Start the control master if needed.
+
+        Returns the seconds spent on connection setup (0.0 when an existing
+        master was reused).
+        """
+        with self.lock:
+            if self.is_alive():
+                return 0.0
+
+            started = time.perf_counter()
+            cmd = ['ssh', '-M', '-N', '-f',
+                   '-S', self.control_path,
+                   '-o', f"ControlPersist={self.persist}",
+                   *self._base_args(), self._target()]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"SSH master failed: {result.stderr.strip()}")
+
+            elapsed = time.perf_counter() - started
+            self.console.print(f"[cyan]SSH master established for {self._target()} in {elapsed * 1000:.0f} ms[/cyan]")
+            return elapsed
+
+    def run(self, command):
+        """Run a shell command on the host over the master; returns (status, stdout, stderr)"""
+        self.ensure()
+        result = subprocess.run(
+            ['ssh', '-S', self.control_path, '-o', 'ControlMaster=no', *self._base_args(),
+             self._target(), command],
+            capture_output=True, text=True
+        )
+        return result.returncode, result.stdout, result.stderr.strip()
+
+    def rsync_shell(self):
+        """Value for rsync's ``-e`` option that rides on the control master"""
+        args = ['ssh', '-S', self.control_path, '-o', 'ControlMaster=no', *self._base_args()]
+        return ' '.join(shlex.quote(a) for a in args)
+
+    def close(self):
+        """Ask the control master to exit"""
+        with self.lock:
+            if os.path.exists(self.control_path):
+                subprocess.run(
+                    ['ssh', '-S', self.control_path, '-O', 'exit', self._target()],
+                    capture_output=True, text=True
+                )
+
+
+# One master per (user, host, port, key), shared by all RsyncBackup instances
+_ssh_masters = {}
+_ssh_masters_lock = threading.Lock()
+
+
+def get_ssh_master(ssh_config) -> SSHMaster:
+    """Get the shared SSH master for a host and identity"""
+    key = master_identity(ssh_config)
+    with _ssh_masters_lock:
+        if key not in _ssh_masters:
+            _ssh_masters[key] = SSHMaster(ssh_config)
+        return _ssh_masters[key]
+
+
 class RsyncBackup:
     def __init__(self, ssh_config, source, backup_path):
         self.ssh_config = ssh_config
         self.source = source
         self.backup_path = backup_path
         self.console = console
+        self.transport = get_ssh_master(ssh_config)
+        # Latency breakdown of the most recent rsync run, in seconds
+        self.last_timings = {}
+
+    def _run_rsync(self, src, dst, bwlimit=None, extra_args=None):
+        """Run rsync over the shared SSH master and record a latency breakdown"""
+        started = time.perf_counter()
+        connect = self.transport.ensure()
+
+        cmd = ['rsync', '-avz', '--delete', '-e', self.transport.rsync_shell()]
+        if bwlimit:
+            cmd.append(f"--bwlimit={bwlimit}")
+        if extra_args:
+            cmd += extra_args
+        cmd += [src, dst]
+        transfer_started = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        finished = time.perf_counter()
+
+        self.last_timings = {
+            'connect': connect,
+            'transfer': finished - transfer_started,
+            'total': finished - started,
+            'reused_connection': connect == 0.0
+        }
+        return result
+
+    def _format_timings(self):
+        t = self.last_timings
+        reuse = "reused" if t.get('reused_connection') else "new"
+        return (f"connect {t['connect'] * 1000:.0f} ms ({reuse}), "
+                f"transfer {t['transfer'] * 1000:.0f} ms, total {t['total'] * 1000:.0f} ms")
         
     def create_backup(self):
         """Create initial backup using rsync"""
@@ -19,26 +201,12 @@ class RsyncBackup:
             # Create backup directory if it doesn't exist
             os.makedirs(self.backup_path, exist_ok=True)
             
-            # Build rsync command
-            cmd = [
-                'rsync',
-                '-avz',
-                '--delete',
-                f"{self.ssh_config['username']}@{self.ssh_config['host']}:{self.source}/",
-                f"{self.backup_path}/"
-            ]
-            
-            # Add SSH options if key is provided
-            if self.ssh_config.get('key_path'):
-                cmd.insert(1, f"-e ssh -i {self.ssh_config['key_path']} -p {self.ssh_config['port']}")
-            else:
-                cmd.insert(1, f"-e ssh -p {self.ssh_config['port']}")
-            
-            self.console.print(f"[cyan]Creating backup: {' '.join(cmd)}[/cyan]")
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            remote = f"{self.ssh_config['username']}@{self.ssh_config['host']}:{self.source}/"
+            self.console.print(f"[cyan]Creating backup: {remote} → {self.backup_path}/[/cyan]")
+            result = self._run_rsync(remote, f"{self.backup_path}/")
             
             if result.returncode == 0:
-                self.console.print("[green]✓ Backup created successfully[/green]")
+                self.console.print(f"[green]✓ Backup created successfully ({self._format_timings()})[/green]")
                 return True
             else:
                 self.console.print(f"[red]✗ Backup failed: {result.stderr}[/red]")
@@ -48,29 +216,27 @@ class RsyncBackup:
             self.console.print(f"[red]✗ Backup error: {str(e)}[/red]")
             return False
     
-    def restore_from_backup(self):
-        """Restore files from backup to remote server"""
+    def restore_from_backup(self, bwlimit=None):
+        """Restore files from backup to remote server
+
+        Args:
+            bwlimit: Optional rsync bandwidth cap in KiB/s
+        """
         try:
-            # Build rsync command for restore
-            cmd = [
-                'rsync',
-                '-avz',
-                '--delete',
-                f"{self.backup_path}/",
-                f"{self.ssh_config['username']}@{self.ssh_config['host']}:{self.source}/"
-            ]
-            
-            # Add SSH options if key is provided
-            if self.ssh_config.get('key_path'):
-                cmd.insert(1, f"-e ssh -i {self.ssh_config['key_path']} -p {self.ssh_config['port']}")
-            else:
-                cmd.insert(1, f"-e ssh -p {self.ssh_config['port']}")
+            remote = f"{self.ssh_config['username']}@{self.ssh_config['host']}:{self.source}/"
             
             self.console.print(f"[yellow]Restoring from backup...[/yellow]")
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = self._run_rsync(
+                f"{self.backup_path}/", remote, bwlimit=bwlimit,
+                extra_args=[f"--out-format={RSYNC_RESTORE_OUT_FORMAT}"]
+            )
             
             if result.returncode == 0:
-                self.console.print("[green]✓ Restore completed successfully[/green]")
+                # Tell the detectors exactly what this restore wrote
+                restored = parse_rsync_itemized(result.stdout, self.source)
+                if restored:
+                    get_restore_ledger().publish(self.ssh_config['host'], restored)
+                self.console.print(f"[green]✓ Restore completed successfully ({self._format_timings()})[/green]")
                 return True
             else:
                 self.console.print(f"[red]✗ Restore failed: {result.stderr}[/red]")
@@ -80,25 +246,121 @@ class RsyncBackup:
             self.console.print(f"[red]✗ Restore error: {str(e)}[/red]")
             return False
     
-    def run_restore_loop(self, stop_event, interval=5):
-        """Run continuous restore loop"""
+    def populate_staging(self, remote_dir):
+        """Push the local backup into ``remote_dir`` (the swap strategy's staging copy)"""
+        remote = f"{self.ssh_config['username']}@{self.ssh_config['host']}:{remote_dir}/"
+        result = self._run_rsync(f"{self.backup_path}/", remote)
+        if result.returncode != 0:
+            self.console.print(f"[red]✗ Staging copy upload failed: {result.stderr}[/red]")
+        return result.returncode == 0
+
+    def swap_restore(self, swap, watcher, reason):
+        """Swap the staged copy in for the live tree; falls back to rsync on failure"""
+        self.console.print(f"[bold red]⚠ Large compromise detected: {reason}[/bold red]")
+        restored = swap.swap()
+        if restored is None:
+            return self.restore_from_backup()
+        get_restore_ledger().publish(self.ssh_config['host'], restored)
+        # inotify watches followed the old tree when it was renamed away
+        if watcher:
+            watcher.restart()
+        return True
+
+    def _restore(self, scheduler=None, priority=PRIORITY_NORMAL, stop_event=None):
+        if not scheduler:
+            return self.restore_from_backup()
+        job = scheduler.submit(self, priority)
+        # Don't outlive the loop: stop waiting once it is asked to stop
+        while not job.done.wait(timeout=1):
+            if stop_event is not None and stop_event.is_set():
+                return None
+        return job.result
+
+    def run_restore_loop(self, stop_event, interval=5, scheduler=None, watch=True, strategy="rsync"):
+        """Run continuous restore loop
+
+        Restores are driven by the resident remote watcher (watcher.py): a
+        burst of pushed changes costs one restore, plus a safety-net restore
+        every SAFETY_NET_RESTORE_INTERVAL seconds. Until the watcher reports
+        ready, or with ``watch=False``, the loop restores every ``interval``
+        seconds instead.
+
+        When a RestoreScheduler is given, each cycle is queued on it instead of
+        running rsync directly, so the fleet shares its worker and bandwidth limits.
+
+        With ``strategy="swap"`` a staged copy of the backup is kept next to
+        the live path, and a burst of at least SWAP_RESTORE_THRESHOLD changed
+        paths swaps it in for the whole tree (swap_restore.py) instead of
+        restoring file by file.
+        """
         self.console.print("[cyan]Starting restore loop...[/cyan]")
         
         # Create initial backup
         if not self.create_backup():
             self.console.print("[red]✗ Failed to create initial backup[/red]")
             return
-        
-        while not stop_event.is_set():
-            try:
-                time.sleep(interval)
-                if not stop_event.is_set():
-                    self.restore_from_backup()
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                self.console.print(f"[red]✗ Restore loop error: {str(e)}[/red]")
-                time.sleep(interval)
+
+        swap = None
+        if strategy == "swap":
+            swap = StagedSwapRestore(self.transport, self.source, populate=self.populate_staging)
+            if not swap.prepare():
+                self.console.print("[yellow]Staged swap unavailable, restoring with rsync only[/yellow]")
+                swap = None
+
+        changed = threading.Event()
+        changed_paths = []
+        changed_lock = threading.Lock()
+
+        def on_remote_change(event):
+            with changed_lock:
+                changed_paths.append(event['path'])
+                changed.set()
+
+        watcher = None
+        if watch:
+            watcher = get_remote_watcher(self.ssh_config, self.source)
+            watcher.subscribe(on_remote_change)
+            if not watcher.wait_ready(timeout=10):
+                self.console.print("[yellow]Remote watcher not ready yet, restoring every "
+                                   f"{interval}s until it starts[/yellow]")
+
+        last_restore_time = time.time()
+        try:
+            while not stop_event.is_set():
+                try:
+                    if changed.wait(timeout=0.5):
+                        time.sleep(CHANGE_SETTLE_DELAY)
+                        with changed_lock:
+                            changed.clear()
+                            paths, changed_paths[:] = list(changed_paths), []
+                        if stop_event.is_set():
+                            break
+
+                        reason = f"Unauthorized change to {paths[0]}"
+                        if len(paths) > 1:
+                            reason += f" (+{len(paths) - 1} more)"
+                        if swap and len(set(paths)) >= SWAP_RESTORE_THRESHOLD:
+                            self.swap_restore(swap, watcher, reason)
+                        else:
+                            self.console.print(f"[bold red]⚠ {reason}[/bold red]")
+                            self._restore(scheduler, PRIORITY_HIGH, stop_event)
+                        last_restore_time = time.time()
+                        continue
+
+                    # Periodic restore regardless of changes (safety net)
+                    watching = watcher is not None and watcher.ready_event.is_set()
+                    period = SAFETY_NET_RESTORE_INTERVAL if watching else interval
+                    if time.time() - last_restore_time >= period and not stop_event.is_set():
+                        self._restore(scheduler, PRIORITY_NORMAL, stop_event)
+                        last_restore_time = time.time()
+                except KeyboardInterrupt:
+                    break
+                except Exception as e:
+                    self.console.print(f"[red]✗ Restore loop error: {str(e)}[/red]")
+                    time.sleep(interval)
+        finally:
+            if watcher:
+                watcher.unsubscribe(on_remote_change)
 
 
 class RsyncBackupProtect(RsyncBackup):
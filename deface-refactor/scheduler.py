@@ -0,0 +1,207 @@
+# scheduler.py
+import heapq
+import itertools
+import threading
+import time
+from rich.console import Console
+
+console = Console()
+
+# Lower value runs first
+PRIORITY_HIGH = 0      # restore triggered by a detected change
+PRIORITY_NORMAL = 5    # periodic safety-net restore
+
+
+class RestoreJob:
+    """A queued restore of one RsyncBackup"""
+
+    def __init__(self, backup, priority, seq):
+        self.backup = backup
+        self.priority = priority
+        self.seq = seq
+        self.host = backup.ssh_config['host']
+        self.key = (backup.ssh_config['host'], backup.ssh_config['port'], backup.source)
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.done = threading.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wait(self, timeout=None):
+        """Block until the restore ran; returns its result (None on timeout)"""
+        self.done.wait(timeout)
+        return self.result
+
+
+class RestoreScheduler:
+    """Fleet-wide restore queue with a global worker pool.
+
+    Jobs are served by priority, at most ``per_host_limit`` run against the
+    same host at once, and ``bandwidth_kbps`` (KiB/s, rsync ``--bwlimit``
+    units) is split evenly over the ``max_workers`` slots, so the restores
+    running at any moment never exceed it together.
+    A restore already queued for the same target is coalesced, so a storm
+    of detections does not pile up redundant rsync runs.
+    """
+
+    def __init__(self, max_workers=8, per_host_limit=2, bandwidth_kbps=None):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.bandwidth_kbps = bandwidth_kbps
+        self.console = console
+
+        self.pending = []
+        self.pending_by_key = {}
+        self.running_by_host = {}
+        self.running = 0
+        self.seq = itertools.count()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.workers = []
+
+        self.stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'completed': 0,
+            'failed': 0,
+            'total_wait': 0.0,
+            'total_runtime': 0.0
+        }
+
+    def start(self):
+        """Start the worker pool (idempotent)"""
+        with self.condition:
+            if self.workers:
+                return
+            self.stop_event.clear()
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._worker, name=f"restore-worker-{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        self.console.print(f"[cyan]Restore scheduler started: {self.max_workers} workers, "
+                           f"{self.per_host_limit} per host, bandwidth "
+                           f"{f'{self.bandwidth_kbps} KiB/s' if self.bandwidth_kbps else 'unlimited'}[/cyan]")
+
+    def stop(self):
+        """Stop the workers; jobs still queued finish as failed"""
+        self.stop_event.set()
+        with self.condition:
+            cancelled, self.pending = self.pending, []
+            self.pending_by_key.clear()
+            self.condition.notify_all()
+        for job in cancelled:
+            job.result = False
+            job.done.set()
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.workers = []
+
+    def submit(self, backup, priority=PRIORITY_NORMAL) -> RestoreJob:
+        """Queue a restore; returns the job (an existing one if coalesced)"""
+        self.start()
+        with self.condition:
+            self.stats['submitted'] += 1
+            key = (backup.ssh_config['host'], backup.ssh_config['port'], backup.source)
+            queued = self.pending_by_key.get(key)
+            if queued is not None:
+                self.stats['coalesced'] += 1
+                if priority < queued.priority:
+                    queued.priority = priority
+                    heapq.heapify(self.pending)
+                return queued
+
+            job = RestoreJob(backup, priority, next(self.seq))
+            heapq.heappush(self.pending, job)
+            self.pending_by_key[key] = job
+            self.condition.notify()
+            return job
+
+    def _next_job(self):
+        """Pop the highest-priority job whose host has a free slot (lock held)"""
+        skipped = []
+        job = None
+        while self.pending:
+            candidate = heapq.heappop(self.pending)
+            if self.running_by_host.get(candidate.host, 0) < self.per_host_limit:
+                job = candidate
+                break
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self.pending, candidate)
+        return job
+
+    def _bwlimit(self):
+        """Per-restore share of the bandwidth budget.
+
+        rsync fixes --bwlimit at start and a running restore cannot be
+        throttled later, so every slot gets an equal share up front.
+        """
+        if not self.bandwidth_kbps:
+            return None
+        return max(1, self.bandwidth_kbps // self.max_workers)
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                job = self._next_job()
+                if job is None:
+                    self.condition.wait(timeout=1)
+                    continue
+                del self.pending_by_key[job.key]
+                self.running += 1
+                self.running_by_host[job.host] = self.running_by_host.get(job.host, 0) + 1
+                bwlimit = self._bwlimit()
+
+            job.started_at = time.time()
+            try:
+                job.result = job.backup.restore_from_backup(bwlimit=bwlimit)
+            except Exception as e:
+                self.console.print(f"[red]✗ Scheduled restore error for {job.host}: {str(e)}[/red]")
+                job.result = False
+            job.finished_at = time.time()
+
+            with self.condition:
+                self.running -= 1
+                self.running_by_host[job.host] -= 1
+                if not self.running_by_host[job.host]:
+                    del self.running_by_host[job.host]
+                self.stats['completed' if job.result else 'failed'] += 1
+                self.stats['total_wait'] += job.started_at - job.submitted_at
+                self.stats['total_runtime'] += job.finished_at - job.started_at
+                # A freed host slot may unblock a deferred job
+                self.condition.notify_all()
+            job.done.set()
+
+    def metrics(self) -> dict:
+        """Queue depth, in-flight counts and cumulative timings"""
+        with self.condition:
+            finished = self.stats['completed'] + self.stats['failed']
+            return {
+                'queue_depth': len(self.pending),
+                'running': self.running,
+                'running_by_host': dict(self.running_by_host),
+                'submitted': self.stats['submitted'],
+                'coalesced': self.stats['coalesced'],
+                'completed': self.stats['completed'],
+                'failed': self.stats['failed'],
+                'avg_wait_seconds': self.stats['total_wait'] / finished if finished else 0.0,
+                'avg_runtime_seconds': self.stats['total_runtime'] / finished if finished else 0.0,
+                'bandwidth_kbps': self.bandwidth_kbps
+            }
+
+
+# Singleton instance
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_restore_scheduler(max_workers=8, per_host_limit=2, bandwidth_kbps=None) -> RestoreScheduler:
+    """Get the process-wide restore scheduler (arguments apply on first call)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RestoreScheduler(max_workers, per_host_limit, bandwidth_kbps)
+        return _scheduler
@@ -0,0 +1,241 @@
+# spool.py
+import json
+import os
+import struct
+import threading
+import time
+from rich.console import Console
+
+from codec import decode_batch, encode_batch
+
+console = Console()
+
+# Record framing inside a segment: 4-byte big-endian body length, then the body
+RECORD_HEADER = struct.Struct('>I')
+
+DEFAULT_SEGMENT_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+# Record body prefix of a binary event ('xadd_event'); other writes are JSON lists
+EVENT_RECORD = b'E'
+NAME_LENGTH = struct.Struct('>H')
+
+
+def encode_record(item) -> bytes:
+    """Serialize one publisher write ``(command, key, payload)``"""
+    command, key, payload = item
+    if command == 'xadd_event':
+        queue_name, event = payload
+        stream, queue_name = key.encode(), queue_name.encode()
+        return b''.join((
+            EVENT_RECORD,
+            NAME_LENGTH.pack(len(stream)), stream,
+            NAME_LENGTH.pack(len(queue_name)), queue_name,
+            encode_batch([event])
+        ))
+    return json.dumps(list(item), separators=(',', ':')).encode('utf-8')
+
+
+def decode_record(body: bytes):
+    if body[:1] == EVENT_RECORD:
+        pos = 1
+        names = []
+        for _ in range(2):
+            (length,) = NAME_LENGTH.unpack_from(body, pos)
+            pos += NAME_LENGTH.size
+            names.append(body[pos:pos + length].decode())
+            pos += length
+        stream, queue_name = names
+        return 'xadd_event', stream, (queue_name, decode_batch(body[pos:])[0])
+    command, key, payload = json.loads(body)
+    return command, key, payload
+
+
+class EventSpool:
+    """Append-only on-disk buffer for events that could not reach Redis.
+
+    Records are appended to numbered segment files; a segment is closed once
+    it exceeds ``segment_bytes``. Writes are flushed immediately but fsynced
+    at most every ``fsync_interval`` seconds, so a burst costs one fsync
+    instead of one per event. Disk usage is capped at ``max_bytes`` by
+    dropping the oldest segments (counted in the metrics). Replay sends
+    records oldest-first and deletes each segment once it was fully sent;
+    a crash mid-segment re-sends that segment (at-least-once delivery).
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, max_bytes=DEFAULT_MAX_BYTES,
+                 fsync_interval=0.2):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.console = console
+        self.lock = threading.Lock()
+
+        self.segments = {}      # seq -> {'bytes': n, 'records': n}
+        self.offsets = {}       # seq -> records already replayed
+        self.active_seq = None
+        self.active_file = None
+        self.dirty = False
+        self.last_sync = time.monotonic()
+        self.stats = {
+            'appended': 0,
+            'replayed': 0,
+            'dropped': 0,
+            'fsyncs': 0,
+            'recovered': 0
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"spool-{seq:012d}.seg")
+
+    def _read_segment(self, seq):
+        """Return the complete records of a segment, truncating a torn tail"""
+        path = self._segment_path(seq)
+        records = []
+        with open(path, 'rb') as f:
+            data = f.read()
+        pos = 0
+        while pos + RECORD_HEADER.size <= len(data):
+            (length,) = RECORD_HEADER.unpack_from(data, pos)
+            end = pos + RECORD_HEADER.size + length
+            if end > len(data):
+                break
+            records.append(data[pos + RECORD_HEADER.size:end])
+            pos = end
+        if pos != len(data):
+            # Partial record from a crash during append
+            with open(path, 'r+b') as f:
+                f.truncate(pos)
+        return records, pos
+
+    def _recover(self):
+        """Index segments left by a previous run"""
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith('spool-') and name.endswith('.seg')):
+                continue
+            seq = int(name[len('spool-'):-len('.seg')])
+            records, size = self._read_segment(seq)
+            if not records:
+                os.remove(self._segment_path(seq))
+                continue
+            self.segments[seq] = {'bytes': size, 'records': len(records)}
+            self.stats['recovered'] += len(records)
+        if self.stats['recovered']:
+            self.console.print(f"[yellow]Recovered {self.stats['recovered']} spooled events from {self.directory}[/yellow]")
+
+    def _open_segment(self):
+        seq = max(self.segments, default=0) + 1
+        self.active_seq = seq
+        self.active_file = open(self._segment_path(seq), 'ab')
+        self.segments[seq] = {'bytes': 0, 'records': 0}
+
+    def _close_active(self):
+        if self.active_file:
+            self._sync()
+            self.active_file.close()
+            self.active_file = None
+            self.active_seq = None
+
+    def _sync(self):
+        if self.active_file and self.dirty:
+            self.active_file.flush()
+            os.fsync(self.active_file.fileno())
+            self.dirty = False
+            self.stats['fsyncs'] += 1
+        self.last_sync = time.monotonic()
+
+    def _enforce_limit(self):
+        total = sum(s['bytes'] for s in self.segments.values())
+        for seq in sorted(self.segments):
+            if total <= self.max_bytes or seq == self.active_seq:
+                break
+            segment = self.segments.pop(seq)
+            dropped = segment['records'] - self.offsets.pop(seq, 0)
+            os.remove(self._segment_path(seq))
+            total -= segment['bytes']
+            self.stats['dropped'] += dropped
+            self.console.print(f"[red]Spool limit reached, dropped {dropped} oldest events[/red]")
+
+    def append(self, items):
+        """Append a batch of ``(command, key, payload)`` writes"""
+        with self.lock:
+            for item in items:
+                if self.active_file is None:
+                    self._open_segment()
+                body = encode_record(item)
+                record = RECORD_HEADER.pack(len(body)) + body
+                self.active_file.write(record)
+                segment = self.segments[self.active_seq]
+                segment['bytes'] += len(record)
+                segment['records'] += 1
+                self.stats['appended'] += 1
+                self.dirty = True
+                if segment['bytes'] >= self.segment_bytes:
+                    self._close_active()
+                    self._enforce_limit()
+            if self.active_file:
+                self.active_file.flush()
+            if time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def sync(self):
+        """fsync the active segment if it has unsynced writes"""
+        with self.lock:
+            self._sync()
+
+    def pending(self) -> int:
+        """Number of spooled records not yet replayed"""
+        with self.lock:
+            return sum(s['records'] for s in self.segments.values()) - sum(self.offsets.values())
+
+    def replay(self, sender, batch_size=500, limit=None) -> int:
+        """Send spooled records oldest-first through ``sender(items)``.
+
+        Stops early after ``limit`` records so the caller can interleave new
+        writes; an exception from ``sender`` propagates and the unsent
+        records stay spooled. Returns the number of records sent.
+        """
+        sent = 0
+        with self.lock:
+            # Close the active segment so replay owns every record written so far
+            if self.active_seq is not None and self.segments[self.active_seq]['records']:
+                self._close_active()
+            order = sorted(seq for seq in self.segments if seq != self.active_seq)
+
+        for seq in order:
+            records, _ = self._read_segment(seq)
+            offset = self.offsets.get(seq, 0)
+            while offset < len(records):
+                if limit is not None and sent >= limit:
+                    return sent
+                size = batch_size if limit is None else min(batch_size, limit - sent)
+                chunk = records[offset:offset + size]
+                sender([decode_record(body) for body in chunk])
+                offset += len(chunk)
+                sent += len(chunk)
+                with self.lock:
+                    self.offsets[seq] = offset
+                    self.stats['replayed'] += len(chunk)
+
+            with self.lock:
+                self.segments.pop(seq, None)
+                self.offsets.pop(seq, None)
+                os.remove(self._segment_path(seq))
+        return sent
+
+    def metrics(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['segments'] = len(self.segments)
+            stats['bytes'] = sum(s['bytes'] for s in self.segments.values())
+            stats['pending'] = sum(s['records'] for s in self.segments.values()) - sum(self.offsets.values())
+        return stats
+
+    def close(self):
+        with self.lock:
+            self._close_active()
@@ -14,6 +14,9 @@ from rich.table import Table
 from rich.prompt import Prompt, Confirm
 import getpass
 
+from restore_ledger import get_restore_ledger
+from codec import file_event
+
 @dataclass
 class SSHConfig:
     host: str
@@ -47,6 +50,7 @@ class FileOperationsMonitor:
         self.changes_queue = queue.Queue()
         self.console = Console()
         self.db_lock = threading.Lock()  # Add a mutex lock for database operations
+        self.redis = None  # RedisConfig injected by the manager
         
         # Configure logger with minimal format
         self.logger = logging.getLogger(f"FileOps-{ssh_config.host}")
@@ -223,11 +227,14 @@ class FileOperationsMonitor:
         # Track current paths for future comparison
         current_paths = set(new_files.keys())
         
+        # Paths our own restore just rewrote need no external-source lookup
+        ledger = get_restore_ledger()
+        
         # Try to detect the external location for files that appear
         for path in created_files:
             # Look for matching files that were recently deleted from outside our view
             matching_external = None
-            if hasattr(self, 'last_external_check_time'):
+            if hasattr(self, 'last_external_check_time') and not ledger.expects(self.ssh_config.host, path):
                 # Check if the file was recently moved from outside
                 try:
                     # Execute 'find' command to look for recently modified files with same size
@@ -290,7 +297,9 @@ class FileOperationsMonitor:
             for dest_path in dest_paths:
                 self._log_operation('MOVE', source_path, dst_path=dest_path, details={
                     'source_size': old_files[source_path]['size'],
-                    'source_mtime': old_files[source_path]['mtime']
+                    'source_mtime': old_files[source_path]['mtime'],
+                    'destination_size': new_files[dest_path]['size'],
+                    'destination_mtime': new_files[dest_path]['mtime']
                 })
                 detected_changes = True
                 processed_created.add(dest_path)
@@ -304,7 +313,9 @@ class FileOperationsMonitor:
                 if dest_path not in processed_created:  # Only process if not already identified as a move
                     self._log_operation('COPY', source_path, dst_path=dest_path, details={
                         'source_size': old_files[source_path]['size'],
-                        'source_mtime': old_files[source_path]['mtime']
+                        'source_mtime': old_files[source_path]['mtime'],
+                        'destination_size': new_files[dest_path]['size'],
+                        'destination_mtime': new_files[dest_path]['mtime']
                     })
                     detected_changes = True
                     processed_created.add(dest_path)
@@ -329,7 +340,10 @@ class FileOperationsMonitor:
         # Process remaining created files that weren't identified as moves or copies
         for path in created_files:
             if path not in processed_created:
-                self._log_operation('CREATE', path)
+                self._log_operation('CREATE', path, details={
+                    'new_size': new_files[path]['size'],
+                    'new_mtime': new_files[path]['mtime']
+                })
                 detected_changes = True
                 self.logger.info(f"Created: {path}")
 
@@ -339,24 +353,26 @@ class FileOperationsMonitor:
                 # Try to find where it might have gone
                 external_dest = "Unknown location"
                 
-                try:
-                    # Use the find command to see if we can locate the file elsewhere
-                    filename = os.path.basename(path)
-                    cmd = f"find /home /var/www /opt -name '{filename}' -type f -mtime -1 2>/dev/null | grep -v '{self.config.path}' | head -1"
-                    _, stdout, _ = self.ssh_client.exec_command(cmd)
-                    potential_dest = stdout.read().decode().strip()
+                # Files removed by our own restore were not moved anywhere
+                if not ledger.expects(self.ssh_config.host, path):
+                    try:
+                        # Use the find command to see if we can locate the file elsewhere
+                        filename = os.path.basename(path)
+                        cmd = f"find /home /var/www /opt -name '{filename}' -type f -mtime -1 2>/dev/null | grep -v '{self.config.path}' | head -1"
+                        _, stdout, _ = self.ssh_client.exec_command(cmd)
+                        potential_dest = stdout.read().decode().strip()
                     
-                    if potential_dest:
-                        # Verify the file exists and has similar size
-                        try:
-                            remote_stat = self.ssh_client.exec_command(f"stat -c '%s' '{potential_dest}' 2>/dev/null")[1].read().decode().strip()
-                            if remote_stat and int(remote_stat) == old_files[path]['size']:
-                                external_dest = potential_dest
-                                self.external_paths_cache[path] = external_dest
-                        except Exception:
-                            pass
-                except Exception as e:
-                    self.logger.debug(f"Error finding external destination: {e}")
+                        if potential_dest:
+                            # Verify the file exists and has similar size
+                            try:
+                                remote_stat = self.ssh_client.exec_command(f"stat -c '%s' '{potential_dest}' 2>/dev/null")[1].read().decode().strip()
+                                if remote_stat and int(remote_stat) == old_files[path]['size']:
+                                    external_dest = potential_dest
+                                    self.external_paths_cache[path] = external_dest
+                            except Exception:
+                                pass
+                    except Exception as e:
+                        self.logger.debug(f"Error finding external destination: {e}")
                 
                 self._log_operation('EXTERNAL_DELETE', path, dst_path=external_dest, details={
                     'old_size': old_files[path]['size'],
@@ -392,7 +408,55 @@ class FileOperationsMonitor:
         if detected_changes:
             self.console.print(f"[bold yellow]Changes detected at {datetime.now().strftime('%H:%M:%S')}[/bold yellow]")
 
+    def _handle_restored(self, operation: str, src_path: str, dst_path: str = None, details: dict = None) -> bool:
+        """Match a change against the restore ledger.
+
+        Returns True when the change was written by our own restore; the
+        first such change of a path is recorded as a single RESTORED event.
+        A change without the attributes to compare is never treated as one.
+        """
+        details = details or {}
+
+        def file_attrs(prefix):
+            size, mtime = details.get(f'{prefix}_size'), details.get(f'{prefix}_mtime')
+            if size is None or mtime is None:
+                return None
+            return {'is_dir': False, 'size': size, 'mtime': mtime}
+
+        if operation in ('CREATE', 'MODIFY'):
+            claims = [(src_path, file_attrs('new'), False)]
+        elif operation == 'CREATE_DIR':
+            mtime = details.get('creation_time')
+            claims = [(src_path, {'is_dir': True, 'mtime': mtime} if mtime is not None else None, False)]
+        elif operation == 'EXTERNAL_MOVE':
+            claims = [(dst_path, file_attrs('destination'), False)]
+        elif operation in ('DELETE', 'DELETE_DIR', 'EXTERNAL_DELETE'):
+            claims = [(src_path, None, True)]
+        elif operation in ('MOVE', 'COPY'):
+            claims = [(dst_path, file_attrs('destination'), False)]
+            if operation == 'MOVE':
+                claims.append((src_path, None, True))
+        else:
+            return False
+        if any(attrs is None and not deleted for _, attrs, deleted in claims):
+            return False
+
+        ledger = get_restore_ledger()
+        results = [(path, ledger.claim(self.ssh_config.host, path, attrs, deleted))
+                   for path, attrs, deleted in claims]
+        if any(result is None for _, result in results):
+            return False
+
+        for path, result in results:
+            if result == 'restored':
+                self._log_operation('RESTORED', path, details={
+                    'note': 'Reverted to backup by active restore'
+                })
+        return True
+
     def _log_operation(self, operation: str, src_path: str, dst_path: str = None, details: dict = None):
+        if operation != 'RESTORED' and self._handle_restored(operation, src_path, dst_path, details):
+            return
         try:
             record = {
                 'timestamp': time.time(),
@@ -418,6 +482,9 @@ class FileOperationsMonitor:
                 ))
                 self.conn.commit()
 
+            if self.redis:
+                self.redis.add_event("file_ops", file_event(record, details, self.ssh_config.host))
+
             # Generate a descriptive message based on operation type
             message_parts = []
             if operation == 'COPY':
@@ -442,6 +509,8 @@ class FileOperationsMonitor:
                     message_parts.append(f"Previous size: {details.get('old_size', 'unknown')}")
             elif operation == 'DELETE_DIR':
                 message_parts.append(f"Directory deleted: {src_path}")
+            elif operation == 'RESTORED':
+                message_parts.append(f"Restored from backup: {src_path}")
             elif operation == 'MODIFY':
                 message_parts.append(f"File modified: {src_path}")
                 if details:
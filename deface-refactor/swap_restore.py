@@ -0,0 +1,176 @@
+# swap_restore.py
+import os
+import shlex
+import threading
+import time
+from rich.console import Console
+
+console = Console()
+
+# Number of compromised trees kept next to the live path for forensics
+DEFAULT_FORENSICS_KEEP = 3
+
+# find -printf listing of a tree in restore-ledger terms: path|size|mode|type|mtime
+LISTING_FORMAT = "'%P|%s|%m|%y|%T@\\n'"
+
+
+class StagedSwapRestore:
+    """Bulk restore by swapping a pre-built copy of the backup into place.
+
+    A staging copy of the backup is kept ready next to the live path, so it
+    sits on the same filesystem and can be renamed over the live tree. On a
+    large compromise the live tree flips to known-good in one rename
+    (``mv --exchange`` where coreutils supports it, two back-to-back renames
+    otherwise) instead of file-by-file rsync. The compromised tree is moved
+    aside for forensics and the next staging copy is rebuilt in the
+    background.
+
+    The staging copy is a real copy (``cp --reflink=auto`` shares blocks on
+    CoW filesystems) rather than hardlinks: hardlinked live files would share
+    inodes with the backup, and an in-place write to the live site would
+    silently corrupt the backup as well.
+
+    The staging copy is built either from a backup on the remote host
+    (``backup_path``) or by ``populate(remote_dir)``, e.g. an rsync push of
+    a local backup. ``ssh_client`` is a paramiko client or any object with
+    ``run(cmd) -> (status, stdout, stderr)`` such as rsync.SSHMaster.
+    """
+
+    def __init__(self, ssh_client, live_path, backup_path=None, populate=None,
+                 forensics_keep=DEFAULT_FORENSICS_KEEP):
+        if not backup_path and not populate:
+            raise ValueError("StagedSwapRestore needs a remote backup_path or a populate callable")
+        self.ssh_client = ssh_client
+        self.live_path = live_path.rstrip('/')
+        self.backup_path = backup_path.rstrip('/') if backup_path else None
+        self.populate = populate
+        self.forensics_keep = forensics_keep
+        self.console = console
+
+        parent, name = os.path.split(self.live_path)
+        self.parent = parent or '/'
+        self.name = name
+        self.staging_path = os.path.join(self.parent, f".{name}.staging")
+        self.forensics_prefix = os.path.join(self.parent, f".{name}.compromised-")
+
+        self.lock = threading.Lock()
+        self.ready = False
+        self.staged_entries = {}
+
+    def _exec(self, cmd):
+        if hasattr(self.ssh_client, 'run'):
+            return self.ssh_client.run(cmd)
+        stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
+        output = stdout.read().decode()
+        error = stderr.read().decode().strip()
+        status = stdout.channel.recv_exit_status()
+        return status, output, error
+
+    @staticmethod
+    def _parse_listing(output):
+        """Parse LISTING_FORMAT lines into ledger attributes"""
+        entries = {}
+        for line in output.splitlines():
+            parts = line.split('|')
+            if len(parts) != 5 or not parts[0]:
+                continue
+            rel, size, mode, kind, mtime = parts
+            is_dir = kind == 'd'
+            attrs = {'is_dir': is_dir, 'mode': int(mode, 8), 'mtime': int(float(mtime))}
+            if not is_dir:
+                attrs['size'] = int(size)
+            entries[rel] = attrs
+        return entries
+
+    def prepare(self):
+        """(Re)build the staging copy from the backup"""
+        with self.lock:
+            staging = shlex.quote(self.staging_path)
+            building_path = self.staging_path + ".building"
+            building = shlex.quote(building_path)
+            started = time.perf_counter()
+
+            cmd = f"rm -rf {building} && mkdir -p {building}"
+            if self.backup_path:
+                cmd += f" && cp -a --reflink=auto {shlex.quote(self.backup_path)}/. {building}/"
+            status, output, error = self._exec(cmd)
+            if status == 0 and self.populate and not self.populate(building_path):
+                status, error = 1, "populating the staging copy failed"
+            if status == 0:
+                status, output, error = self._exec(
+                    f"rm -rf {staging} && mv {building} {staging} && "
+                    f"find {staging} -mindepth 1 -printf {LISTING_FORMAT}"
+                )
+            if status != 0:
+                self.ready = False
+                self.console.print(f"[red]✗ Failed to prepare staging copy: {error}[/red]")
+                return False
+
+            self.staged_entries = self._parse_listing(output)
+            self.ready = True
+            self.console.print(f"[cyan]Staging copy ready at {self.staging_path} "
+                               f"({len(self.staged_entries)} entries, {time.perf_counter() - started:.1f}s)[/cyan]")
+            return True
+
+    def swap(self):
+        """Swap the staging copy in for the live tree.
+
+        Returns ``{absolute_path: attrs or None}`` for every path the swap
+        replaced or removed, suitable for RestoreLedger.publish(), or None
+        if the swap did not happen.
+        """
+        with self.lock:
+            if not self.ready:
+                return None
+
+            now = time.time()
+            forensics_path = f"{self.forensics_prefix}{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}"
+            live = shlex.quote(self.live_path)
+            staging = shlex.quote(self.staging_path)
+            forensics = shlex.quote(forensics_path)
+            cmd = (
+                f"test -d {staging} || exit 3; "
+                f"if mv --exchange {staging} {live} 2>/dev/null; then "
+                f"mv {staging} {forensics}; echo 'SWAPPED|exchange'; "
+                f"else mv {live} {forensics} && mv {staging} {live} && echo 'SWAPPED|rename'; fi && "
+                f"find {forensics} -mindepth 1 -printf {LISTING_FORMAT}"
+            )
+            started = time.perf_counter()
+            status, output, error = self._exec(cmd)
+            elapsed = time.perf_counter() - started
+            self.ready = False
+
+            if status != 0 or 'SWAPPED|' not in output:
+                self.console.print(f"[red]✗ Staged swap failed: {error or f'exit status {status}'}[/red]")
+                return None
+
+            method = output.split('SWAPPED|', 1)[1].split('\n', 1)[0]
+            compromised = self._parse_listing(output)
+            self.console.print(f"[green]✓ Live tree swapped to known-good copy ({method}, {elapsed * 1000:.0f} ms); "
+                               f"compromised tree kept at {forensics_path}[/green]")
+
+            restored = {}
+            for rel in compromised:
+                restored[os.path.join(self.live_path, rel)] = None
+            for rel, attrs in self.staged_entries.items():
+                restored[os.path.join(self.live_path, rel)] = attrs
+
+        # Rebuild the next staging copy and prune old forensics trees off the hot path
+        threading.Thread(target=self._cleanup, daemon=True).start()
+        return restored
+
+    def prune_forensics(self):
+        """Keep only the newest ``forensics_keep`` compromised trees"""
+        pattern = shlex.quote(self.forensics_prefix) + '*'
+        cmd = (
+            f"ls -1d {pattern} 2>/dev/null | sort -r | "
+            f"tail -n +{self.forensics_keep + 1} | while read -r d; do rm -rf \"$d\"; done"
+        )
+        self._exec(cmd)
+
+    def _cleanup(self):
+        try:
+            self.prune_forensics()
+            self.prepare()
+        except Exception as e:
+            self.console.print(f"[red]Staging cleanup error: {str(e)}[/red]")
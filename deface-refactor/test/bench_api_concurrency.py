@@ -0,0 +1,123 @@
+# test/bench_api_concurrency.py
+"""
+Throughput of the API's endpoints under concurrent clients.
+
+Requests are driven straight through the ASGI interface, so no server or
+HTTP client is needed.
+
+``--target model`` (default) is a model only, not api.py: two synthetic
+endpoints sleep for --latency seconds in place of a MySQL round trip, one
+as `async def` blocking the loop and one as plain `def` run in the thread
+pool (what api.py does). ``--target api`` runs api:app itself against the
+database in DATABASE_URL (same environment as the API), with the auth
+dependency replaced by a fixed admin user.
+
+    python test/bench_api_concurrency.py --latency 0.01 --requests 400
+    python test/bench_api_concurrency.py --target api --paths /api/servers "/api/activity?limit=50"
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from anyio import to_thread
+from fastapi import FastAPI
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+LATENCY = 0.01
+API_PATHS = ["/api/dashboard/stats", "/api/servers", "/api/activity?limit=50"]
+
+app = FastAPI()
+
+
+@app.get("/async-blocking")
+async def async_blocking():
+    time.sleep(LATENCY)  # sync Session.query() inside async def
+    return {"ok": True}
+
+
+@app.get("/threaded")
+def threaded():
+    time.sleep(LATENCY)
+    return {"ok": True}
+
+
+def load_api():
+    """api:app with authentication short-circuited to an admin user"""
+    global app
+    sys.path.insert(0, APP_DIR)
+    import api
+    from auth import User, get_current_active_user
+
+    admin = User(id=0, username="bench", email="bench@example.com", role="admin")
+    api.app.dependency_overrides[get_current_active_user] = lambda: admin
+    app = api.app
+
+
+async def call(path):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0),
+        "server": ("bench", 80)
+    }
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    assert status["code"] == 200, f"{path}: HTTP {status.get('code')}"
+
+
+async def run(path, requests, concurrency):
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(path)
+
+    async def worker():
+        while not queue.empty():
+            await call(queue.get_nowait())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - started)
+
+
+async def main():
+    global LATENCY
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("model", "api"), default="model")
+    parser.add_argument("--latency", type=float, default=LATENCY, help="Simulated query time in seconds (model)")
+    parser.add_argument("--paths", nargs="+", default=API_PATHS, help="Endpoints to drive (api)")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=30, help="Thread pool size (DB pool_size + max_overflow)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32, 64])
+    args = parser.parse_args()
+    LATENCY = args.latency
+    to_thread.current_default_thread_limiter().total_tokens = args.threads
+
+    if args.target == "api":
+        load_api()
+        print(f"{'clients':>8} " + " ".join(f"{path[:24]:>24}" for path in args.paths) + "  (req/s)")
+        for concurrency in args.concurrency:
+            rates = [await run(path, args.requests, concurrency) for path in args.paths]
+            print(f"{concurrency:>8} " + " ".join(f"{rate:>24,.0f}" for rate in rates))
+        return
+
+    print(f"{'clients':>8} {'async def req/s':>16} {'def req/s':>12}")
+    for concurrency in args.concurrency:
+        blocking = await run("/async-blocking", args.requests, concurrency)
+        threaded_rps = await run("/threaded", args.requests, concurrency)
+        print(f"{concurrency:>8} {blocking:>16,.0f} {threaded_rps:>12,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
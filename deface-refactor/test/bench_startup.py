@@ -0,0 +1,134 @@
+# test/bench_startup.py
+"""
+API worker cold start: ``import api`` and ``uvicorn api:app`` boot.
+
+Each run is a fresh interpreter. ``import`` times the module import alone
+and lists the slowest imports (python -X importtime); ``boot`` starts
+uvicorn and measures until /openapi.json answers, plus the worker's RSS.
+Needs the same environment as the API (DATABASE_URL, SECRET_KEY, ...).
+
+    python test/bench_startup.py --runs 5
+    # what the old top-level imports cost on top
+    python test/bench_startup.py --preload paramiko,permission_monitoring,ssh,red
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def preload_code(modules):
+    return "".join(f"import {name}\n" for name in modules)
+
+
+def time_import(args):
+    """Seconds for ``import api`` in a fresh interpreter, and the slowest modules"""
+    code = preload_code(args.preload) + "import api\n"
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=APP_DIR,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(result.stderr[-2000:])
+
+    # "import time: self [us] | cumulative | imported package"
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented below the module that imported them
+        if not name[1:].startswith(" "):
+            modules.append((int(cumulative), name.strip()))
+    return elapsed, sorted(modules, reverse=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def time_boot(args):
+    """Seconds from spawning uvicorn until it serves a request, and its RSS in MB"""
+    port = free_port()
+    code = preload_code(args.preload) + (
+        "import uvicorn\n"
+        f"uvicorn.run('api:app', host='127.0.0.1', port={port}, log_level='warning')\n"
+    )
+    url = f"http://127.0.0.1:{port}/openapi.json"
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=APP_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        while time.perf_counter() - started < args.timeout:
+            if proc.poll() is not None:
+                raise SystemExit(proc.stderr.read()[-2000:])
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                return time.perf_counter() - started, rss_mb(proc.pid)
+            except OSError:
+                time.sleep(0.02)
+        raise SystemExit(f"uvicorn did not answer within {args.timeout}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def summary(values):
+    return f"median {statistics.median(values):6.3f}s  min {min(values):6.3f}s  max {max(values):6.3f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", choices=("import", "boot", "both"), default="both")
+    parser.add_argument("--preload", type=lambda s: [m for m in s.split(",") if m], default=[],
+                        help="Comma-separated modules imported before api")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.preload:
+        print(f"preloading {', '.join(args.preload)}")
+    if args.mode in ("import", "both"):
+        timings = []
+        for _ in range(args.runs):
+            elapsed, modules = time_import(args)
+            timings.append(elapsed)
+        print(f"import api : {summary(timings)}")
+        for cumulative, name in modules[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+    if args.mode in ("boot", "both"):
+        timings, rss = [], []
+        for _ in range(args.runs):
+            elapsed, memory = time_boot(args)
+            timings.append(elapsed)
+            if memory is not None:
+                rss.append(memory)
+        print(f"uvicorn    : {summary(timings)}" + (f"  rss {statistics.median(rss):.0f} MB" if rss else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# test/bench_websocket.py
+"""
+WebSocket fan-out with thousands of simulated clients, a few of them slow.
+
+Compares the old sequential broadcast (await send_json on each socket in
+turn) with ConnectionManager's per-connection queues. Reports how long the
+broadcaster is blocked and when the last fast client received every
+message.
+
+    python test/bench_websocket.py --clients 5000 --slow 50 --messages 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from websocket_manager import ConnectionManager  # noqa: E402
+
+
+class FakeWebSocket:
+    """Stands in for starlette's WebSocket; each send takes ``delay`` seconds"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+        self.last_received_at = None
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def _deliver(self):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        self.last_received_at = time.perf_counter()
+
+    async def send_text(self, text):
+        await self._deliver()
+
+    async def send_json(self, message):
+        json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        await self._deliver()
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+def make_clients(args):
+    return [FakeWebSocket(args.slow_delay if i < args.slow else 0) for i in range(args.clients)]
+
+
+def message(i):
+    return {"type": "stats_update", "data": {"alertsToday": i, "restoredFiles": i // 2, "timestamp": time.time()}}
+
+
+async def sequential(args):
+    """The previous ConnectionManager.broadcast loop"""
+    clients = make_clients(args)
+    fast = clients[args.slow:]
+    started = time.perf_counter()
+    blocked = 0.0
+    for i in range(args.messages):
+        t = time.perf_counter()
+        for websocket in clients:
+            await websocket.send_json(message(i))
+        blocked += time.perf_counter() - t
+        await asyncio.sleep(args.interval)
+    return blocked, max(ws.last_received_at for ws in fast) - started, fast
+
+
+async def queued(args):
+    manager = ConnectionManager(queue_size=args.queue_size, send_timeout=args.send_timeout)
+    clients = make_clients(args)
+    for websocket in clients:
+        await manager.connect(websocket)
+    fast = clients[args.slow:]
+
+    started = time.perf_counter()
+    blocked = 0.0
+    for i in range(args.messages):
+        t = time.perf_counter()
+        await manager.broadcast(message(i))
+        blocked += time.perf_counter() - t
+        await asyncio.sleep(args.interval)
+    # A fast client is done once every message was delivered or dropped
+    fast_clients = [manager.active_connections[ws] for ws in fast]
+    while any(c.sent + c.dropped < args.messages for c in fast_clients):
+        await asyncio.sleep(0.001)
+    done = max(ws.last_received_at for ws in fast) - started
+
+    metrics = manager.metrics()
+    for websocket in list(manager.active_connections):
+        manager.disconnect(websocket)
+    return blocked, done, fast, metrics
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--slow", type=int, default=50, help="Clients whose every send is slow")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="Seconds per send for slow clients")
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between broadcasts")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--send-timeout", type=float, default=5.0)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients ({args.slow} slow at {args.slow_delay * 1000:.0f} ms/send), "
+          f"{args.messages} broadcasts")
+    if not args.skip_sequential:
+        blocked, done, _ = await sequential(args)
+        print(f"sequential : broadcaster blocked {blocked:8.3f}s, fast clients done after {done:8.3f}s")
+    blocked, done, fast, metrics = await queued(args)
+    print(f"queued     : broadcaster blocked {blocked:8.3f}s, fast clients done after {done:8.3f}s")
+    print(f"             dropped {metrics['dropped']}, slow disconnects {metrics['slow_disconnects']}, "
+          f"still queued {metrics['queued']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+# test/test_spool.py
+"""
+EventSpool replay limits.
+
+    python -m pytest test/test_spool.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from spool import EventSpool  # noqa: E402
+
+
+def spool_with(tmp_path, count):
+    spool = EventSpool(str(tmp_path))
+    spool.append([('lpush', 'file_events', f'{{"n": {i}}}') for i in range(count)])
+    return spool
+
+
+def replay_all(spool, batch_size, limit):
+    """Items of every sender call, one replay(limit=...) after another"""
+    calls = []
+    while spool.pending():
+        sent = spool.replay(calls.append, batch_size=batch_size, limit=limit)
+        assert sent <= limit
+    return calls
+
+
+def test_limit_smaller_than_batch(tmp_path):
+    spool = spool_with(tmp_path, 20)
+    calls = []
+    assert spool.replay(calls.append, batch_size=7, limit=5) == 5
+    assert [len(items) for items in calls] == [5]
+    assert spool.pending() == 15
+
+
+def test_limit_not_a_multiple_of_batch(tmp_path):
+    spool = spool_with(tmp_path, 20)
+    calls = []
+    assert spool.replay(calls.append, batch_size=7, limit=10) == 10
+    assert [len(items) for items in calls] == [7, 3]
+    assert spool.pending() == 10
+
+    calls = replay_all(spool, batch_size=7, limit=10)
+    assert [len(items) for items in calls] == [7, 3]
+    assert spool.pending() == 0
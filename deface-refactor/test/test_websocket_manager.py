@@ -0,0 +1,91 @@
+# test/test_websocket_manager.py
+"""
+ConnectionManager fan-out and replay against in-memory WebSockets.
+
+    python -m pytest test/test_websocket_manager.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from websocket_manager import DISCONNECT, ConnectionManager  # noqa: E402
+
+
+class FakeWebSocket:
+    """Stands in for starlette's WebSocket; each send takes ``delay`` seconds"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.received.append(text)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def test_fast_client_survives_burst_larger_than_queue():
+    async def scenario():
+        manager = ConnectionManager(queue_size=4)
+        fast = FakeWebSocket()
+        await manager.connect(fast)
+        await manager.subscribe(fast, "activity")
+
+        for i in range(50):
+            await manager.broadcast_to_topic("activity", {"type": "activity", "data": [i]})
+            await manager.broadcast({"type": "ping", "n": i})
+        await asyncio.sleep(0.01)
+        return manager, fast
+
+    manager, fast = asyncio.run(scenario())
+    assert fast.close_code is None
+    assert fast in manager.active_connections
+    assert len(fast.received) == 100
+    assert manager.stats['dropped'] == 0 and manager.stats['slow_disconnects'] == 0
+
+
+def test_replay_larger_than_queue_resyncs_instead_of_disconnecting():
+    async def scenario():
+        manager = ConnectionManager(queue_size=4, history_size=16)
+        for i in range(10):
+            await manager.broadcast_to_topic("server:1", {"type": "activity", "data": [i]})
+        await manager.broadcast_to_topic("server:2", {"type": "activity", "data": [0]})
+        client = FakeWebSocket(delay=1)  # never drains during the test
+        await manager.connect(client)
+        await manager.subscribe(client, "server:*")
+        replayed = await manager.replay(client, "server:*", {"server:1": 0, "server:2": 0}, manager.epoch)
+        queued = list(manager.active_connections[client].queue._queue)
+        manager.disconnect(client)
+        return manager, client, replayed, queued
+
+    manager, client, replayed, queued = asyncio.run(scenario())
+    assert client.close_code is None
+    assert replayed == 1
+    assert '"type":"resync","topic":"server:1"' in queued[0]
+    assert manager.stats['resyncs'] == 1 and manager.stats['slow_disconnects'] == 0
+
+
+def test_replay_stops_after_the_client_is_disconnected():
+    async def scenario():
+        manager = ConnectionManager(queue_size=1, slow_consumer_policy=DISCONNECT)
+        client = FakeWebSocket(delay=1)
+        await manager.connect(client)
+        await manager.send_personal_message({"type": "subscribed"}, client)
+        # Both topics need a resync; the first one overflows and disconnects
+        await manager.replay(client, "server:*", {"server:1": 5, "server:2": 5}, epoch="old")
+        await asyncio.sleep(0)
+        return manager, client
+
+    manager, client = asyncio.run(scenario())
+    assert client not in manager.active_connections
+    assert client.close_code == 1013
+    assert manager.stats['slow_disconnects'] == 1
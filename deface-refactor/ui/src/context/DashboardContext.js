@@ -30,15 +30,11 @@ export const DashboardProvider = ({ children }) => {
   useEffect(() => {
     websocketService.connect();
 
-    // Subscribe to real-time stats updates
-    const unsubscribeStats = websocketService.on('stats_update', (data) => {
+    // Subscribe to real-time stats updates: a full snapshot on subscribe,
+    // then only the fields that changed
+    const unsubscribeStats = websocketService.on('stats_update', (data, message) => {
       console.log('Received real-time stats:', data);
-      setStats({
-        totalServers: data.totalServers,
-        activeMonitors: data.activeMonitors,
-        alertsToday: data.alertsToday,
-        restoredFiles: data.restoredFiles,
-      });
+      setStats(prev => (message.full ? { ...data } : { ...prev, ...data }));
     });
 
     // Subscribe to activity updates
@@ -47,10 +43,32 @@ export const DashboardProvider = ({ children }) => {
       // Update activity data if needed
     });
 
+    // Live alerts pushed by the server in batches, newest last
+    const unsubscribeAlerts = websocketService.on('alerts', (alerts) => {
+      setRecentAlerts(prev => [...alerts.slice().reverse(), ...prev].slice(0, 3));
+    });
+
+    // Pushes were missed (gap no longer buffered, dropped frames or a server
+    // restart): reload what the topic feeds over REST
+    const unsubscribeResync = websocketService.on('resync', async ({ topic }) => {
+      try {
+        if (topic === 'stats') {
+          setStats(await api.getDashboardStats());
+        } else if (topic === 'alerts') {
+          const alertsData = await api.getAlerts();
+          setRecentAlerts(alertsData.slice(0, 3));
+        }
+      } catch (err) {
+        console.error(`Error resyncing ${topic}:`, err);
+      }
+    });
+
     // Cleanup on unmount
     return () => {
       unsubscribeStats();
       unsubscribeActivity();
+      unsubscribeAlerts();
+      unsubscribeResync();
       websocketService.disconnect();
     };
   }, []);
@@ -37,6 +37,21 @@ class ApiService {
     }
   }
 
+  // Users (admin)
+  updateUserRole(username, role) {
+    return this.request(`/auth/users/${encodeURIComponent(username)}/role`, {
+      method: 'PUT',
+      body: JSON.stringify({ role }),
+    });
+  }
+
+  setUserDisabled(username, disabled) {
+    return this.request(`/auth/users/${encodeURIComponent(username)}/status`, {
+      method: 'PUT',
+      body: JSON.stringify({ disabled }),
+    });
+  }
+
   // Dashboard
   getDashboardStats() {
     return this.request('/dashboard/stats');
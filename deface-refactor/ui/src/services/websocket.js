@@ -7,6 +7,13 @@ class WebSocketService {
     this.reconnectDelay = 3000;
     this.listeners = {};
     this.isConnecting = false;
+    // Topics to (re)subscribe on every connect; pages that show live activity
+    // subscribe to 'activity' or 'server:{id}' themselves
+    this.topics = new Set(['stats', 'alerts']);
+    // Last seq seen per topic and the server epoch they belong to, sent on
+    // resubscribe so the server replays only what was missed
+    this.lastSeq = {};
+    this.epoch = null;
   }
 
   connect(url = 'ws://localhost:8000/ws') {
@@ -31,10 +38,8 @@ class WebSocketService {
         this.isConnecting = false;
         this.reconnectAttempts = 0;
         
-        // Subscribe to all topics
-        this.subscribe('stats');
-        this.subscribe('activity');
-        this.subscribe('alerts');
+        // Resubscribe to every topic, asking for what was missed meanwhile
+        this.topics.forEach(topic => this.subscribe(topic));
         
         // Start keep-alive ping
         this.startKeepAlive();
@@ -44,11 +49,15 @@ class WebSocketService {
         try {
           const message = JSON.parse(event.data);
           console.log('WebSocket message received:', message);
+
+          if (!this.trackSequence(message)) {
+            return;
+          }
           
           // Notify listeners based on message type
           if (message.type && this.listeners[message.type]) {
             this.listeners[message.type].forEach(callback => {
-              callback(message.data || message);
+              callback(message.data || message, message);
             });
           }
         } catch (error) {
@@ -69,8 +78,10 @@ class WebSocketService {
         // Attempt reconnection
         if (this.reconnectAttempts < this.maxReconnectAttempts) {
           this.reconnectAttempts++;
-          console.log(`Reconnecting in ${this.reconnectDelay}ms (attempt ${this.reconnectAttempts})`);
-          setTimeout(() => this.connect(url), this.reconnectDelay);
+          // Jitter spreads the reconnects of many dashboards after a server restart
+          const delay = Math.round(this.reconnectDelay * (1 + Math.random()));
+          console.log(`Reconnecting in ${delay}ms (attempt ${this.reconnectAttempts})`);
+          setTimeout(() => this.connect(url), delay);
         } else {
           console.error('Max reconnection attempts reached');
         }
@@ -90,16 +101,62 @@ class WebSocketService {
   }
 
   subscribe(topic) {
+    this.topics.add(topic);
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-      this.ws.send(JSON.stringify({
-        type: 'subscribe',
-        topic: topic
-      }));
+      const request = { type: 'subscribe', topic: topic };
+      if (this.epoch) {
+        request.epoch = this.epoch;
+        if (topic.endsWith(':*')) {
+          // Wildcards are replayed per concrete topic
+          const prefix = topic.slice(0, -1);
+          request.since = Object.fromEntries(
+            Object.entries(this.lastSeq).filter(([name]) => name.startsWith(prefix))
+          );
+        } else if (this.lastSeq[topic] !== undefined) {
+          request.since = this.lastSeq[topic];
+        }
+      }
+      this.ws.send(JSON.stringify(request));
       console.log('Subscribed to topic:', topic);
     }
   }
 
+  // Returns false for messages already seen (replay overlap)
+  trackSequence(message) {
+    if (message.type === 'subscribed') {
+      if (this.epoch && this.epoch !== message.epoch) {
+        // Server restarted: old sequence numbers mean nothing any more
+        this.lastSeq = {};
+      }
+      this.epoch = message.epoch;
+      return true;
+    }
+    if (message.type === 'resync') {
+      // Gap no longer buffered on the server: listeners reload this topic over REST
+      this.lastSeq[message.topic] = message.seq;
+      return true;
+    }
+    if (message.topic === undefined || message.seq === undefined) {
+      return true;
+    }
+    const last = this.lastSeq[message.topic];
+    if (last !== undefined && message.seq <= last) {
+      return false;
+    }
+    if (last !== undefined && message.seq > last + 1) {
+      // Messages were dropped for this slow connection
+      this.emit('resync', { topic: message.topic, seq: message.seq });
+    }
+    this.lastSeq[message.topic] = message.seq;
+    return true;
+  }
+
+  emit(messageType, data) {
+    (this.listeners[messageType] || []).forEach(callback => callback(data));
+  }
+
   unsubscribe(topic) {
+    this.topics.delete(topic);
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify({
         type: 'unsubscribe',
@@ -0,0 +1,226 @@
+# watcher.py
+import os
+import shlex
+import threading
+import time
+import paramiko
+from rich.console import Console
+
+console = Console()
+
+# inotify events that can alter the protected tree
+INOTIFY_EVENTS = "modify,attrib,close_write,moved_to,moved_from,create,delete,delete_self,move_self"
+# What inotifywait prints on stderr once every watch is in place
+INOTIFY_READY_LINE = "Watches established."
+
+
+def build_watch_command(path, poll_interval=1):
+    """Shell command for the resident watcher started on the remote host.
+
+    Uses inotifywait when it is installed; otherwise falls back to a
+    resident loop that only reports entries whose ctime moved since the
+    previous pass. Either way every change is written as one
+    ``EVENT|path`` line on stdout, after ``MODE|mode``.
+
+    Readiness is only reported once nothing can be missed any more: in
+    inotify mode that is inotifywait's own "Watches established." line
+    (its stderr is merged into stdout for this), in poll mode the
+    ``READY|poll`` line printed after the first ctime marker exists.
+    """
+    qpath = shlex.quote(path)
+    return (
+        "if command -v inotifywait >/dev/null 2>&1; then "
+        "echo 'MODE|inotify'; "
+        f"exec inotifywait -m -r -e {INOTIFY_EVENTS} --format '%e|%w%f' {qpath} 2>&1; "
+        "else "
+        "echo 'MODE|poll'; "
+        "marker=$(mktemp); next=$(mktemp); "
+        "trap 'rm -f \"$marker\" \"$next\"' EXIT; "
+        "echo 'READY|poll'; "
+        "while :; do "
+        f"sleep {poll_interval}; touch \"$next\"; "
+        f"find {qpath} -cnewer \"$marker\" 2>/dev/null | sed 's/^/CHANGED|/'; "
+        "mv \"$next\" \"$marker\"; next=$(mktemp); "
+        "done; "
+        "fi"
+    )
+
+
+class RemoteChangeWatcher:
+    """Resident change watcher on the protected server.
+
+    One SSH exec channel runs the watcher for the lifetime of the monitor
+    and streams change lines back; each line is fanned out to every
+    subscribed consumer, so several restorers can share one watcher.
+    """
+
+    def __init__(self, ssh_config, path, reconnect_delay=2):
+        self.ssh_config = ssh_config
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.console = console
+        self.mode = None
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.ready_event = threading.Event()
+        self.restart_event = threading.Event()
+        self.ssh_client = None
+        self.channel = None
+        self.thread = None
+
+    def _connect(self):
+        self.ssh_client = paramiko.SSHClient()
+        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        connect_kwargs = {
+            'hostname': self.ssh_config['host'],
+            'port': int(self.ssh_config['port']),
+            'username': self.ssh_config['username']
+        }
+
+        if self.ssh_config.get('password'):
+            connect_kwargs['password'] = self.ssh_config['password']
+        if self.ssh_config.get('key_path'):
+            connect_kwargs['key_filename'] = os.path.expanduser(self.ssh_config['key_path'])
+
+        self.ssh_client.connect(**connect_kwargs)
+
+    def subscribe(self, callback):
+        """Register a consumer; it is called with one dict per change"""
+        with self.lock:
+            if callback not in self.subscribers:
+                self.subscribers.append(callback)
+        self.start()
+        return callback
+
+    def unsubscribe(self, callback):
+        """Remove a consumer; the watcher stops when the last one leaves"""
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+            remaining = len(self.subscribers)
+        if remaining == 0:
+            self.stop()
+
+    def _dispatch(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                self.console.print(f"[red]Watcher consumer error: {str(e)}[/red]")
+
+    def _run_channel(self):
+        """Start the remote watcher and read its output until the channel closes"""
+        self._connect()
+        # A pty makes the remote watcher die with the channel instead of lingering
+        stdin, stdout, stderr = self.ssh_client.exec_command(
+            build_watch_command(self.path), get_pty=True
+        )
+        self.channel = stdout.channel
+
+        for line in iter(stdout.readline, ''):
+            if self.stop_event.is_set():
+                break
+            line = line.strip()
+            if line == INOTIFY_READY_LINE:
+                self._set_ready()
+                continue
+            if not line or '|' not in line:
+                continue
+
+            event, changed_path = line.split('|', 1)
+            if event == 'MODE':
+                self.mode = changed_path
+                continue
+            if event == 'READY':
+                self._set_ready()
+                continue
+
+            self._dispatch({
+                'timestamp': time.time(),
+                'event': event,
+                'path': changed_path
+            })
+
+    def _set_ready(self):
+        self.ready_event.set()
+        self.console.print(f"[blue]Remote watcher running on {self.ssh_config['host']}:{self.path} ({self.mode})[/blue]")
+
+    def _reader(self):
+        while not self.stop_event.is_set():
+            try:
+                self._run_channel()
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    self.console.print(f"[red]Remote watcher error: {str(e)}[/red]")
+            finally:
+                self._close_connection()
+
+            if self.restart_event.is_set():
+                self.restart_event.clear()
+                self.ready_event.clear()
+            elif not self.stop_event.is_set():
+                self.ready_event.clear()
+                self.console.print("[yellow]Remote watcher channel closed, reconnecting...[/yellow]")
+                time.sleep(self.reconnect_delay)
+
+    def start(self):
+        """Start the reader thread if it is not already running"""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+
+    def restart(self):
+        """Restart the remote watcher, e.g. after the watched tree was replaced.
+
+        inotify watches follow inodes, so once the live directory is renamed
+        away they keep reporting on the old tree until re-established.
+        """
+        self.restart_event.set()
+        self._close_connection()
+
+    def wait_ready(self, timeout=10):
+        """Block until the remote watcher reports it is running"""
+        return self.ready_event.wait(timeout)
+
+    def _close_connection(self):
+        if self.channel:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
+            self.channel = None
+        if self.ssh_client:
+            try:
+                self.ssh_client.close()
+            except Exception:
+                pass
+            self.ssh_client = None
+
+    def stop(self):
+        self.stop_event.set()
+        self._close_connection()
+        with _watchers_lock:
+            for key, watcher in list(_watchers.items()):
+                if watcher is self:
+                    del _watchers[key]
+
+
+# One resident watcher per (user, host, port, path)
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def get_remote_watcher(ssh_config, path) -> RemoteChangeWatcher:
+    """Get the shared watcher for a monitored path"""
+    key = (ssh_config['username'], ssh_config['host'], int(ssh_config['port']), path.rstrip('/'))
+    with _watchers_lock:
+        if key not in _watchers:
+            _watchers[key] = RemoteChangeWatcher(ssh_config, path)
+        return _watchers[key]
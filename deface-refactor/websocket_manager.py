@@ -3,91 +3,315 @@
 WebSocket manager for real-time updates
 """
 
-from typing import List, Dict, Any
+from collections import deque
+from typing import Deque, Dict, Any, Optional, Set, Tuple, Union
 from fastapi import WebSocket, WebSocketDisconnect
 import json
 import asyncio
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
+# Outbound messages buffered per connection before the slow-consumer policy applies
+DEFAULT_QUEUE_SIZE = 256
+# Seconds a single send may take before the connection is considered dead
+DEFAULT_SEND_TIMEOUT = 5.0
+# Recent messages kept per topic for replay to reconnecting clients
+DEFAULT_HISTORY_SIZE = 128
+# Enqueues between yields to the event loop during a fan-out, so sender tasks
+# keep draining while a burst is broadcast
+FAN_OUT_YIELD_EVERY = 256
+# Loop turns a fan-out waits for a full queue whose sender is making progress
+# before the slow-consumer policy applies to it
+FULL_QUEUE_TURNS = 8
+
+# Topic suffix matching every topic with the same prefix, e.g. "server:*"
+WILDCARD = "*"
+
+# Slow-consumer policies
+DROP_OLDEST = "drop_oldest"   # discard the oldest queued message, disconnect after a full queue's worth
+DISCONNECT = "disconnect"     # close the connection as soon as its queue is full
+
+
+def topic_patterns(topic: str):
+    """The topic itself plus every wildcard that matches it ("a:b:c" -> "a:*", "a:b:*")"""
+    yield topic
+    parts = topic.split(":")
+    for i in range(1, len(parts)):
+        yield ":".join(parts[:i]) + ":" + WILDCARD
+
+
+def encode_message(message: Dict[str, Any]) -> str:
+    """Serialize a message once for every recipient (same format as send_json)"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class ClientConnection:
+    """One WebSocket with its bounded outbound queue and sender task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: asyncio.Task = None
+        self.topics: Set[str] = set()
+        self.sent = 0
+        self.dropped = 0
+        # Messages dropped since the last successful send
+        self.dropped_since_send = 0
+        # ``sent`` when a fan-out last found the queue full
+        self.sent_when_full = -1
+
 
 class ConnectionManager:
-    """Manages WebSocket connections for real-time updates"""
-    
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.subscribers: Dict[str, List[WebSocket]] = {}
-    
+    """Manages WebSocket connections for real-time updates.
+
+    Broadcasting only enqueues: every connection has its own bounded queue
+    drained by its own sender task, so a slow or dead client never delays
+    the others. A message is serialized once per broadcast, not per client.
+    Each broadcast yields to the event loop (and every FAN_OUT_YIELD_EVERY
+    enqueues within one), and a full queue whose sender has sent something
+    since it was last found full gets a few loop turns to drain, so a burst
+    of broadcasts only trips the policy for clients that are really slow.
+
+    Subscriptions are indexed both ways (topic -> connections in
+    ``subscribers``, connection -> topics on the ClientConnection), so
+    subscribe, unsubscribe and disconnect are O(1) per topic and a topic
+    broadcast only touches its subscribers. Wildcard topics such as
+    ``server:*`` are ordinary keys of the index, looked up per broadcast.
+
+    Topic messages carry ``topic`` and a per-topic ``seq``, and the last
+    ``history_size`` of them are kept per topic. A client that resubscribes
+    with ``since`` (and the ``epoch`` it was given) gets only the messages
+    it missed, or a ``resync`` message when the gap is no longer buffered
+    or the server restarted since (new epoch).
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE, send_timeout: float = DEFAULT_SEND_TIMEOUT,
+                 slow_consumer_policy: str = DROP_OLDEST, history_size: int = DEFAULT_HISTORY_SIZE):
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[WebSocket]] = {}
+        # Identifies this process' sequence space; changes on every restart
+        self.epoch = uuid.uuid4().hex[:12]
+        self.sequences: Dict[str, int] = {}
+        self.history: Dict[str, Deque[Tuple[int, str]]] = {}
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.stats = {
+            'dropped': 0,
+            'slow_disconnects': 0,
+            'send_failures': 0,
+            'replayed': 0,
+            'resyncs': 0
+        }
+
     async def connect(self, websocket: WebSocket, client_id: str = None):
         """Accept and register a new WebSocket connection"""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, self.queue_size)
+        client.task = asyncio.create_task(self._sender(client))
+        self.active_connections[websocket] = client
         logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
-    
+
     def disconnect(self, websocket: WebSocket):
         """Remove a WebSocket connection"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client:
+            if client.task and client.task is not asyncio.current_task():
+                client.task.cancel()
+            for topic in client.topics:
+                self._remove_subscriber(topic, websocket)
             logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
-        
-        # Remove from all subscriptions
-        for topic in self.subscribers:
-            if websocket in self.subscribers[topic]:
-                self.subscribers[topic].remove(websocket)
-    
-    async def subscribe(self, websocket: WebSocket, topic: str):
-        """Subscribe a WebSocket to a specific topic"""
-        if topic not in self.subscribers:
-            self.subscribers[topic] = []
-        if websocket not in self.subscribers[topic]:
-            self.subscribers[topic].append(websocket)
-            logger.info(f"WebSocket subscribed to topic: {topic}")
-    
+
+    def _remove_subscriber(self, topic: str, websocket: WebSocket):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    async def _sender(self, client: ClientConnection):
+        """Drain one connection's queue; a failed or timed-out send drops the connection"""
+        websocket = client.websocket
+        try:
+            while True:
+                text = await client.queue.get()
+                await asyncio.wait_for(websocket.send_text(text), self.send_timeout)
+                client.sent += 1
+                client.dropped_since_send = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats['send_failures'] += 1
+            logger.error(f"Error sending to connection: {e!r}")
+            self.disconnect(websocket)
+            await self._close(websocket)
+
+    async def _close(self, websocket: WebSocket, code: int = 1011):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def _enqueue(self, client: ClientConnection, text: str):
+        """Queue a message without waiting, applying the slow-consumer policy when full"""
+        try:
+            client.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.slow_consumer_policy == DROP_OLDEST and client.dropped_since_send < self.queue_size:
+            client.queue.get_nowait()
+            client.queue.put_nowait(text)
+            client.dropped += 1
+            client.dropped_since_send += 1
+            self.stats['dropped'] += 1
+            return
+
+        # Too far behind to catch up: close with 1013 (try again later); the
+        # client reconnects and resyncs over REST
+        self.stats['slow_disconnects'] += 1
+        logger.warning(f"Disconnecting slow WebSocket consumer ({client.dropped} messages dropped)")
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket, code=1013))
+
+    async def subscribe(self, websocket: WebSocket, topic: str) -> Dict[str, Any]:
+        """Subscribe a WebSocket to a topic or a wildcard such as server:*
+
+        Returns the acknowledgement to send, with the topic's current seq
+        and the epoch to present when resubscribing.
+        """
+        client = self.active_connections.get(websocket)
+        if client and topic not in client.topics:
+            client.topics.add(topic)
+            self.subscribers.setdefault(topic, set()).add(websocket)
+            logger.debug(f"WebSocket subscribed to topic: {topic}")
+        return {"type": "subscribed", "topic": topic, "seq": self.sequences.get(topic, 0), "epoch": self.epoch}
+
+    async def replay(self, websocket: WebSocket, topic: str, since: Union[int, Dict[str, int], None],
+                     epoch: Optional[str] = None) -> int:
+        """Queue the messages of ``topic`` newer than ``since`` for a client.
+
+        ``since`` is the last seq the client saw, or for a wildcard a
+        ``{topic: seq}`` map of the topics it has seen. Topics whose gap is
+        not (or no longer) in the buffer get a ``resync`` message instead,
+        telling the client to reload them over REST. Returns the number of
+        messages replayed.
+        """
+        client = self.active_connections.get(websocket)
+        if client is None or since is None:
+            return 0
+
+        if isinstance(since, dict):
+            seen = {name: seq for name, seq in since.items() if topic in topic_patterns(name)}
+        else:
+            seen = {topic: since}
+
+        replayed = 0
+        for name, last_seq in seen.items():
+            if self.active_connections.get(websocket) is not client:
+                # Disconnected by the slow-consumer policy meanwhile
+                break
+            history = self.history.get(name, ())
+            current = self.sequences.get(name, 0)
+            try:
+                last_seq = int(last_seq)
+            except (TypeError, ValueError):
+                last_seq = -1
+            oldest = history[0][0] if history else current + 1
+            missed = [text for seq, text in history if seq > last_seq]
+            free = client.queue.maxsize - client.queue.qsize()
+            # A gap bigger than the free queue space would overflow it right at
+            # resubscribe; the client reloads the topic over REST instead
+            if (epoch != self.epoch or last_seq < 0 or last_seq > current or oldest > last_seq + 1
+                    or len(missed) > free):
+                self.stats['resyncs'] += 1
+                self._enqueue(client, encode_message(
+                    {"type": "resync", "topic": name, "seq": current, "epoch": self.epoch}
+                ))
+                continue
+            for text in missed:
+                self._enqueue(client, text)
+            replayed += len(missed)
+        self.stats['replayed'] += replayed
+        return replayed
+
     async def unsubscribe(self, websocket: WebSocket, topic: str):
         """Unsubscribe a WebSocket from a specific topic"""
-        if topic in self.subscribers and websocket in self.subscribers[topic]:
-            self.subscribers[topic].remove(websocket)
-            logger.info(f"WebSocket unsubscribed from topic: {topic}")
-    
+        client = self.active_connections.get(websocket)
+        if client and topic in client.topics:
+            client.topics.discard(topic)
+            self._remove_subscriber(topic, websocket)
+            logger.debug(f"WebSocket unsubscribed from topic: {topic}")
+
+    def topic_subscribers(self, topic: str) -> Set[WebSocket]:
+        """Connections subscribed to ``topic`` directly or through a wildcard"""
+        matched = [self.subscribers[p] for p in topic_patterns(topic) if p in self.subscribers]
+        if len(matched) == 1:
+            return matched[0]
+        return set().union(*matched)
+
+    async def _fan_out(self, websockets, text: str):
+        """Queue ``text`` for each connection, yielding to the loop as it goes"""
+        for count, websocket in enumerate(list(websockets), 1):
+            client = self.active_connections.get(websocket)
+            if client is None:
+                continue
+            if client.queue.full() and client.sent != client.sent_when_full:
+                client.sent_when_full = client.sent
+                for _ in range(FULL_QUEUE_TURNS):
+                    await asyncio.sleep(0)
+                    if not client.queue.full():
+                        break
+                if self.active_connections.get(websocket) is not client:
+                    continue
+            self._enqueue(client, text)
+            if count % FAN_OUT_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        # Let the senders pick this message up before the next broadcast
+        await asyncio.sleep(0)
+
     async def broadcast(self, message: Dict[str, Any]):
         """Broadcast a message to all connected clients"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to connection: {e}")
-                disconnected.append(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
-    
+        await self._fan_out(self.active_connections, encode_message(message))
+
     async def broadcast_to_topic(self, topic: str, message: Dict[str, Any]):
-        """Broadcast a message to all subscribers of a specific topic"""
-        if topic not in self.subscribers:
+        """Broadcast a message to all subscribers of a specific topic.
+
+        The message is stamped with the topic and its next seq and kept in
+        the topic's history even when nobody is subscribed right now.
+        """
+        seq = self.sequences.get(topic, 0) + 1
+        self.sequences[topic] = seq
+        text = encode_message(dict(message, topic=topic, seq=seq))
+        history = self.history.get(topic)
+        if history is None:
+            history = self.history[topic] = deque(maxlen=self.history_size)
+        history.append((seq, text))
+
+        subscribers = self.topic_subscribers(topic)
+        if not subscribers:
             return
-        
-        disconnected = []
-        for connection in self.subscribers[topic]:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to topic {topic}: {e}")
-                disconnected.append(connection)
-        
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
-    
+        await self._fan_out(subscribers, text)
+
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
-        """Send a message to a specific client"""
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            logger.error(f"Error sending personal message: {e}")
-            self.disconnect(websocket)
+        """Send a message to a specific client (queued behind its pending broadcasts)"""
+        client = self.active_connections.get(websocket)
+        if client:
+            self._enqueue(client, encode_message(message))
+
+    def metrics(self) -> Dict[str, Any]:
+        clients = list(self.active_connections.values())
+        return dict(
+            self.stats,
+            connections=len(clients),
+            topics=len(self.subscribers),
+            queued=sum(client.queue.qsize() for client in clients),
+            max_queued=max((client.queue.qsize() for client in clients), default=0)
+        )
 
 
 # Singleton instance